@@ -1,19 +1,50 @@
 import uuid
-import csv
-import os
+import atexit
+import signal
+import sys
 from datetime import datetime
+import perf
+import queries
+import storage
+import writer
+from transaction_store import TransactionStore, parse_day
 
 FILENAME = "expenses.csv"
+FIELDNAMES = storage.CLI_SCHEMA.fields
+
+# Storage backend picked by the EXPENSE_BACKEND environment variable (csv, sqlite or partitioned)
+STORE = storage.open_store(FILENAME, storage.CLI_SCHEMA)
+
+# Adds and modifies made from the menu are written by a background thread (see writer.py);
+# main() starts it, and anything else that records transactions writes to STORE directly
+WRITER = None
 
 # Transaction class to represent a basic expense entry
 class Transaction:
+    # __slots__ keeps each object small (no per-instance __dict__)
+    __slots__ = ("_uuid", "name", "amount", "date", "category")
+
     # Initializes a new transaction with basic details
     def __init__(self, name, amount, date, category):
-        self.transaction_id = str(uuid.uuid4())  # Generate a unique ID
+        self._uuid = uuid.uuid4().bytes  # Generate a unique ID (kept as 16 raw bytes)
         self.name = name
         self.amount = float(amount)
         self.date = date
-        self.category = category
+        self.category = sys.intern(category)
+
+    # The ID as the usual 36-character UUID string
+    @property
+    def transaction_id(self):
+        if isinstance(self._uuid, bytes):
+            return str(uuid.UUID(bytes=self._uuid))
+        return self._uuid
+
+    @transaction_id.setter
+    def transaction_id(self, value):
+        try:
+            self._uuid = uuid.UUID(str(value)).bytes
+        except ValueError:
+            self._uuid = str(value)  # Keep IDs that aren't UUIDs as they are
 
     # Modifies transaction details if new values are provided
     def modify(self, name=None, amount=None, date=None, category=None):
@@ -24,7 +55,7 @@ class Transaction:
         if date:
             self.date = date
         if category:
-            self.category = category
+            self.category = sys.intern(category)
 
     # Returns a dictionary representation of the transaction
     def to_dict(self):
@@ -34,7 +65,7 @@ class Transaction:
             "amount": self.amount,
             "date": self.date,
             "category": self.category,
-            "type": "Transaction"
+            "type": type(self).__name__  # Lets the loader rebuild the right subclass
         }
 
     # Displays transaction details to the console
@@ -49,6 +80,8 @@ class Transaction:
 # The Classes for different categories are defined here
 
 class MealsTransaction(Transaction):
+    __slots__ = ("mealType",)
+
     def __init__(self, name, category, date, amount, mealType):
         super().__init__(name, amount, date, category)
         self.mealType = mealType
@@ -72,6 +105,8 @@ class MealsTransaction(Transaction):
 
 
 class GroceryTransaction(Transaction):
+    __slots__ = ("storeName", "itemCategory")
+
     def __init__(self, name, category, date, amount, storeName, itemCategory):
         super().__init__(name, amount, date, category)
         self.storeName = storeName
@@ -100,6 +135,8 @@ class GroceryTransaction(Transaction):
         print(f"Item Category: {self.itemCategory}")
 
 class ClothingTransaction(Transaction):
+    __slots__ = ("clothingType", "occasion")
+
     def __init__(self, name, category, date, amount, clothingType, occasion):
         super().__init__(name, amount, date, category)
         self.clothingType = clothingType
@@ -127,48 +164,147 @@ class ClothingTransaction(Transaction):
         print(f"Clothing Type: {self.clothingType}")
         print(f"occasion: {self.occasion}")
 
-# Load transactions from CSV file
-def load_transactions():
-    transactions = []
-    if os.path.exists(FILENAME):
-        with open(FILENAME, mode='r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                t = Transaction(
-                    name=row["name"],
-                    amount=float(row["amount"]),
-                    date=row["date"],
-                    category=row["category"]
-                )
-                t.transaction_id = row["transaction_id"]  # Preserve the ID
-                transactions.append(t)
-    return transactions
+# Maps the "type" column to the class that reads the row back
+TRANSACTION_TYPES = {
+    "Transaction": Transaction,
+    "MealsTransaction": MealsTransaction,
+    "GroceryTransaction": GroceryTransaction,
+    "ClothingTransaction": ClothingTransaction,
+}
+
+# Extra columns each subclass fills in, used for rows saved before the type was recorded
+SUBCLASS_COLUMNS = {
+    MealsTransaction: ("Meal Type",),
+    GroceryTransaction: ("Store Name", "Item Category"),
+    ClothingTransaction: ("Clothing Type", "occasion"),
+}
+
+
+# Pick the class for a stored row from its "type" column
+def transaction_class(row):
+    cls = TRANSACTION_TYPES.get(row.get("type") or "Transaction", Transaction)
+    if cls is Transaction:
+        # Older files wrote "Transaction" for every row; fall back to whichever extra columns are set
+        for subclass, columns in SUBCLASS_COLUMNS.items():
+            if any(row.get(column) for column in columns):
+                return subclass
+    return cls
+
+
+# Build a Transaction (or subclass) from one stored row
+def transaction_from_row(row):
+    cls = transaction_class(row)
+    name, amount, date, category = row["name"], float(row["amount"]), row["date"], row["category"]
+    if cls is MealsTransaction:
+        t = MealsTransaction(name, category, date, amount, row.get("Meal Type") or "")
+    elif cls is GroceryTransaction:
+        t = GroceryTransaction(name, category, date, amount,
+                               row.get("Store Name") or "", row.get("Item Category") or "")
+    elif cls is ClothingTransaction:
+        t = ClothingTransaction(name, category, date, amount,
+                                row.get("Clothing Type") or "", row.get("occasion") or "")
+    else:
+        t = Transaction(name, amount, date, category)
+    t.transaction_id = row["transaction_id"]  # Preserve the ID
+    return t
 
 
-# Save all transactions to CSV file (overwrite)
+# Stream transactions from the storage backend one row at a time
+# (the date range and category are filtered by the store; keep is an optional extra test)
+@perf.timed
+def load_transactions(start=None, end=None, category=None, keep=None):
+    for row in STORE.iter_rows(start, end, category):
+        t = transaction_from_row(row)
+        if keep is None or keep(t):
+            yield t
 
+
+# Save all transactions to the storage backend (overwrite)
+
+@perf.timed
 def save_transactions(transactions):
-    with open(FILENAME, mode='w', newline='') as file:
-        fieldnames = [
-            "transaction_id", "name", "amount", "date", "category", "type",
-            "Meal Type",
-            "Store Name", "Item Category",
-            "Clothing Type", "occasion"
-        ]
-        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writeheader()
-        for t in transactions:
-            writer.writerow(t.to_dict())
+    STORE.replace_all(t.to_dict() for t in transactions)
+
+
+# Record a single added or modified transaction without rewriting the file
+# (pass the transaction's old to_dict() on update so the statistics rollups stay exact)
+@perf.timed
+def append_transaction(t, op="insert", old=None):
+    target = STORE if WRITER is None else WRITER
+    if op == "update":
+        target.update(t.to_dict(), old=old)
+    else:
+        target.insert(t.to_dict())
+
+
+# Wait until the background writer has saved everything queued so far
+# (durable also syncs it to disk); returns False if a write failed
+def waitForWrites(durable=False):
+    if WRITER is None:
+        return True
+    try:
+        if durable:
+            WRITER.flush()
+        else:
+            WRITER.wait()
+    except Exception as e:
+        print(f"Error saving transactions: {e}")
+        return False
+    return True
+
+
+# Exit normally on SIGTERM or SIGHUP, so the changes still queued are saved first
+def exitOnSignal(signum, frame):
+    sys.exit(128 + signum)
+
+# Ask for a number, falling back to the default on empty or invalid input
+def ask_number(prompt, default, kind):
+    answer = input(prompt).strip()
+    try:
+        return kind(answer) if answer else default
+    except ValueError:
+        print(f"Invalid number, using {default}.")
+        return default
+
+
+# Ask for an optional category and date range (Enter skips each one)
+def ask_scope():
+    print("Available categories:", ", ".join(cat for cat, total, count, low, high in STORE.totals_by("category")))
+    category = input("Category (press enter for all): ").strip() or None
+    start = input("Start date YYYY-MM-DD (press enter for no limit): ").strip() or None
+    end = input("End date YYYY-MM-DD (press enter for no limit): ").strip() or None
+    for value in (start, end):
+        if value is not None and parse_day(value) is None:
+            print(f"Invalid date '{value}', ignoring the date range.")
+            return category, None, None
+    return category, start, end
+
+# First and last transaction dates, from the per-day totals the backend keeps
+def storeDateRange():
+    days = [day for day, total, count, low, high in STORE.totals_by("day") if parse_day(day) is not None]
+    return (days[0], days[-1]) if days else None
+
+
+# Pick the transactions a query runs on: the loaded history, or, while it isn't loaded and the
+# query has a date range, just the rows in that range (the backend skips the other months)
+def queryScope(transactions, start=None, end=None):
+    if transactions is None and (start is not None or end is not None):
+        return transactions, TransactionStore(load_transactions(start, end))
+    transactions = loadHistory(transactions)
+    return transactions, transactions
+
 #Function for viewing and filtering transactions defined here
+#(returns the history, which is loaded here the first time a filter needs all of it)
 
 def viewAndFilterTransactions(transactions):
-    if not transactions:
+    if not STORE.summary()["count"]:
         print("No transactions available to show.")
         print("*" * 40)
-        return
-    filter_choice = input("By category, date, amount, or all: ").strip().lower()
+        return transactions
+    filter_choice = input("By category, date, amount, search, query, or all: ").strip().lower()
 
     if filter_choice == "all":
+        transactions = loadHistory(transactions)
         print("\nAll Transactions:")
         for t in transactions:
             print("-" * 40)
@@ -176,79 +312,131 @@ def viewAndFilterTransactions(transactions):
         input("\nPress Enter to return to the main menu...\n")
 
     elif filter_choice == "category":
-        available_categories = sorted(set(t.category for t in transactions))
+        transactions = loadHistory(transactions)
+        available_categories = transactions.values("category")
         print("Available categories:", ", ".join(available_categories))
         filter_category = input("Enter Category: ").strip()
         print(f"\nTransactions in category '{filter_category}':")
-        for t in transactions:
-            if t.category.lower() == filter_category.lower():
-                print("-" * 40)
-                t.display()
+        for t in transactions.where("category", filter_category):
+            print("-" * 40)
+            t.display()
         input("\nPress Enter to return to the main menu...\n")
 
     elif filter_choice == "date":
-        dates = sorted(set(t.date for t in transactions))
-        if dates:
-            print(f"Available transaction dates: {dates[0]} to {dates[-1]}")
+        date_range = storeDateRange()
+        if date_range:
+            print(f"Available transaction dates: {date_range[0]} to {date_range[1]}")
         else:
             print("No transaction to analyze.")
-            return
+            return transactions
         print("How would you like to view the transactions?")
         filter_date = input("Enter Date (YYYY-MM-DD): ").strip()
         print(f"\nTransactions on date '{filter_date}':")
-        for t in transactions:
-            if t.date == filter_date:
-                print("-" * 40)
-                t.display()
+        if transactions is not None:
+            # Binary search in the store's date index
+            matches = transactions.on_date(filter_date)
+        elif parse_day(filter_date) is not None:
+            # Read just that day from the backend
+            matches = load_transactions(filter_date, filter_date)
+        else:
+            matches = []
+        for t in matches:
+            print("-" * 40)
+            t.display()
         input("\nPress Enter to return to the main menu...\n")
 
     elif filter_choice == "amount":
-        amounts = sorted(set(round(t.amount, 2) for t in transactions))
-        
         print("\nChoose how you want to filter amounts:")
-        print("1. View top 10 highest amounts")
-        print("2. View bottom 10 lowest amounts")
-        print("3. View amounts above $1000")
-        print("4. View amounts below $1000")
+        print("1. View the highest amounts")
+        print("2. View the lowest amounts")
+        print("3. View amounts above a threshold")
+        print("4. View amounts below a threshold")
 
         sub_choice = input("Enter choice (1–4): ").strip()
 
-        if sub_choice == "1":
-            print("\nTop 10 Highest Amounts:")
-            for amt in sorted(amounts, reverse=True)[:10]:
-                print(f"  ${amt:.2f}")
-
-        elif sub_choice == "2":
-            print("\nBottom 10 Lowest Amounts:")
-            for amt in amounts[:10]:
-                print(f"  ${amt:.2f}")
-
-        elif sub_choice == "3":
-            print("\nTransactions with amount > $1000:")
-            for t in transactions:
-                if t.amount > 1000:
-                    print("-" * 40)
-                    t.display()
-
-        elif sub_choice == "4":
-            print("\nTransactions with amount < $1000:")
-            for t in transactions:
-                if t.amount < 1000:
-                    print("-" * 40)
-                    t.display()
+        if sub_choice in ("1", "2"):
+            k = ask_number("How many transactions? [10]: ", 10, int)
+            category, start, end = ask_scope()
+            transactions, scope = queryScope(transactions, start, end)
+            largest = sub_choice == "1"
+            print(f"\n{'Top' if largest else 'Bottom'} {k} {'Highest' if largest else 'Lowest'} Amounts:")
+            for t in scope.top_k(k, largest=largest, category=category, start=start, end=end):
+                print("-" * 40)
+                t.display()
+
+        elif sub_choice in ("3", "4"):
+            threshold = ask_number("Threshold amount [1000]: ", 1000.0, float)
+            category, start, end = ask_scope()
+            transactions, scope = queryScope(transactions, start, end)
+            if sub_choice == "3":
+                print(f"\nTransactions with amount > ${threshold:.2f}:")
+                matches = scope.above(threshold, category=category, start=start, end=end)
+            else:
+                print(f"\nTransactions with amount < ${threshold:.2f}:")
+                matches = scope.below(threshold, category=category, start=start, end=end)
+            for t in matches:
+                print("-" * 40)
+                t.display()
         
         else:
             print("Invalid choice.")
         
         input("\nPress Enter to return to the main menu...\n")
 
+    elif filter_choice == "search":
+        query = input("Search names and stores for: ").strip()
+        if not query:
+            print("Please enter something to search for.")
+            return transactions
+        # Answered from the store's trigram index, so the history never has to be loaded
+        matches = transactionsById(STORE.search(query))
+        if matches:
+            print(f"\nTransactions matching '{query}':")
+        else:
+            matches = transactionsById(STORE.search(query, fuzzy=True))
+            print(f"\nNo transactions match '{query}'." + (" Closest matches:" if matches else ""))
+        for t in matches:
+            print("-" * 40)
+            t.display()
+        input("\nPress Enter to return to the main menu...\n")
+
+    elif filter_choice == "query":
+        print("Combine conditions with 'and', e.g. category=food and date>=2024-01-01 and amount>50")
+        print("then optionally 'sort <field> [asc|desc]' and 'limit <n>'. Use ~ for 'contains'.")
+        text = input("Query: ").strip()
+        try:
+            # Planned against the backend's indexes and evaluated as column masks (see queries.py)
+            matches = queries.to_records(queries.run(queries.parse(text, storage.CLI_SCHEMA), STORE),
+                                         storage.CLI_SCHEMA)
+        except queries.QueryError as error:
+            print(f"Invalid query: {error}")
+            return transactions
+        except ValueError as error:
+            # A row the data file can't be read back from, e.g. a hand-edited amount that isn't a number
+            print(f"Could not run the query, the data file has a value that can't be read: {error}")
+            return transactions
+        print(f"\n{len(matches)} matching transaction{'s' if len(matches) != 1 else ''}:")
+        for row in matches:
+            print("-" * 40)
+            transaction_from_row(row).display()
+        input("\nPress Enter to return to the main menu...\n")
+
     else:
-        print("Please enter a valid choice (category, date, amount, or all).")
+        print("Please enter a valid choice (category, date, amount, search, query, or all).")
+    return transactions
+
+# Read the transactions with the given IDs: a lookup each for a few, one pass over the store for many
+def transactionsById(keys):
+    if len(keys) <= 100:
+        return [transaction_from_row(row) for row in map(STORE.get, keys) if row is not None]
+    wanted = set(keys)
+    return list(load_transactions(keep=lambda t: t.transaction_id in wanted))
 
 
 # Show Statistics
-def show_statistics(transactions):
-    if not transactions:
+# (every figure comes from the storage backend, so the history never has to be loaded)
+def show_statistics():
+    if not STORE.summary()["count"]:
         print("No transactions available to show.")
         print("*" * 40)
         return
@@ -260,83 +448,137 @@ def show_statistics(transactions):
         print("2. Total amount in a date range")
         print("3. Average daily expense")
         print("4. Average monthly expense")
-        print("5. Back to the main menu")
+        print("5. Typical transaction sizes and vendors")
+        print("6. Back to the main menu")
         print("=" * 40)
 
-        choice = input("Select an option (1-5): ").strip()
+        choice = input("Select an option (1-6): ").strip()
 
+        # Totals are computed by the storage backend
         if choice == "1":
-            totals = {}
-            for t in transactions:
-                if t.category in totals:
-                    totals[t.category] += t.amount
-                else:
-                    totals[t.category] = t.amount
             print("\nTotal by Category:")
-            for cat in totals:
-                print(f"{cat}: ${totals[cat]:.2f}")
+            category_totals = STORE.totals_by("category")
+            for cat, total, count, low, high in category_totals:
+                print(f"{cat}: ${total:.2f}")
+            if category_totals:
+                print(f"Top category: {max(category_totals, key=lambda bucket: bucket[1])[0]}")
             input("\nPress Enter to return to the statistics menu...\n")
 
         elif choice == "2":
-            dates = sorted(set(t.date for t in transactions))
-            if dates:
-                print(f"Available transaction dates: {dates[0]} to {dates[-1]}")
+            date_range = storeDateRange()
+            if date_range:
+                print(f"Available transaction dates: {date_range[0]} to {date_range[1]}")
             else:
                 print("No transaction to analyze.")
                 return
 
             start = input("Enter start date (YYYY-MM-DD): ").strip()
-            end = input("Enter end date (YYY-MM-DD): ").strip()
+            end = input("Enter end date (YYYY-MM-DD): ").strip()
             try:
-                start_date = datetime.strptime(start, "%Y-%m-%d")
-                end_date = datetime.strptime(end, "%Y-%m-%d")
-                total = 0
-                for t in transactions:
-                    transaction_date = datetime.strptime(t.date, "%Y-%m-%d")
-                    if start_date <= transaction_date <= end_date:
-                        total += t.amount
-                    print(f"Total from {start} to {end}: ${total:.2f}")
+                start_date = datetime.strptime(start, "%Y-%m-%d").date()
+                end_date = datetime.strptime(end, "%Y-%m-%d").date()
+                # Two binary searches over running totals of the daily rollups
+                total = STORE.total_between(start_date, end_date)
+                print(f"Total from {start} to {end}: ${total:.2f}")
             except ValueError:
                 print("Invalid date format.")
             input("\nPress Enter to return to the statistics menu...\n")
 
         elif choice == "3":
-            daily_totals = {}
-            for t in transactions:
-                if t.date in daily_totals:
-                    daily_totals[t.date] += t.amount
-                else:
-                    daily_totals[t.date] = t.amount
+            daily_totals = [total for day, total, count, low, high in STORE.totals_by("day")]
             if daily_totals:
-                average = sum(daily_totals.values()) / len(daily_totals)
+                average = sum(daily_totals) / len(daily_totals)
                 print(f"Average daily expense: ${average:.2f}")
             else:
                 print("No Transactions found.")
             input("\nPress Enter to return to the statistics menu...\n")
 
         elif choice == "4":
-            monthly_totals = {}
-            for t in transactions:
-                month = t.date[:7] #Get YYYY-MM
-                if month in monthly_totals:
-                    monthly_totals[month] += t.amount
-                else:
-                    monthly_totals[month] = t.amount
+            monthly_totals = [total for month, total, count, low, high in STORE.totals_by("month")]
             if monthly_totals:
-                average = sum(monthly_totals.values()) / len(monthly_totals)
+                average = sum(monthly_totals) / len(monthly_totals)
                 print(f"Average monthly expense: ${average:.2f}")
             else:
                 print("No Transaction Found")
             input("\nPress Enter to return to the statistics menu...\n")
 
+        # Read from the per-category and per-month sketches, within 1% (vendor counts within a few percent)
         elif choice == "5":
+            overall = STORE.distribution()
+            median, p90, p99 = overall["quantiles"]
+            print(f"\nAll transactions: median ${median:.2f}, 90th percentile ${p90:.2f}, "
+                  f"99th percentile ${p99:.2f}, about {overall['vendors']} stores and vendors")
+            for period, title in (("category", "By Category"), ("month", "By Month")):
+                print(f"\n{title}:")
+                print(f"{'':<12}{'Count':>8}{'Median':>11}{'90th':>11}{'99th':>11}{'Vendors':>9}")
+                for bucket, count, median, p90, p99, vendors in STORE.distribution_by(period):
+                    print(f"{bucket:<12}{count:>8}{median:>11.2f}{p90:>11.2f}{p99:>11.2f}{vendors:>9}")
+            input("\nPress Enter to return to the statistics menu...\n")
+
+        elif choice == "6":
             break
         else:
             print("Invalid Choice. Please try again.")
 
+# Pick the transaction to modify: by its ID (read straight from the store, without loading
+# the history), by part of its name, or from the full list when nothing is entered.
+# Returns the history, the transaction (None if nothing was picked) and its position in the
+# history (None if the history isn't loaded)
+def findTransaction(transactions):
+    query = input("Enter a transaction ID or part of its name (press enter to list all): ").strip()
+    if query:
+        row = STORE.get(query)
+        if row is not None:
+            selected = transaction_from_row(row)
+            position = transactions.position_of(selected.transaction_id) if transactions is not None else None
+            return transactions, selected, position
+
+    if query and transactions is None:
+        # Look the matches up through the store's search index instead of loading everything
+        matches = [(None, t) for t in transactionsById(STORE.search(query))]
+    elif query:
+        found = set(STORE.search(query))
+        matches = [(position, t) for position, t in enumerate(transactions) if t.transaction_id in found]
+    else:
+        transactions = loadHistory(transactions)
+        matches = list(enumerate(transactions))
+    if not matches:
+        print(f"No transactions match '{query}'.")
+        return transactions, None, None
+
+    print("\nSelect a transaction to modify:")
+    for idx, (position, t) in enumerate(matches):
+        # The ID is only shown for search results, where it can be used next time
+        label = f" [ID {t.transaction_id}]" if query else ""
+        print(f"{idx + 1}. {t.name} (${t.amount:.2f}) on {t.date}{label}")
+
+    selection = input("Enter number: ")
+    if not selection.isdigit() or int(selection) < 1 or int(selection) > len(matches):
+        print("Invalid selection.")
+        return transactions, None, None
+    position, selected = matches[int(selection) - 1]
+    return transactions, selected, position
+
+# Read the saved history the first time a menu option needs it
+def loadHistory(transactions):
+    if transactions is None:
+        transactions = TransactionStore(load_transactions())
+    return transactions
+
 # Main program function
 def main():
-    transactions = load_transactions()
+    global WRITER
+    # With EXPENSE_PERF set, timings are collected and printed on exit
+    perf.begin_run("cli")
+    # Saving happens in the background so the next prompt shows right away; whatever is
+    # still queued is flushed on quit, on Ctrl+C or when the process is told to stop
+    WRITER = writer.BackgroundWriter(STORE)
+    atexit.register(WRITER.close)
+    for name in ("SIGTERM", "SIGHUP"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), exitOnSignal)
+    # The menu shows right away; adding a transaction never needs the history in memory
+    transactions = None
 
     while True:
         print("*" * 40)
@@ -360,8 +602,10 @@ def main():
             if category.lower() == 'food':
                 mealType = input("Enter meal type (breakfast, lunch, or dinner): ").strip()
                 t = MealsTransaction(name, category, date, amount, mealType)
-                transactions.append(t)
-                save_transactions(transactions)
+                # Not loaded yet: the saved row is picked up when the history is first read
+                if transactions is not None:
+                    transactions.append(t)
+                append_transaction(t)
                 print("Transaction added successfully!")
                 input("\nPress Enter to return to the main menu...\n")
 
@@ -373,8 +617,10 @@ def main():
                 print(itemCategory)
 
                 t = GroceryTransaction(name, category, date, amount, storeName, itemCategory)
-                transactions.append(t)
-                save_transactions(transactions)
+                # Not loaded yet: the saved row is picked up when the history is first read
+                if transactions is not None:
+                    transactions.append(t)
+                append_transaction(t)
                 print("Transaction added successfully!")
                 input("\nPress Enter to return to the main menu...\n")
 
@@ -386,15 +632,19 @@ def main():
                 print(occasion)
 
                 t = ClothingTransaction(name, category, date, amount, clothingType, occasion)
-                transactions.append(t)
-                save_transactions(transactions)
+                # Not loaded yet: the saved row is picked up when the history is first read
+                if transactions is not None:
+                    transactions.append(t)
+                append_transaction(t)
                 print("Transaction added successfully!")
                 input("\nPress Enter to return to the main menu...\n")
 
             elif category == 'other':
                 t = Transaction(name, amount, date, category)
-                transactions.append(t)
-                save_transactions(transactions)
+                # Not loaded yet: the saved row is picked up when the history is first read
+                if transactions is not None:
+                    transactions.append(t)
+                append_transaction(t)
                 print("Transaction added successfully!")
                 input("\nPress Enter to return to the main menu...\n")
             else:
@@ -403,29 +653,21 @@ def main():
         # View and Filter Transactions
 
         elif choice == "2":
-            if not transactions:
-                print("No transactions to show.")
-                continue
-            else:
-                viewAndFilterTransactions(transactions)
+            # Reads go to the store, so let queued adds and changes land first
+            waitForWrites()
+            transactions = viewAndFilterTransactions(transactions)
 
         # Modify Transactions
         elif choice == "3":
-            if not transactions:
+            waitForWrites()
+            if not STORE.summary()["count"]:
                 print("No transactions available to modify.")
                 print("*" * 40)
                 continue
 
-            print("\nSelect a transaction to modify:")
-            for idx, t in enumerate(transactions):
-                print(f"{idx + 1}. {t.name} (${t.amount:.2f}) on {t.date}")
-
-            selection = input("Enter number: ")
-            if not selection.isdigit() or int(selection) < 1 or int(selection) > len(transactions):
-                print("Invalid selection.")
+            transactions, selected, position = findTransaction(transactions)
+            if selected is None:
                 continue
-
-            selected = transactions[int(selection) - 1]
             print("\nCurrent details:")
             selected.display()
 
@@ -436,18 +678,25 @@ def main():
             new_category = input(f"New category [{selected.category}]: ") or selected.category
 
 
+            old = selected.to_dict()
             selected.modify(name=new_name, amount=new_amount, date=new_date, category=new_category)
-            save_transactions(transactions)
+            # Keep the loaded history in step (it isn't loaded if the transaction was looked up by ID)
+            if position is not None:
+                transactions.refresh(position, selected)
+            append_transaction(selected, op="update", old=old)
             print("Transaction updated!")
             print("*" * 40)
 
         # Viw Statistics
         elif choice == "4":
-            show_statistics(transactions)
+            waitForWrites()
+            show_statistics()
         # Quit
         elif choice == "5":
+            waitForWrites(durable=True)
             print("Exiting program. Goodbye!")
             print("*" * 40)
+            perf.print_report()
             break
 
         else:
@@ -455,4 +704,14 @@ def main():
             print("*" * 40)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # "compact" folds pending writes back into the data file and exits
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        STORE.compact()
+    # "import <statement.csv> ..." bulk-loads bank or card statements
+    elif len(sys.argv) > 2 and sys.argv[1] == "import":
+        import importer
+        print(importer.format_report(importer.import_statements(STORE, sys.argv[2:])))
+        # Fold the import into the data file now instead of on a thread that exits with us
+        STORE.compact()
+    else:
+        main()
\ No newline at end of file
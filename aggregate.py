@@ -0,0 +1,126 @@
+"""Vectorized totals per day, ISO week, month and category in one pass.
+
+Dates are turned into day numbers once and the rows are sorted by day a
+single time. ufunc.reduceat then gives the total, count, min and max of
+every day, and weeks and months are reduced from those day buckets rather
+than from the rows again. Categories take one more sort of the codes.
+
+Results use the rollups layout, {period: {bucket: [total, count, min, max]}}
+in cents, so they can be stored in or merged into a Rollups file directly.
+Both apps get their statistics through this module: rollups rebuilds,
+batched inserts and the columnar snapshot all call it.
+"""
+import numpy as np
+
+from rollups import PERIODS, bucket_of, merge_buckets, to_cents
+
+EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def week_labels(mondays):
+    """Label ISO weeks ("2024-W05") given their Mondays as days since 1970-01-01"""
+    thursdays = EPOCH + np.asarray(mondays, dtype=np.int64) + 3
+    years = thursdays.astype("datetime64[Y]")
+    weeks = (thursdays - years.astype("datetime64[D]")).astype(np.int64) // 7 + 1
+    return [f"{year}-W{week:02d}" for year, week in zip(years.astype(str), weeks.tolist())]
+
+
+def _reduce(keys, cents, starts):
+    """Total, count, min and max of cents over the runs of equal keys beginning at starts"""
+    counts = np.diff(np.append(starts, len(keys)))
+    return (np.add.reduceat(cents, starts), counts,
+            np.minimum.reduceat(cents, starts), np.maximum.reduceat(cents, starts))
+
+
+def _runs(keys):
+    """Return the index where each run of equal (sorted) keys begins"""
+    return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+
+def _combine(keys, totals, counts, lows, highs):
+    """Merge adjacent buckets that share a (sorted) key"""
+    starts = _runs(keys)
+    return (keys[starts], np.add.reduceat(totals, starts), np.add.reduceat(counts, starts),
+            np.minimum.reduceat(lows, starts), np.maximum.reduceat(highs, starts))
+
+
+def _buckets(labels, totals, counts, lows, highs):
+    return {label: [int(t), int(c), int(lo), int(hi)]
+            for label, t, c, lo, hi in zip(labels, totals.tolist(), counts.tolist(),
+                                           lows.tolist(), highs.tolist())}
+
+
+def aggregate(days, cents, codes=None, categories=None, periods=PERIODS):
+    """Return {period: {bucket: [total, count, min, max]}} in cents
+
+    days are int days since 1970-01-01, cents int64 amounts, and codes
+    indexes into the categories list (only needed for the "category" period).
+    """
+    days = np.asarray(days, dtype=np.int64)
+    cents = np.asarray(cents, dtype=np.int64)
+    result = {period: {} for period in periods}
+    if len(days) == 0:
+        return result
+
+    if any(p in periods for p in ("day", "week", "month")):
+        # The only pass over the rows for the date periods
+        order = np.argsort(days, kind="stable")
+        sorted_days = days[order]
+        starts = _runs(sorted_days)
+        day_keys = sorted_days[starts]
+        per_day = _reduce(sorted_days, cents[order], starts)
+        if "day" in periods:
+            result["day"] = _buckets(np.datetime_as_string(EPOCH + day_keys), *per_day)
+        if "week" in periods:
+            # 1970-01-01 was a Thursday; key each day by the Monday starting its ISO week
+            weeks = _combine(day_keys - (day_keys + 3) % 7, *per_day)
+            result["week"] = _buckets(week_labels(weeks[0]), *weeks[1:])
+        if "month" in periods:
+            months = _combine((EPOCH + day_keys).astype("datetime64[M]").astype(np.int64), *per_day)
+            result["month"] = _buckets(np.datetime_as_string(months[0].astype("datetime64[M]")), *months[1:])
+
+    if "category" in periods and codes is not None:
+        codes = np.asarray(codes)
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        starts = _runs(sorted_codes)
+        labels = [categories[code] for code in sorted_codes[starts].tolist()]
+        result["category"] = _buckets(labels, *_reduce(sorted_codes, cents[order], starts))
+    return result
+
+
+def from_frame(frame, amount, date, category, periods=PERIODS):
+    """Aggregate a pandas DataFrame of rows, matching rollups.bucket_of() for every row
+
+    Dates that aren't plain YYYY-MM-DD (rare hand edits) are bucketed one
+    row at a time, exactly as Rollups.add() would.
+    """
+    import pandas as pd
+
+    dates = frame[date]
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        parsed = dates
+        odd = dates.isna().to_numpy()
+    else:
+        text = dates.astype(str)
+        parsed = pd.to_datetime(text, format="%Y-%m-%d", errors="coerce")
+        odd = (parsed.isna() | (text.str.len() != 10)).to_numpy()
+    days = parsed.to_numpy().astype("datetime64[D]").astype(np.int64)
+    cents = (pd.to_numeric(frame[amount]) * 100).round().to_numpy().astype(np.int64)
+    codes, categories = pd.factorize(frame[category].astype(str))
+
+    keep = ~odd
+    result = aggregate(days[keep], cents[keep], codes[keep], list(categories), periods)
+    if odd.any():
+        for row_date, row_amount, row_category in zip(frame[date][odd], frame[amount][odd], frame[category][odd]):
+            value = to_cents(row_amount)
+            for period in periods:
+                key = bucket_of(period, str(row_date), str(row_category))
+                merge_buckets(result[period], {key: [value, 1, value, value]})
+    return result
+
+
+def to_rows(buckets):
+    """Turn one period's buckets into totals_by() rows: [(bucket, total, count, min, max)] in dollars"""
+    return [(key, total / 100, count, low / 100, high / 100)
+            for key, (total, count, low, high) in sorted(buckets.items())]
@@ -1,68 +1,180 @@
 import streamlit as st
-import pandas as pd
 import os
+import tempfile
 from datetime import datetime
-import plotly.express as px
+import perf
+import storage
+
+# pandas, plotly and charts are imported inside the functions that use them,
+# so the Add Transaction page starts without loading them
 
 # Constants
 CSV_FILE = "expenses.csv"
+COLUMNS = storage.APP_SCHEMA.fields
 CATEGORIES = ["Food", "Transport", "Shopping", "Grocery", "Other"]
+# Most search results the Modify Transaction page offers
+MODIFY_MATCHES = 50
+
+# Column layout shared by the transaction tables
+TABLE_COLUMNS = {
+    "ID": st.column_config.NumberColumn("ID", width="small"),
+    "Name": st.column_config.TextColumn("Expense Name", width="large"),
+    "Amount": st.column_config.TextColumn("Amount", width="small"),
+    "Date": st.column_config.DateColumn("Date", width="medium"),
+    "Category": st.column_config.TextColumn("Category", width="medium")
+}
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    """Open the configured storage backend once per process"""
+    return storage.open_store(CSV_FILE, storage.APP_SCHEMA)
 
 def initialize_csv():
-    """Create CSV file with headers if it doesn't exist"""
-    if not os.path.exists(CSV_FILE):
-        df = pd.DataFrame(columns=["ID", "Name", "Amount", "Date", "Category"])
-        df.to_csv(CSV_FILE, index=False)
+    """Create CSV file with headers if it doesn't exist (checked once per session)"""
+    if st.session_state.get("csv_initialized"):
+        return
+    st.session_state.csv_initialized = True
+    if storage.BACKEND == "csv" and not os.path.exists(CSV_FILE):
+        with open(CSV_FILE, "w") as file:
+            file.write(",".join(COLUMNS) + "\n")
         st.success(f"Created new expense file: {CSV_FILE}")
 
+def data_version():
+    """Return a key that changes whenever the stored expenses are written"""
+    return get_store().version()
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _load_snapshot(version):
+    """Load every row into a typed DataFrame (cached per data version)
+
+    Amount is int64 cents, Date datetime64 and Category categorical (see storage.as_typed).
+    """
+    return get_store().typed_frame()
+
+@perf.timed
 def load_data():
-    """Load expense data from CSV file"""
+    """Load expense data from the storage backend
+
+    The DataFrame is shared by every page and session until the data changes,
+    so callers must not modify it in place.
+    """
     try:
-        if os.path.exists(CSV_FILE):
-            df = pd.read_csv(CSV_FILE)
-            # Ensure Date column is datetime
-            if not df.empty:
-                df['Date'] = pd.to_datetime(df['Date']).dt.date
-            return df
-        else:
-            # Return empty DataFrame with proper columns
-            return pd.DataFrame(columns=["ID", "Name", "Amount", "Date", "Category"])
+        return _load_snapshot(data_version())
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
-        return pd.DataFrame(columns=["ID", "Name", "Amount", "Date", "Category"])
+        import pandas as pd
+        return pd.DataFrame(columns=COLUMNS)
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _load_statistics(version):
+    """Compute the Statistics page aggregates in the backend (cached per data version)"""
+    import pandas as pd
+
+    store = get_store()
+    stats = {"summary": store.summary()}
+    for period in storage.PERIODS:
+        stats[period] = pd.DataFrame(
+            store.totals_by(period), columns=["Bucket", "Total", "Count", "Min", "Max"]
+        )
+    return stats
+
+@perf.timed(rows=lambda stats: None if stats is None else stats["summary"]["count"])
+def load_statistics():
+    """Load the Statistics page aggregates without reading every row"""
+    try:
+        return _load_statistics(data_version())
+    except Exception as e:
+        st.error(f"Error loading statistics: {str(e)}")
+        return None
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _load_distributions(version):
+    """Read the medians, percentiles and vendor counts from the sketches (cached per data version)"""
+    import pandas as pd
+
+    store = get_store()
+    columns = ["Count", "Median", "P90", "P99", "Vendors"]
+    distributions = {"overall": store.distribution()}
+    for period in ("category", "month"):
+        distributions[period] = pd.DataFrame(store.distribution_by(period), columns=["Bucket"] + columns)
+    return distributions
+
+def load_distributions():
+    """Load the Statistics page's transaction size and vendor sketches"""
+    try:
+        return _load_distributions(data_version())
+    except Exception as e:
+        st.error(f"Error loading statistics: {str(e)}")
+        return None
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _load_quick_stats(version):
+    """Read the sidebar totals straight from the rollups, without pandas (cached per data version)"""
+    store = get_store()
+    category_totals = store.totals_by("category")
+    top_category = max(category_totals, key=lambda bucket: bucket[1])[0] if category_totals else None
+    return {"summary": store.summary(), "top_category": top_category}
+
+def load_quick_stats():
+    """Load the sidebar Quick Stats"""
+    try:
+        return _load_quick_stats(data_version())
+    except Exception as e:
+        st.error(f"Error loading statistics: {str(e)}")
+        return None
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _chart_json(version, chart, period=None, start=None, end=None):
+    """Build a Statistics page figure from the rollups and keep its JSON (cached per data version and date range)"""
+    import charts
+
+    stats = _load_statistics(version)
+    if chart == "category":
+        category_totals = stats["category"].rename(columns={"Bucket": "Category", "Total": "Amount"})
+        fig = charts.category_figure(category_totals[["Category", "Amount"]].sort_values('Amount', ascending=True))
+    else:
+        fig, _ = charts.spending_figure(stats, period, start, end)
+    return fig.to_json()
 
 def save_transaction(name, amount, date, category):
-    """Save a new transaction to CSV file"""
+    """Save a new transaction through the storage backend"""
     try:
-        # Load existing data
-        df = load_data()
-        
-        # Generate new ID
-        if df.empty:
-            new_id = 1
-        else:
-            new_id = df['ID'].max() + 1
-        
-        # Create new transaction
+        # The backend assigns the new ID
         new_transaction = {
-            "ID": new_id,
             "Name": name,
             "Amount": amount,
-            "Date": date,
+            "Date": date.isoformat(),
             "Category": category
         }
-        
-        # Add to DataFrame
-        new_row = pd.DataFrame([new_transaction])
-        df = pd.concat([df, new_row], ignore_index=True)
-        
-        # Save to CSV
-        df.to_csv(CSV_FILE, index=False)
+        get_store().insert(new_transaction)
         return True
     except Exception as e:
         st.error(f"Error saving transaction: {str(e)}")
         return False
 
+def update_transaction(old, name, amount, date, category):
+    """Save changes to an existing transaction through the storage backend"""
+    try:
+        changed = dict(old, Name=name, Amount=amount, Date=date.isoformat(), Category=category)
+        # Passing the old row keeps the statistics rollups exact
+        get_store().update(changed, old=old)
+        return True
+    except Exception as e:
+        st.error(f"Error updating transaction: {str(e)}")
+        return False
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _search_ids(version, text, fuzzy=False):
+    """Return the IDs whose name contains text (or looks most like it), from the trigram index (cached per query)"""
+    import numpy as np
+    return np.array(get_store().search(text, fuzzy=fuzzy), dtype="int64")
+
+def search_transactions(query, limit=MODIFY_MATCHES):
+    """Return the most recent transactions whose name contains query, newest first"""
+    df = load_data()
+    matches = df[filter_mask(df, ids=_search_ids(data_version(), query))]
+    return matches.nlargest(limit, 'Date')
+
 def add_transaction_page():
     """Display the Add Transaction page"""
     st.header("💰 Add New Transaction")
@@ -95,6 +207,160 @@ def add_transaction_page():
                     # Clear form by rerunning
                     st.rerun()
 
+def modify_transaction_page():
+    """Display the Modify Transaction page"""
+    st.header("✏️ Modify Transaction")
+    
+    query = st.text_input("Search by ID or name", placeholder="e.g., 42 or coffee", key="modify_query").strip()
+    if not query:
+        st.info("Search for the transaction you want to change by its ID or part of its name.")
+        return
+    
+    # An ID is fetched directly through the backend's index; anything else searches the names
+    row = get_store().get(query) if query.isdigit() else None
+    if row is None:
+        matches = search_transactions(query)
+        if matches.empty:
+            st.warning(f"No transactions match '{query}'.")
+            return
+        labels = {
+            # Hand-edited dates load as NaT, which isn't equal to itself and can't be formatted
+            transaction_id: f"#{transaction_id} · {name} · ${cents / 100:.2f} · "
+                            + (f"{day:%Y-%m-%d}" if day == day else "no date")
+            for transaction_id, name, cents, day in zip(matches['ID'], matches['Name'], matches['Amount'], matches['Date'])
+        }
+        choice = st.selectbox("Transaction", list(labels), format_func=labels.get, key="modify_choice")
+        if len(matches) == MODIFY_MATCHES:
+            st.caption(f"Showing the {MODIFY_MATCHES} most recent matches. Refine the search to see others.")
+        row = get_store().get(choice)
+        if row is None:
+            st.warning("That transaction no longer exists.")
+            return
+    
+    categories = CATEGORIES if row['Category'] in CATEGORIES else CATEGORIES + [row['Category']]
+    # One form per transaction, so switching transactions resets the fields
+    with st.form(f"modify_form_{row['ID']}"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            name = st.text_input("Expense Name*", value=str(row['Name']))
+            amount = st.number_input("Amount*", min_value=0.01, value=max(float(row['Amount']), 0.01),
+                                     step=0.01, format="%.2f")
+        
+        with col2:
+            try:
+                current = datetime.strptime(str(row['Date'])[:10], "%Y-%m-%d").date()
+            except ValueError:
+                # A hand-edited date such as "3/2/2024"; saving the form replaces it
+                current = datetime.now().date()
+            date = st.date_input("Date", value=current)
+            category = st.selectbox("Category", categories, index=categories.index(row['Category']))
+        
+        submitted = st.form_submit_button("Save Changes", type="primary")
+        
+        if submitted:
+            if not name.strip():
+                st.error("❌ Expense name cannot be empty!")
+            elif update_transaction(row, name.strip(), amount, date, category):
+                st.success(f"✅ Transaction #{row['ID']} updated!")
+
+def import_statements_page():
+    """Display the Import Statements page"""
+    st.header("📥 Import Statements")
+    st.markdown("Upload bank or card statement CSV files with a date, description and amount column.")
+
+    uploads = st.file_uploader("Statement files", type=["csv"], accept_multiple_files=True)
+    debits = st.radio("Purchases in the Amount column are", ["Detect automatically", "Negative", "Positive"],
+                      horizontal=True)
+
+    if uploads and st.button("Import", type="primary"):
+        import importer
+
+        with tempfile.TemporaryDirectory() as folder:
+            # The importer's worker processes read the statements from disk
+            paths = []
+            for upload in uploads:
+                path = os.path.join(folder, os.path.basename(upload.name))
+                with open(path, "wb") as file:
+                    file.write(upload.getbuffer())
+                paths.append(path)
+            try:
+                with st.spinner("Importing..."):
+                    report = importer.import_statements(
+                        get_store(), paths,
+                        debits={"Negative": "negative", "Positive": "positive"}.get(debits, "auto"),
+                        categories=CATEGORIES,
+                    )
+            except Exception as e:
+                st.error(f"❌ Error importing statements: {str(e)}")
+                return
+
+        st.success(f"✅ {importer.format_report(report)}")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Imported", report["imported"])
+        col2.metric("Duplicates", report["duplicates"])
+        col3.metric("Credits", report["credits"])
+        col4.metric("Invalid", report["invalid"])
+
+def filter_mask(df, category=None, start=None, end=None, above=None, below=None, ids=None):
+    """Return a boolean mask of the rows matching the filters, computed on the typed columns
+
+    ids limits the rows to those IDs, e.g. the matches of a text search.
+    """
+    import pandas as pd
+
+    mask = pd.Series(True, index=df.index)
+    if category is not None:
+        mask &= df['Category'] == category
+    if start is not None:
+        mask &= df['Date'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df['Date'] <= pd.Timestamp(end)
+    # Amounts are stored in cents; above and below are in dollars
+    if above is not None:
+        mask &= df['Amount'] > above * 100
+    if below is not None:
+        mask &= df['Amount'] < below * 100
+    if ids is not None:
+        mask &= df['ID'].isin(ids)
+    return mask
+
+def top_transactions(df, k=10, largest=True, category=None, start=None, end=None, above=None, below=None):
+    """Return the k largest (or smallest) transactions matching the filters"""
+    subset = df[filter_mask(df, category, start, end, above, below)]
+    # nlargest/nsmallest select the top k without sorting every row
+    return subset.nlargest(k, 'Amount') if largest else subset.nsmallest(k, 'Amount')
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _sort_order(version, column, ascending):
+    """Return row positions of the snapshot sorted by a column (cached per data version)"""
+    values = _load_snapshot(version)[column].reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _filtered_order(version, column, ascending, category, start, end, text, fuzzy=False, expression=""):
+    """Return the sorted row positions that match the table filters and filter bar (cached per query)"""
+    order = _sort_order(version, column, ascending)
+    if category is None and start is None and end is None and not text and not expression:
+        return order
+    df = _load_snapshot(version)
+    ids = _search_ids(version, text, fuzzy) if text else None
+    mask = filter_mask(df, category, start, end, ids=ids).to_numpy()
+    positions = order[mask[order]]
+    if expression:
+        import queries
+        # The filter bar narrows what the other controls kept; its sort and limit (if any) win
+        positions = queries.select(queries.parse(expression, storage.APP_SCHEMA), df, get_store(), within=positions)
+    return positions
+
+def format_page(page):
+    """Format one page of rows for display"""
+    return page.assign(Amount=(page['Amount'] / 100).map("${:.2f}".format))
+
+def change_page(step):
+    """Move the transactions table forward or back by one page"""
+    st.session_state.view_page += step
+
 def view_transactions_page():
     """Display the View Transactions page"""
     st.header("📋 View Transactions")
@@ -111,52 +377,129 @@ def view_transactions_page():
     with col1:
         st.metric("Total Transactions", len(df))
     with col2:
-        st.metric("Total Amount", f"${df['Amount'].sum():.2f}")
+        st.metric("Total Amount", f"${df['Amount'].sum() / 100:.2f}")
     with col3:
-        latest_date = df['Date'].max() if not df.empty else "N/A"
+        latest_date = df['Date'].max().strftime("%Y-%m-%d") if df['Date'].notna().any() else "N/A"
         st.metric("Latest Transaction", latest_date)
     
     st.divider()
     
-    # Display transactions table
-    st.subheader("All Transactions")
+    # Largest / smallest transactions
+    with st.expander("🏆 Largest & Smallest Transactions"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            k = st.number_input("How many", min_value=1, max_value=1000, value=10, step=1)
+            largest = st.radio("Show", ["Largest", "Smallest"], horizontal=True) == "Largest"
+        with col2:
+            category = st.selectbox("Category", ["All"] + sorted(df['Category'].astype(str).unique()))
+            date_range = st.date_input("Date range", value=(), help="Leave empty for all dates")
+        with col3:
+            above = st.number_input("Only amounts above", min_value=0.0, value=0.0, step=1.0)
+            below = st.number_input("Only amounts below (0 = no limit)", min_value=0.0, value=0.0, step=1.0)
+        
+        start, end = date_range if len(date_range) == 2 else (None, None)
+        top_df = top_transactions(
+            df, int(k), largest=largest,
+            category=None if category == "All" else category,
+            start=start, end=end,
+            above=above or None, below=below or None
+        )
+        st.dataframe(format_page(top_df), use_container_width=True, hide_index=True, column_config=TABLE_COLUMNS)
     
-    # Sort by ID descending (newest first)
-    df_display = df.sort_values('ID', ascending=False)
+    # Display transactions table, one page at a time
+    st.subheader("All Transactions")
     
-    # Format amount column for better display
-    df_display['Amount'] = df_display['Amount'].apply(lambda x: f"${x:.2f}")
+    expression = st.text_input(
+        "Filter", key="view_filter",
+        placeholder="e.g. category=Food and date>=2024-01-01 and amount>50 sort amount desc limit 20",
+        help="Conditions on id, name, amount, date or category joined with 'and', using =, !=, <, <=, >, >= "
+             "or ~ (contains), then optionally 'sort <field> [asc|desc]' and 'limit <n>'"
+    ).strip()
+    if expression:
+        import queries
+        try:
+            queries.parse(expression, storage.APP_SCHEMA)
+        except queries.QueryError as e:
+            st.error(f"Invalid filter: {str(e)}")
+            expression = ""
     
-    # Display table
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sort_column = st.selectbox("Sort by", ["ID", "Date", "Amount", "Name", "Category"])
+        search = st.text_input("Name contains", key="view_search", placeholder="e.g. starbucks").strip()
+    with col2:
+        ascending = st.radio("Order", ["Descending", "Ascending"], horizontal=True) == "Ascending"
+        table_category = st.selectbox("Category", ["All"] + sorted(df['Category'].astype(str).unique()),
+                                      key="view_category")
+    with col3:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+        table_dates = st.date_input("Date range", value=(), key="view_dates",
+                                    help="Leave empty for all dates")
+    
+    table_start, table_end = table_dates if len(table_dates) == 2 else (None, None)
+    table_category = None if table_category == "All" else table_category
+    # Sorting and filtering run once per query; flipping pages only slices the cached positions
+    with perf.stage("sort and filter") as info:
+        positions = _filtered_order(data_version(), sort_column, ascending,
+                                    table_category, table_start, table_end, search, expression=expression)
+        # When no name contains the text, show the names that look most like it instead
+        fuzzy = bool(search) and not len(positions)
+        if fuzzy:
+            positions = _filtered_order(data_version(), sort_column, ascending,
+                                        table_category, table_start, table_end, search, fuzzy=True,
+                                        expression=expression)
+        info["rows"] = len(positions)
+    if fuzzy and len(positions):
+        st.caption(f"No names contain “{search}”; showing the closest matches.")
+    
+    # Go back to the first page whenever the query changes
+    query = (sort_column, ascending, page_size, table_category, table_start, table_end, search, expression)
+    if st.session_state.get("view_query") != query:
+        st.session_state.view_query = query
+        st.session_state.view_page = 1
+    page_count = max(1, -(-len(positions) // page_size))
+    st.session_state.view_page = min(max(st.session_state.get("view_page", 1), 1), page_count)
+    
+    first = (st.session_state.view_page - 1) * page_size
+    page = df.iloc[positions[first:first + page_size]]
+    with perf.stage("format page", rows=len(page)):
+        page_display = format_page(page)
     st.dataframe(
-        df_display,
+        page_display,
         use_container_width=True,
         hide_index=True,
-        column_config={
-            "ID": st.column_config.NumberColumn("ID", width="small"),
-            "Name": st.column_config.TextColumn("Expense Name", width="large"),
-            "Amount": st.column_config.TextColumn("Amount", width="small"),
-            "Date": st.column_config.DateColumn("Date", width="medium"),
-            "Category": st.column_config.TextColumn("Category", width="medium")
-        }
+        column_config=TABLE_COLUMNS
     )
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("◀ Previous", on_click=change_page, args=(-1,),
+                  disabled=st.session_state.view_page <= 1)
+    with col2:
+        st.number_input("Page", min_value=1, max_value=page_count, key="view_page")
+        st.caption(f"Showing {first + 1 if len(positions) else 0}–{first + len(page)} "
+                   f"of {len(positions)} transactions")
+    with col3:
+        st.button("Next ▶", on_click=change_page, args=(1,),
+                  disabled=st.session_state.view_page >= page_count)
 
 def statistics_page():
     """Display the Statistics page"""
+    import plotly.io as pio
+
     st.header("📊 Spending Statistics")
     
-    # Load data
-    df = load_data()
+    # Aggregates are computed by the storage backend
+    stats = load_statistics()
     
-    if df.empty:
+    if stats is None or stats["summary"]["count"] == 0:
         st.info("No transactions found. Add some transactions to see statistics!")
         return
     
-    # Convert Date to datetime for better analysis
-    df['Date'] = pd.to_datetime(df['Date'])
+    summary = stats["summary"]
     
     # Total spending metric
-    total_spent = df['Amount'].sum()
+    total_spent = summary["total"]
     st.metric("💸 Total Amount Spent", f"${total_spent:.2f}")
     
     st.divider()
@@ -164,27 +507,13 @@ def statistics_page():
     # Spending by category
     st.subheader("Spending by Category")
     
-    category_totals = df.groupby('Category')['Amount'].sum().reset_index()
-    category_totals = category_totals.sort_values('Amount', ascending=True)
+    category_totals = stats["category"].rename(columns={"Bucket": "Category", "Total": "Amount"})
+    category_totals = category_totals[["Category", "Amount"]].sort_values('Amount', ascending=True)
     
     if not category_totals.empty:
-        # Create bar chart
-        fig = px.bar(
-            category_totals,
-            x='Amount',
-            y='Category',
-            orientation='h',
-            title="Total Spending by Category",
-            labels={'Amount': 'Amount ($)', 'Category': 'Category'},
-            color='Amount',
-            color_continuous_scale='Blues'
-        )
-        fig.update_layout(
-            showlegend=False,
-            height=400,
-            xaxis_tickformat='$,.2f'
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        # Create bar chart (built once per data version)
+        with perf.stage("category chart", rows=len(category_totals)):
+            st.plotly_chart(pio.from_json(_chart_json(data_version(), "category")), use_container_width=True)
         
         # Category breakdown table
         st.subheader("Category Breakdown")
@@ -208,12 +537,10 @@ def statistics_page():
     # Time-based statistics
     st.subheader("📅 Time-based Statistics")
     
-    # Daily statistics
-    daily_stats = df.groupby(df['Date'].dt.date).agg({
-        'Amount': ['sum', 'mean', 'count', 'min', 'max']
-    }).round(2)
-    daily_stats.columns = ['Total', 'Average', 'Count', 'Min', 'Max']
-    daily_stats = daily_stats.reset_index()
+    # Per-day, per-ISO-week and per-month totals
+    daily_stats = stats["day"]
+    weekly_stats = stats["week"]
+    monthly_stats = stats["month"]
     
     col1, col2, col3 = st.columns(3)
     
@@ -222,28 +549,11 @@ def statistics_page():
         st.metric("📅 Daily Highest", f"${daily_stats['Total'].max():.2f}")
         st.metric("📅 Daily Lowest", f"${daily_stats['Total'].min():.2f}")
     
-    # Weekly statistics
-    df['Week'] = df['Date'].dt.isocalendar().week
-    df['Year'] = df['Date'].dt.year
-    weekly_stats = df.groupby(['Year', 'Week']).agg({
-        'Amount': ['sum', 'mean', 'count', 'min', 'max']
-    }).round(2)
-    weekly_stats.columns = ['Total', 'Average', 'Count', 'Min', 'Max']
-    weekly_stats = weekly_stats.reset_index()
-    
     with col2:
         st.metric("📆 Weekly Average", f"${weekly_stats['Total'].mean():.2f}")
         st.metric("📆 Weekly Highest", f"${weekly_stats['Total'].max():.2f}")
         st.metric("📆 Weekly Lowest", f"${weekly_stats['Total'].min():.2f}")
     
-    # Monthly statistics
-    df['Month'] = df['Date'].dt.month
-    monthly_stats = df.groupby(['Year', 'Month']).agg({
-        'Amount': ['sum', 'mean', 'count', 'min', 'max']
-    }).round(2)
-    monthly_stats.columns = ['Total', 'Average', 'Count', 'Min', 'Max']
-    monthly_stats = monthly_stats.reset_index()
-    
     with col3:
         st.metric("📊 Monthly Average", f"${monthly_stats['Total'].mean():.2f}")
         st.metric("📊 Monthly Highest", f"${monthly_stats['Total'].max():.2f}")
@@ -251,26 +561,103 @@ def statistics_page():
     
     st.divider()
     
+    # Spending over time, drawn from the rollups at a resolution that fits the chart
+    st.subheader("📈 Spending Over Time")
+    
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        resolution = st.selectbox("Resolution", ["Auto", "Daily", "Weekly", "Monthly"], key="chart_resolution",
+                                  help="Auto picks the finest resolution that fits the chart")
+    with col2:
+        chart_dates = st.date_input("Date range", value=(), key="chart_dates", help="Leave empty for all dates")
+    
+    chart_start, chart_end = chart_dates if len(chart_dates) == 2 else (None, None)
+    period = {"Daily": "day", "Weekly": "week", "Monthly": "month"}.get(resolution, "auto")
+    with perf.stage("spending chart"):
+        st.plotly_chart(pio.from_json(_chart_json(data_version(), "spending", period, chart_start, chart_end)),
+                        use_container_width=True)
+    
+    st.divider()
+    
     # Overall transaction statistics
     st.subheader("💰 Overall Transaction Statistics")
     
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        avg_transaction = df['Amount'].mean()
+        avg_transaction = summary["mean"]
         st.metric("📈 Average Transaction", f"${avg_transaction:.2f}")
     
     with col2:
-        max_transaction = df['Amount'].max()
+        max_transaction = summary["max"]
         st.metric("🔺 Largest Transaction", f"${max_transaction:.2f}")
     
     with col3:
-        min_transaction = df['Amount'].min()
+        min_transaction = summary["min"]
         st.metric("🔻 Smallest Transaction", f"${min_transaction:.2f}")
     
     with col4:
-        transaction_count = len(df)
+        transaction_count = summary["count"]
         st.metric("🧾 Total Transactions", transaction_count)
+    
+    st.divider()
+    
+    # Transaction sizes and vendors, read from the per-category and per-month sketches
+    st.subheader("📐 Transaction Sizes and Vendors")
+    
+    distributions = load_distributions()
+    if distributions is None:
+        return
+    
+    median, p90, p99 = distributions["overall"]["quantiles"]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("⚖️ Median Transaction", f"${median:.2f}")
+    with col2:
+        st.metric("📶 90th Percentile", f"${p90:.2f}")
+    with col3:
+        st.metric("🚩 99th Percentile", f"${p99:.2f}")
+    with col4:
+        st.metric("🏪 Distinct Vendors", f"{distributions['overall']['vendors']:,}")
+    st.caption("Amounts are within 1% of the exact values and vendor counts within a few percent.")
+    
+    money = st.column_config.NumberColumn(format="$%.2f")
+    size_columns = {"Count": "Transactions", "Median": money, "P90": money, "P99": money,
+                    "Vendors": "Distinct Vendors"}
+    
+    st.subheader("By Category")
+    st.dataframe(
+        distributions["category"],
+        use_container_width=True,
+        hide_index=True,
+        column_config={"Bucket": "Category", **size_columns}
+    )
+    
+    st.subheader("By Month")
+    st.dataframe(
+        distributions["month"].sort_values("Bucket", ascending=False),
+        use_container_width=True,
+        hide_index=True,
+        column_config={"Bucket": "Month", **size_columns}
+    )
+
+def show_performance(panel):
+    """Show this rerun's stage timings in a collapsible sidebar section"""
+    import pandas as pd
+
+    records = perf.records()
+    with panel.expander("⏱️ Performance", expanded=False):
+        st.caption(f"Total: {sum(r['seconds'] for r in records if r['depth'] == 0) * 1000:.0f} ms")
+        st.dataframe(
+            pd.DataFrame({
+                "Stage": ["\u2003" * r["depth"] + r["stage"] for r in records],
+                "ms": [round(r["seconds"] * 1000, 1) for r in records],
+                "Rows": pd.array([r["rows"] for r in records], dtype="Int64"),
+                "Memory": [perf.format_bytes(r["memory_delta"]) for r in records],
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
 
 def main():
     """Main application function"""
@@ -293,24 +680,27 @@ def main():
     st.sidebar.title("Navigation")
     page = st.sidebar.radio(
         "Choose a page:",
-        ["Add Transaction", "View Transactions", "Statistics"],
+        ["Add Transaction", "Import Statements", "View Transactions", "Modify Transaction", "Statistics"],
         index=0
     )
+    perf.begin_run(page)
     
     st.sidebar.divider()
     
-    # Quick stats in sidebar
-    df = load_data()
-    if not df.empty:
-        st.sidebar.subheader("Quick Stats")
-        st.sidebar.metric("Total Spent", f"${df['Amount'].sum():.2f}")
-        st.sidebar.metric("Transactions", len(df))
-        
-        # Most expensive category
-        if not df.empty:
-            category_totals = df.groupby('Category')['Amount'].sum()
-            top_category = category_totals.idxmax()
-            st.sidebar.metric("Top Category", top_category)
+    # Quick stats in sidebar, read from the cached per-category totals
+    with perf.stage("sidebar quick stats"):
+        stats = load_quick_stats()
+        if stats is not None and stats["summary"]["count"] > 0:
+            st.sidebar.subheader("Quick Stats")
+            st.sidebar.metric("Total Spent", f"${stats['summary']['total']:.2f}")
+            st.sidebar.metric("Transactions", stats["summary"]["count"])
+            
+            # Most expensive category
+            if stats["top_category"] is not None:
+                st.sidebar.metric("Top Category", stats["top_category"])
+    
+    # Filled in once the page has rendered (only when EXPENSE_PERF is set)
+    performance_panel = st.sidebar.container()
     
     st.sidebar.divider()
     st.sidebar.markdown("---")
@@ -320,12 +710,20 @@ def main():
     st.sidebar.markdown("• Check statistics weekly")
     
     # Display selected page
-    if page == "Add Transaction":
-        add_transaction_page()
-    elif page == "View Transactions":
-        view_transactions_page()
-    elif page == "Statistics":
-        statistics_page()
+    with perf.stage(f"page: {page}"):
+        if page == "Add Transaction":
+            add_transaction_page()
+        elif page == "Import Statements":
+            import_statements_page()
+        elif page == "View Transactions":
+            view_transactions_page()
+        elif page == "Modify Transaction":
+            modify_transaction_page()
+        elif page == "Statistics":
+            statistics_page()
+    
+    if perf.ENABLED:
+        show_performance(performance_panel)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,402 @@
+"""Benchmarks for the command-line and web app data paths on synthetic data.
+
+Generates deterministic, realistic expense histories in both file layouts
+(the CLI's transaction_id,name,amount,... and app.py's ID,Name,Amount,...),
+then times the load, save, statistics and filter paths of each front end
+and reports the best time and the peak traced memory of every case as JSON.
+Each (layout, size, backend) group runs in a fresh process, and generated
+files are cached by size and seed, so runs are comparable across commits.
+
+    python benchmarks/bench.py [--sizes 10k,1m,10m] [--backends csv,sqlite] [--output results.json]
+    python benchmarks/bench.py --compare before.json --output after.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_SCRIPT = os.path.join(REPO, "GROUP PROJECT PT 1 - 8.py")
+SEED = 4381
+FIRST_DAY = date(2022, 1, 1)
+SPAN_DAYS = 3 * 365
+CHUNK_ROWS = 1_000_000
+
+# Category -> (share of rows, typical amount, vendors)
+CATEGORIES = {
+    "Food": (0.35, 14.0, ["Chipotle", "Starbucks", "Panera Bread", "Taco Bell", "Subway", "Local Diner"]),
+    "Grocery": (0.25, 45.0, ["Kroger", "Walmart", "Trader Joe's", "Whole Foods", "Aldi", "Costco"]),
+    "Transport": (0.15, 25.0, ["Shell", "Exxon", "Uber", "Lyft", "DART Pass", "Parking"]),
+    "Shopping": (0.15, 60.0, ["Target", "Amazon", "Old Navy", "Nike", "Macy's", "H&M"]),
+    "Other": (0.10, 80.0, ["Netflix", "AT&T", "Planet Fitness", "CVS", "Venmo", "Campus Store"]),
+}
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack"]
+ITEM_CATEGORIES = ["Produce", "Dairy", "Meat", "Bakery", "Household"]
+CLOTHING_TYPES = ["Shirt", "Pants", "Shoes", "Jacket"]
+OCCASIONS = ["Casual", "Work", "Party", "Sport"]
+# CLI rows of these categories are saved as the matching Transaction subclass
+CLI_TYPES = {"Food": "MealsTransaction", "Grocery": "GroceryTransaction", "Shopping": "ClothingTransaction"}
+
+
+def parse_size(text):
+    """Turn "10k" / "1m" / "10m" / "2500" into a row count"""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _chunk(rng, first, count, rows):
+    """Generate rows first..first+count of a history of `rows` rows, in date order"""
+    names = list(CATEGORIES)
+    shares = np.array([CATEGORIES[c][0] for c in names])
+    category = rng.choice(len(names), size=count, p=shares / shares.sum())
+    vendor = rng.integers(0, 6, size=count)
+    typical = np.array([CATEGORIES[c][1] for c in names])[category]
+    amount = np.maximum(np.round(rng.lognormal(np.log(typical), 0.6), 2), 0.5)
+    day = (np.arange(first, first + count, dtype=np.int64) * SPAN_DAYS) // max(rows, 1)
+    dates = (np.datetime64(FIRST_DAY) + day).astype(str)
+    vendors = np.array([[v for v in CATEGORIES[c][2]] for c in names])
+    return {
+        "category": np.array(names)[category],
+        "name": vendors[category, vendor],
+        "amount": amount,
+        "date": dates,
+        "pick": rng.integers(0, 4, size=count),
+        "pick5": rng.integers(0, 5, size=count),
+        "id_bytes": rng.bytes(16 * count),
+    }
+
+
+def _app_frame(data, first):
+    return pd.DataFrame({
+        "ID": np.arange(first + 1, first + 1 + len(data["name"])),
+        "Name": data["name"], "Amount": data["amount"], "Date": data["date"], "Category": data["category"],
+    })
+
+
+def _cli_frame(data):
+    count = len(data["name"])
+    hexed = data["id_bytes"].hex()
+    ids = [f"{hexed[i:i + 8]}-{hexed[i + 8:i + 12]}-4{hexed[i + 13:i + 16]}-a{hexed[i + 17:i + 20]}-{hexed[i + 20:i + 32]}"
+           for i in range(0, 32 * count, 32)]
+    category = pd.Series(data["category"])
+    kind = category.map(CLI_TYPES).fillna("Transaction")
+    blank = np.full(count, "", dtype=object)
+
+    def when(cls, values):
+        return np.where(kind == cls, values, blank)
+
+    return pd.DataFrame({
+        "transaction_id": ids, "name": data["name"], "amount": data["amount"], "date": data["date"],
+        "category": data["category"], "type": kind,
+        "Meal Type": when("MealsTransaction", np.array(MEAL_TYPES)[data["pick"]]),
+        "Store Name": when("GroceryTransaction", data["name"]),
+        "Item Category": when("GroceryTransaction", np.array(ITEM_CATEGORIES)[data["pick5"]]),
+        "Clothing Type": when("ClothingTransaction", np.array(CLOTHING_TYPES)[data["pick"]]),
+        "occasion": when("ClothingTransaction", np.array(OCCASIONS)[data["pick"]]),
+    })
+
+
+def generate(layout, rows, path, seed=SEED):
+    """Write a deterministic expense history of `rows` rows in the "app" or "cli" layout"""
+    rng = np.random.default_rng(seed)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="") as file:
+        for first in range(0, max(rows, 1), CHUNK_ROWS):
+            count = min(CHUNK_ROWS, rows - first)
+            if count <= 0:
+                break
+            data = _chunk(rng, first, count, rows)
+            frame = _app_frame(data, first) if layout == "app" else _cli_frame(data)
+            frame.to_csv(file, header=first == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def dataset(layout, rows, data_dir, seed=SEED):
+    """Return the cached generated file for a layout and size, creating it if needed"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{layout}-{rows}-{seed}.csv")
+    if not os.path.exists(path):
+        generate(layout, rows, path, seed)
+    return path
+
+
+def measure(fn, repeat=3, memory=True):
+    """Return (best seconds, peak traced bytes or None) for fn()"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return min(times), peak
+
+
+def _prepare(layout, source, work_dir, backend):
+    """Copy a generated file into a scratch directory as expenses.csv (or load it into SQLite or partitions)"""
+    os.makedirs(work_dir, exist_ok=True)
+    shutil.copy(source, os.path.join(work_dir, "expenses.csv"))
+    os.chdir(work_dir)
+    os.environ["EXPENSE_BACKEND"] = backend
+    sys.path.insert(0, REPO)
+    if backend == "sqlite":
+        import storage
+        schema = storage.APP_SCHEMA if layout == "app" else storage.CLI_SCHEMA
+        target = storage.open_store("expenses.csv", schema, backend="sqlite")
+        target.insert_frame(pd.read_csv("expenses.csv", dtype=str, keep_default_na=False))
+    elif backend == "partitioned":
+        import storage
+        # Opening the partitioned store splits the CSV file into months
+        storage.open_store("expenses.csv", storage.APP_SCHEMA if layout == "app" else storage.CLI_SCHEMA)
+
+
+def _middle_date():
+    return str(np.datetime64(FIRST_DAY) + SPAN_DAYS // 2)
+
+
+def cli_cases(rows):
+    """Build the (name, fn) cases for the command-line app"""
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("expense_cli", CLI_SCRIPT)
+    cli = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cli)
+    state = {"store": cli.TransactionStore(cli.load_transactions())}
+    middle = _middle_date()
+    middle_id = state["store"][len(state["store"]) // 2].transaction_id
+    month_end = str(np.datetime64(middle) + 30)
+
+    def load():
+        state["store"] = cli.TransactionStore(cli.load_transactions())
+
+    def statistics_cold():
+        os.remove(cli.STORE.rollups_path()) if os.path.exists(cli.STORE.rollups_path()) else None
+        for period in ("category", "day", "month"):
+            cli.STORE.totals_by(period)
+
+    def statistics_warm():
+        for period in ("category", "day", "month"):
+            cli.STORE.totals_by(period)
+
+    def distributions_cold():
+        os.remove(cli.STORE.sketches_path()) if os.path.exists(cli.STORE.sketches_path()) else None
+        for period in ("category", "month"):
+            cli.STORE.distribution_by(period)
+
+    def distributions_warm():
+        for period in ("category", "month"):
+            cli.STORE.distribution_by(period)
+
+    def append_queued():
+        # Ten adds through the background writer (as main() does), written as one batch
+        cli.WRITER = cli.writer.BackgroundWriter(cli.STORE)
+        for _ in range(10):
+            cli.append_transaction(cli.Transaction("Bench", 9.99, middle, "Food"))
+        cli.WRITER.close()
+        cli.WRITER = None
+
+    return [
+        ("load_transactions", load),
+        ("statistics.cold", statistics_cold),
+        ("statistics.warm", statistics_warm),
+        # The date-range total of statistics option 2
+        ("statistics.date_range", lambda: cli.STORE.total_between(middle, month_end)),
+        # Medians, p90/p99 and vendor counts per category and month (the cold run builds the sketches)
+        ("statistics.distributions_cold", distributions_cold),
+        ("statistics.distributions_warm", distributions_warm),
+        # The same month asked of the backend, without the in-memory history
+        ("query.month_total", lambda: cli.STORE.summary(middle, month_end)),
+        ("query.month_rows", lambda: list(cli.load_transactions(middle, month_end))),
+        # One transaction by ID, as the Modify menu fetches it (the first run builds the offset index)
+        ("query.get_by_id", lambda: cli.STORE.get(middle_id)),
+        # Substring search over names and stores (the first run builds the trigram index)
+        ("query.search", lambda: cli.STORE.search("starbucks")),
+        # A filter expression over one month, as the "query" option runs it
+        ("query.expression", lambda: cli.queries.run(cli.queries.parse(
+            f"category=food and date>={middle} and date<={month_end} and amount>20 sort amount desc limit 20",
+            cli.storage.CLI_SCHEMA), cli.STORE)),
+        ("filter.category", lambda: list(state["store"].where("category", "Food"))),
+        ("filter.date", lambda: list(state["store"].on_date(middle))),
+        ("filter.top_k", lambda: list(state["store"].top_k(10))),
+        ("filter.above", lambda: list(state["store"].above(200))),
+        ("append_transaction", lambda: cli.append_transaction(cli.Transaction("Bench", 9.99, middle, "Food"))),
+        ("append_transaction.queued_10", append_queued),
+        ("save_transactions", lambda: cli.save_transactions(state["store"])),
+    ]
+
+
+def app_cases(rows):
+    """Build the (name, fn) cases for the Streamlit app's data functions (run without a server)"""
+    import logging
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    import app
+    middle = pd.Timestamp(_middle_date())
+
+    def load_data():
+        app._load_snapshot.clear()
+        return app.load_data()
+
+    def statistics_cold():
+        path = app.get_store().rollups_path()
+        os.remove(path) if os.path.exists(path) else None
+        app._load_statistics.clear()
+        app.load_statistics()
+
+    def statistics_warm():
+        app._load_statistics.clear()
+        app.load_statistics()
+
+    def distributions_cold():
+        path = app.get_store().sketches_path()
+        os.remove(path) if os.path.exists(path) else None
+        app._load_distributions.clear()
+        app.load_distributions()
+
+    def distributions_warm():
+        app._load_distributions.clear()
+        app.load_distributions()
+
+    def spending_chart():
+        app._chart_json.clear()
+        app._chart_json(app.data_version(), "spending", "day")
+
+    def sort_and_filter():
+        app._sort_order.clear()
+        app._filtered_order.clear()
+        app._filtered_order(app.data_version(), "Amount", False, "Food", None, None, "")
+
+    def expression_page():
+        app._filtered_order.clear()
+        app._filtered_order(app.data_version(), "ID", False, None, None, None, "",
+                            expression="category=Food and amount>50 sort amount desc limit 20")
+
+    def search_page():
+        app._search_ids.clear()
+        app._filtered_order.clear()
+        app._filtered_order(app.data_version(), "Amount", False, None, None, None, "starbucks")
+
+    return [
+        ("load_data", load_data),
+        ("statistics.cold", statistics_cold),
+        ("statistics.warm", statistics_warm),
+        ("statistics.distributions_cold", distributions_cold),
+        ("statistics.distributions_warm", distributions_warm),
+        ("chart.spending", spending_chart),
+        ("filter.mask", lambda: app.filter_mask(app.load_data(), category="Food", start=middle,
+                                                end=middle + pd.Timedelta(days=30))),
+        ("filter.top_k", lambda: app.top_transactions(app.load_data(), 10)),
+        ("filter.sorted_page", sort_and_filter),
+        ("filter.search_page", search_page),
+        ("filter.expression_page", expression_page),
+        ("get_by_id", lambda: app.get_store().get(rows // 2)),
+        ("save_transaction", lambda: app.save_transaction("Bench", 9.99, middle.date(), "Food")),
+    ]
+
+
+def run_group(layout, rows, source, backend, repeat, memory):
+    """Run every case of one layout, size and backend (called in a fresh process)"""
+    work_dir = tempfile.mkdtemp(prefix=f"bench-{layout}-{rows}-")
+    try:
+        started = time.perf_counter()
+        _prepare(layout, source, work_dir, backend)
+        setup = time.perf_counter() - started
+        cases = cli_cases(rows) if layout == "cli" else app_cases(rows)
+        results = [{"case": f"{layout}.setup", "rows": rows, "backend": backend,
+                    "seconds": round(setup, 6), "peak_bytes": None}]
+        for name, fn in cases:
+            seconds, peak = measure(fn, repeat, memory)
+            results.append({"case": f"{layout}.{name}", "rows": rows, "backend": backend,
+                            "seconds": round(seconds, 6), "peak_bytes": peak})
+        return results
+    finally:
+        os.chdir(REPO)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before, after, tolerance):
+    """Print cases that got slower than tolerance allows and return how many did"""
+    old = {(r["case"], r["rows"], r["backend"]): r for r in before["results"]}
+    regressions = 0
+    for result in after["results"]:
+        previous = old.get((result["case"], result["rows"], result["backend"]))
+        if previous is None or not previous["seconds"]:
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        flag = ""
+        if ratio > 1 + tolerance and result["seconds"] - previous["seconds"] > 0.005:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{result['case']:<32} {result['rows']:>10} {result['backend']:<7} "
+              f"{previous['seconds']:>10.4f}s -> {result['seconds']:>10.4f}s  x{ratio:.2f}{flag}",
+              file=sys.stderr)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the expense apps' data paths on synthetic data")
+    parser.add_argument("--sizes", default="10k,1m", help="comma-separated row counts, e.g. 10k,1m,10m")
+    parser.add_argument("--layouts", default="cli,app", help="comma-separated: cli, app")
+    parser.add_argument("--backends", default="csv", help="comma-separated: csv, sqlite, partitioned")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the extra traced run for peak memory")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "expense-bench-data"))
+    parser.add_argument("--output", default=None, help="write JSON here instead of stdout")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": [],
+    }
+    for rows in [parse_size(s) for s in args.sizes.split(",")]:
+        for layout in args.layouts.split(","):
+            source = dataset(layout, rows, args.data_dir, args.seed)
+            for backend in args.backends.split(","):
+                print(f"{layout} {rows} rows ({backend})...", file=sys.stderr)
+                # A fresh interpreter per group keeps caches and heap growth from leaking between groups
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    report["results"] += pool.submit(run_group, layout, rows, source, backend,
+                                                     args.repeat, not args.no_memory).result()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as file:
+            sys.exit(1 if compare(json.load(file), report, args.tolerance) else 0)
@@ -0,0 +1,78 @@
+"""Compare the single-pass aggregation engine (aggregate.py) with the older paths.
+
+For each size, the same generated history is aggregated per day, ISO
+week, month and category by:
+
+    engine   aggregate.from_frame(): one sort by day plus reduceat
+    pandas   one groupby per period on added Week/Year/Month columns, as
+             statistics_page() used to do
+    python   ExpenseStore._bucketize(): one dict-accumulating pass per period
+
+All three start from the same DataFrame, so parsing is not included.
+Results are printed as JSON in the same shape as bench.py.
+
+    python benchmarks/bench_aggregate.py [--sizes 10k,1m] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aggregate  # noqa: E402
+import storage  # noqa: E402
+from bench import SEED, _git_commit, dataset, measure, parse_size  # noqa: E402
+from rollups import PERIODS  # noqa: E402
+
+
+def pandas_totals(df):
+    """The per-period groupbys statistics_page() ran before the rollups existed"""
+    df = df.copy()
+    df["Date"] = pd.to_datetime(df["Date"])
+    results = {"day": df.groupby(df["Date"].dt.date)["Amount"].agg(["sum", "count", "min", "max"])}
+    df["Week"] = df["Date"].dt.isocalendar().week
+    df["Year"] = df["Date"].dt.isocalendar().year
+    results["week"] = df.groupby(["Year", "Week"])["Amount"].agg(["sum", "count", "min", "max"])
+    df["Month"] = df["Date"].dt.to_period("M")
+    results["month"] = df.groupby("Month")["Amount"].agg(["sum", "count", "min", "max"])
+    results["category"] = df.groupby("Category")["Amount"].agg(["sum", "count", "min", "max"])
+    return results
+
+
+def python_totals(df):
+    """One dict-accumulating pass per period over row dicts, as ExpenseStore._totals_by() does"""
+    store = storage.ExpenseStore("", storage.APP_SCHEMA)
+    rows = df.to_dict("records")
+    return {period: store._bucketize(period, rows) for period in PERIODS}
+
+
+def engine_totals(df):
+    return aggregate.from_frame(df, "Amount", "Date", "Category")
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark the aggregation engine against pandas and Python")
+    parser.add_argument("--sizes", default="10k,1m")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--skip-python", action="store_true", help="skip the slow per-row Python path")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "expense-bench-data"))
+    args = parser.parse_args()
+
+    report = {"commit": _git_commit(), "seed": SEED, "repeat": args.repeat, "results": []}
+    for rows in [parse_size(s) for s in args.sizes.split(",")]:
+        df = pd.read_csv(dataset("app", rows, args.data_dir), dtype={"Date": str, "Category": str})
+        cases = [("engine", engine_totals), ("pandas", pandas_totals)]
+        if not args.skip_python:
+            cases.append(("python", python_totals))
+        for name, fn in cases:
+            seconds, peak = measure(lambda: fn(df), args.repeat, not args.no_memory)
+            report["results"].append({"case": f"aggregate.{name}", "rows": rows, "backend": "memory",
+                                      "seconds": round(seconds, 6), "peak_bytes": peak})
+            print(f"{name:<7} {rows:>10} rows  {seconds:.4f}s", file=sys.stderr)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,127 @@
+"""Cold-start benchmark for both apps.
+
+Every case runs in a fresh interpreter, so nothing is already imported:
+
+    import.app / import.cli   total import time of app.py and the CLI script
+                              from ``python -X importtime`` (the slowest
+                              modules they import are printed to stderr)
+    app.first_render          start Python and render the Add Transaction
+                              page once (streamlit's AppTest, no server)
+    cli.menu                  start the CLI, show the menu and quit
+
+The first-render cases use a generated history of each size (see bench.py)
+and run once untimed first, so one-off work like building the statistics
+rollups isn't counted. Results are printed as JSON in the same shape as
+bench.py, and --compare works the same way.
+
+    python benchmarks/bench_startup.py [--sizes 10k,1m] [--repeat 3] [--compare before.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import CLI_SCRIPT, REPO, SEED, _git_commit, compare, dataset, parse_size
+
+IMPORT_APP = "import app"
+IMPORT_CLI = f"import runpy; runpy.run_path({CLI_SCRIPT!r}, run_name='cli')"
+RENDER_APP = f"""
+import logging
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({os.path.join(REPO, "app.py")!r}, default_timeout=600).run()
+assert not at.exception, at.exception
+"""
+
+
+def _env():
+    env = dict(os.environ, PYTHONPATH=REPO)
+    env.pop("EXPENSE_PERF", None)
+    return env
+
+
+def import_times(code, work_dir):
+    """Return (total seconds, [(cumulative seconds, module)] of the imports one level down) for python -c code"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=work_dir, env=_env(),
+                            capture_output=True, text=True, check=True)
+    total, nested, pending = 0, [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        # Nested imports are indented two spaces per level and listed before the module that imported them
+        depth = (len(module) - len(module.lstrip()) - 1) // 2
+        seconds, module = int(cumulative) / 1e6, module.strip()
+        if depth == 1:
+            pending.append((seconds, module))
+        elif depth == 0:
+            # Interpreter startup (site, encodings) happens before the code runs
+            if module not in ("site", "encodings"):
+                total += seconds
+                nested += pending
+            pending = []
+    return total, sorted(nested, reverse=True)
+
+
+def wall_time(args, work_dir, stdin=None, repeat=3):
+    """Return the best wall time of running a fresh interpreter with args (after one untimed run)"""
+    times = []
+    for attempt in range(repeat + 1):
+        started = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=work_dir, env=_env(), input=stdin,
+                       capture_output=True, text=True, check=True)
+        if attempt:
+            times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def _result(case, rows, seconds):
+    return {"case": f"startup.{case}", "rows": rows, "backend": "csv", "seconds": round(seconds, 6),
+            "peak_bytes": None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the expense apps")
+    parser.add_argument("--sizes", default="10k,1m", help="comma-separated row counts for the first-render cases")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (best is kept)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "expense-bench-data"))
+    parser.add_argument("--output", default=None, help="write JSON here instead of stdout")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    report = {"commit": _git_commit(), "python": sys.version.split()[0], "seed": SEED, "repeat": args.repeat,
+              "results": []}
+    work_dir = tempfile.mkdtemp(prefix="bench-startup-")
+    try:
+        for name, code in (("app", IMPORT_APP), ("cli", IMPORT_CLI)):
+            best = min(import_times(code, work_dir) for _ in range(args.repeat))
+            report["results"].append(_result(f"import.{name}", 0, best[0]))
+            slowest = ", ".join(f"{module} {seconds * 1000:.0f} ms" for seconds, module in best[1][:5])
+            print(f"import {name}: {best[0] * 1000:.0f} ms ({slowest})", file=sys.stderr)
+
+        for rows in [parse_size(s) for s in args.sizes.split(",")]:
+            for layout, case, command, stdin in (("app", "app.first_render", ["-c", RENDER_APP], None),
+                                                 ("cli", "cli.menu", [CLI_SCRIPT], "5\n")):
+                folder = os.path.join(work_dir, f"{layout}-{rows}")
+                os.makedirs(folder)
+                shutil.copy(dataset(layout, rows, args.data_dir), os.path.join(folder, "expenses.csv"))
+                seconds = wall_time(command, folder, stdin, args.repeat)
+                report["results"].append(_result(case, rows, seconds))
+                print(f"{case} {rows} rows: {seconds:.3f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as file:
+            sys.exit(1 if compare(json.load(file), report, args.tolerance) else 0)
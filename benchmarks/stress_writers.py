@@ -0,0 +1,101 @@
+"""Stress test: many processes and threads inserting into one store at once.
+
+Each worker process runs several threads that insert rows one at a time
+(with an occasional batch and compaction mixed in). Afterwards the script
+checks that no row was lost, every ID is unique and contiguous, and the
+statistics rollups still match the data.
+
+    python benchmarks/stress_writers.py [--backend csv|sqlite] [--processes 4] [--threads 4] [--inserts 200]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+
+def _thread(store, worker, thread, inserts, compact_every):
+    for i in range(inserts):
+        row = {"Name": f"w{worker}-t{thread}-{i}", "Amount": (i % 50) + 1.25,
+               "Date": f"2024-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}", "Category": ("Food", "Other")[i % 2]}
+        if i % 25 == 24:
+            store.insert_many([row, dict(row, Name=row["Name"] + "b")])
+        else:
+            store.insert(row)
+        if compact_every and i % compact_every == compact_every - 1:
+            store.compact()
+
+
+def _worker(path, backend, worker, threads, inserts, compact_every):
+    store = storage.open_store(path, storage.APP_SCHEMA, backend=backend)
+    pool = [threading.Thread(target=_thread, args=(store, worker, t, inserts, compact_every))
+            for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+def expected_rows(processes, threads, inserts):
+    """Rows the workers write: one per insert plus an extra one per insert_many"""
+    return processes * threads * (inserts + inserts // 25)
+
+
+def run(path, backend, processes, threads, inserts, compact_every):
+    """Run the writers and return a list of problems found (empty if all is well)"""
+    started = time.perf_counter()
+    workers = [multiprocessing.Process(target=_worker, args=(path, backend, w, threads, inserts, compact_every))
+               for w in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    store = storage.open_store(path, storage.APP_SCHEMA, backend=backend)
+    rows = list(store.iter_rows())
+    ids = sorted(int(float(row["ID"])) for row in rows)
+    expected = expected_rows(processes, threads, inserts)
+    problems = []
+    if any(worker.exitcode for worker in workers):
+        problems.append("a worker process failed")
+    if len(rows) != expected:
+        problems.append(f"expected {expected} rows, found {len(rows)}")
+    if len(set(ids)) != len(ids):
+        problems.append(f"{len(ids) - len(set(ids))} duplicate IDs")
+    if ids and ids != list(range(1, len(ids) + 1)):
+        problems.append("IDs are not contiguous")
+    if len({row["Name"] for row in rows}) != len(rows):
+        problems.append("some rows were written twice")
+    summary = store.summary()
+    if summary != store.rebuild_rollups().summary():
+        problems.append("rollups drifted from the data")
+    print(f"{backend}: {len(rows)} rows from {processes}x{threads} writers in {elapsed:.2f}s "
+          f"({len(rows) / elapsed:.0f} inserts/s)")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many parallel writers against one expense store")
+    parser.add_argument("--backend", choices=["csv", "sqlite", "partitioned"], default=None, help="default: all three")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--inserts", type=int, default=200, help="inserts per thread")
+    parser.add_argument("--compact-every", type=int, default=100, help="compact after this many inserts (0 = never)")
+    args = parser.parse_args()
+
+    failed = False
+    for backend in [args.backend] if args.backend else ["csv", "sqlite", "partitioned"]:
+        with tempfile.TemporaryDirectory() as folder:
+            problems = run(os.path.join(folder, "expenses.csv"), backend,
+                           args.processes, args.threads, args.inserts, args.compact_every)
+        for problem in problems:
+            print(f"  FAIL: {problem}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,128 @@
+"""Plotly figures for the Statistics page, sized for the screen rather than the data.
+
+Charts are drawn from the rollup buckets (per day, ISO week, month and
+category), never from the transactions themselves. For a time series the
+coarsest period needed to fit the chart width is picked automatically, and
+if there are still more buckets than points to draw, Largest-Triangle-
+Three-Buckets (LTTB) downsampling keeps the points that shape the line.
+The cost of building a figure therefore depends on the date range and the
+chart width, not on how many transactions there are.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+# Roughly one point per horizontal pixel of a wide chart
+MAX_POINTS = 1000
+
+DATE_PERIODS = ("day", "week", "month")
+PERIOD_NAMES = {"day": "Daily", "week": "Weekly", "month": "Monthly"}
+_LABEL_FORMATS = {"day": "%Y-%m-%d", "week": "%G-W%V-%u", "month": "%Y-%m"}
+
+
+def lttb(x, y, threshold):
+    """Return the indices of the points Largest-Triangle-Three-Buckets keeps
+
+    The first and last points are always kept. The points between them are
+    split into threshold - 2 buckets, and from each bucket the point forming
+    the largest triangle with the previously kept point and the average of
+    the next bucket is chosen, which preserves peaks and dips.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        after = slice(stop, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        next_x, next_y = x[after].mean(), y[after].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        keep[i + 1] = previous
+    return keep
+
+
+def bucket_dates(period, labels):
+    """Turn rollup bucket labels ("2024-03-05", "2024-W10", "2024-03") into the dates they start on"""
+    labels = pd.Series(labels, dtype=str)
+    if period == "week":
+        labels = labels + "-1"
+    return pd.to_datetime(labels, format=_LABEL_FORMATS[period], errors="coerce")
+
+
+def series(buckets, period, start=None, end=None):
+    """Return the (dates, totals) of one period's buckets that start within [start, end]
+
+    buckets is a totals_by() DataFrame with "Bucket" and "Total" columns.
+    Buckets that aren't dates (from hand-edited rows) are left out.
+    """
+    dates = bucket_dates(period, buckets["Bucket"])
+    keep = dates.notna()
+    if start is not None:
+        keep &= dates >= pd.Timestamp(start)
+    if end is not None:
+        keep &= dates <= pd.Timestamp(end)
+    keep = keep.to_numpy()
+    order = np.argsort(dates[keep].to_numpy(), kind="stable")
+    return dates[keep].to_numpy()[order], buckets["Total"].to_numpy()[keep][order]
+
+
+def pick_period(stats, start=None, end=None, max_points=MAX_POINTS):
+    """Return the finest date period whose buckets in the range fit in max_points"""
+    for period in DATE_PERIODS:
+        if len(series(stats[period], period, start, end)[0]) <= max_points:
+            return period
+    return DATE_PERIODS[-1]
+
+
+def spending_figure(stats, period, start=None, end=None, max_points=MAX_POINTS):
+    """Line chart of total spending per period between start and end
+
+    period is "day", "week", "month" or "auto" (pick_period()). Returns the
+    figure and the period actually drawn.
+    """
+    if period == "auto":
+        period = pick_period(stats, start, end, max_points)
+    dates, totals = series(stats[period], period, start, end)
+    kept = lttb(dates.astype("datetime64[D]").astype(np.int64), totals, max_points)
+    title = f"{PERIOD_NAMES[period]} Spending"
+    if len(kept) < len(dates):
+        title += f" ({len(kept):,} of {len(dates):,} points shown)"
+    fig = px.line(
+        pd.DataFrame({"Date": dates[kept], "Amount": totals[kept]}),
+        x="Date",
+        y="Amount",
+        title=title,
+        labels={"Amount": "Amount ($)", "Date": "Date"}
+    )
+    fig.update_layout(
+        height=400,
+        yaxis_tickformat="$,.2f"
+    )
+    return fig, period
+
+
+def category_figure(category_totals):
+    """Horizontal bar chart of total spending per category"""
+    fig = px.bar(
+        category_totals,
+        x="Amount",
+        y="Category",
+        orientation="h",
+        title="Total Spending by Category",
+        labels={"Amount": "Amount ($)", "Category": "Category"},
+        color="Amount",
+        color_continuous_scale="Blues"
+    )
+    fig.update_layout(
+        showlegend=False,
+        height=400,
+        xaxis_tickformat="$,.2f"
+    )
+    return fig
@@ -0,0 +1,233 @@
+"""Columnar, memory-mapped snapshot of the web app's expenses.csv.
+
+The snapshot lives in "expenses.csv.columns/" next to the CSV file and holds
+one NumPy file per column:
+
+    id.npy             int64    ID
+    amount_cents.npy   int64    Amount in cents
+    date.npy           int32    Date as days since 1970-01-01 (NO_DATE if not YYYY-MM-DD)
+    category.npy       int16    Category code into categories.json
+    name_offsets.npy   int64    character offsets into names.txt
+
+Rows whose date isn't plain YYYY-MM-DD (rare hand edits such as
+"3/2/2024") keep their date text in odd_dates.json, so totals bucket them
+as the rollups do.
+
+Columns are opened with mmap_mode="r", so aggregates only read the columns
+they touch and nothing is copied until it is used. The snapshot mirrors the
+base CSV file; rows still in the journal are merged in by CsvStore.
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+import aggregate
+from rollups import PERIODS, bucket_of, merge_buckets
+
+SNAPSHOT_SUFFIX = ".columns"
+EPOCH = np.datetime64("1970-01-01", "D")
+# Day number of the rows in odd_dates.json; below every real date
+NO_DATE = np.iinfo(np.int32).min
+
+
+def snapshot_dir(csv_path):
+    """Return the snapshot directory for a CSV file"""
+    return csv_path + SNAPSHOT_SUFFIX
+
+
+def source_stamp(csv_path):
+    """Return the (mtime, size) pair the snapshot was built from"""
+    stat = os.stat(csv_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def day_ordinal(value):
+    """Convert a YYYY-MM-DD date (string or date) to days since 1970-01-01"""
+    return int((np.datetime64(str(value)[:10], "D") - EPOCH).astype(np.int64))
+
+
+def convert(csv_path, out_dir=None):
+    """Build the columnar snapshot from a CSV file with the ID, Name, Amount, Date, Category layout"""
+    import pandas as pd
+
+    import storage
+
+    out_dir = out_dir or snapshot_dir(csv_path)
+    stamp = source_stamp(csv_path)
+    df = pd.read_csv(
+        csv_path,
+        usecols=["ID", "Name", "Amount", "Date", "Category"],
+        dtype={"ID": "int64", "Name": "string", "Amount": "float64", "Category": "string"},
+        keep_default_na=False,
+    )
+    categories = pd.Categorical(df["Category"].astype(str))
+    code_type = np.int16 if len(categories.categories) < np.iinfo(np.int16).max else np.int32
+    names = df["Name"].astype(str).tolist()
+
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "id.npy"), df["ID"].to_numpy(np.int64))
+    np.save(os.path.join(tmp_dir, "amount_cents.npy"), np.rint(df["Amount"].to_numpy() * 100).astype(np.int64))
+    # The same conversion as storage.as_typed(): dates that aren't YYYY-MM-DD become NaT
+    dates = storage.as_typed(df[["Date"]], storage.APP_SCHEMA)["Date"].to_numpy().astype("datetime64[D]")
+    odd = np.isnat(dates)
+    days = (dates - EPOCH).astype(np.int64)
+    days[odd] = NO_DATE
+    np.save(os.path.join(tmp_dir, "date.npy"), days.astype(np.int32))
+    np.save(os.path.join(tmp_dir, "category.npy"), categories.codes.astype(code_type))
+    np.save(os.path.join(tmp_dir, "name_offsets.npy"),
+            np.concatenate([[0], np.cumsum([len(name) for name in names], dtype=np.int64)]))
+    with open(os.path.join(tmp_dir, "names.txt"), "w", encoding="utf-8", newline="") as file:
+        file.write("".join(names))
+    with open(os.path.join(tmp_dir, "categories.json"), "w") as file:
+        json.dump([str(c) for c in categories.categories], file)
+    with open(os.path.join(tmp_dir, "odd_dates.json"), "w") as file:
+        json.dump([[row, str(df["Date"].iat[row])] for row in np.flatnonzero(odd).tolist()], file)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as file:
+        json.dump({"rows": len(df), "source": stamp}, file)
+
+    # Swap the new snapshot in; readers holding the old memmaps keep working
+    old_dir = f"{out_dir}.{os.getpid()}.old"
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return ColumnarTable(out_dir)
+
+
+class ColumnarTable:
+    """Read-only, memory-mapped view of a columnar snapshot"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as file:
+            self.meta = json.load(file)
+        with open(os.path.join(directory, "categories.json")) as file:
+            self.categories = json.load(file)
+        self._columns = {}
+        self._odd_dates = None
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def is_fresh_for(self, csv_path):
+        """Return True if the snapshot still matches the CSV file"""
+        try:
+            return self.meta["source"] == source_stamp(csv_path)
+        except FileNotFoundError:
+            return False
+
+    def column(self, name):
+        """Return a column as a read-only memmap, opening it on first use"""
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.directory, name + ".npy"), mmap_mode="r")
+        return self._columns[name]
+
+    def odd_dates(self):
+        """Return {row: date text} for the rows stored with NO_DATE"""
+        if self._odd_dates is None:
+            try:
+                with open(os.path.join(self.directory, "odd_dates.json")) as file:
+                    self._odd_dates = {row: text for row, text in json.load(file)}
+            except FileNotFoundError:
+                # Snapshots from before odd dates were kept have none
+                self._odd_dates = {}
+        return self._odd_dates
+
+    def names(self):
+        """Return the Name column as a list of strings"""
+        with open(os.path.join(self.directory, "names.txt"), encoding="utf-8", newline="") as file:
+            text = file.read()
+        offsets = self.column("name_offsets").tolist()
+        return [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+    def mask(self, start=None, end=None, category=None, exclude_ids=None):
+        """Return a boolean row mask for the filters, or None if nothing is filtered"""
+        mask = None
+
+        def combine(current, condition):
+            return condition if current is None else current & condition
+
+        if start is not None or end is not None:
+            days = self.column("date")
+            in_range = days != NO_DATE
+            if start is not None:
+                in_range &= days >= day_ordinal(start)
+            if end is not None:
+                in_range &= days <= day_ordinal(end)
+            # NO_DATE rows compare their date text, as CsvStore does for the rows it parses
+            for row, text in self.odd_dates().items():
+                in_range[row] = (start is None or text >= str(start)) and (end is None or text <= str(end))
+            mask = combine(mask, in_range)
+        if category is not None:
+            codes = [i for i, c in enumerate(self.categories) if c.lower() == category.lower()]
+            mask = combine(mask, np.isin(self.column("category"), codes))
+        if exclude_ids:
+            mask = combine(mask, ~np.isin(self.column("id"), np.fromiter(exclude_ids, np.int64)))
+        return mask
+
+    def _select(self, name, mask):
+        values = self.column(name)
+        return values if mask is None else values[mask]
+
+    def summary(self, start=None, end=None, category=None, exclude_ids=None):
+        """Return count, total, mean, min and max of the matching amounts"""
+        cents = self._select("amount_cents", self.mask(start, end, category, exclude_ids))
+        count = len(cents)
+        if count == 0:
+            return {"count": 0, "total": 0.0, "mean": 0.0, "min": None, "max": None}
+        total = int(cents.sum()) / 100
+        return {"count": count, "total": total, "mean": total / count,
+                "min": int(cents.min()) / 100, "max": int(cents.max()) / 100}
+
+    def totals_by(self, period, start=None, end=None, category=None, exclude_ids=None):
+        """Return [(bucket, total, count, min, max)] per day, week, month or category"""
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        mask = self.mask(start, end, category, exclude_ids)
+        days, cents = self._select("date", mask), self._select("amount_cents", mask)
+        codes = self._select("category", mask)
+        odd = days == NO_DATE if period != "category" and self.odd_dates() else None
+        if odd is None or not odd.any():
+            buckets = aggregate.aggregate(days, cents, codes, self.categories, periods=[period])[period]
+            return aggregate.to_rows(buckets)
+        # Rows without a day number go into the buckets their date text falls in, as in the rollups
+        buckets = aggregate.aggregate(days[~odd], cents[~odd], periods=[period])[period]
+        rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        odd_dates = self.odd_dates()
+        for row, value in zip(rows[odd].tolist(), cents[odd].tolist()):
+            merge_buckets(buckets, {bucket_of(period, odd_dates[row], ""): [value, 1, value, value]})
+        return aggregate.to_rows(buckets)
+
+    def to_frame(self, cents=False):
+        """Return the snapshot as a DataFrame in the app's column layout (Amount in int64 cents if cents)"""
+        import pandas as pd
+        amounts = self.column("amount_cents")
+        days = self.column("date")
+        return pd.DataFrame({
+            "ID": self.column("id"),
+            "Name": self.names(),
+            "Amount": amounts if cents else amounts / 100,
+            # NO_DATE rows read as NaT, as in storage.as_typed()
+            "Date": np.where(days == NO_DATE, np.datetime64("NaT", "D"), EPOCH + days.astype(np.int64)),
+            "Category": pd.Categorical.from_codes(self.column("category"), self.categories),
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert expenses.csv into a columnar snapshot")
+    parser.add_argument("path", nargs="?", default="expenses.csv")
+    args = parser.parse_args()
+
+    # Fold the journal in first so the snapshot covers every row
+    import journal
+    import locking
+
+    # Same lock file as the stores' write lock (see storage.ExpenseStore.writing)
+    journal.compact(args.path, "ID", lock=lambda: locking.file_lock(args.path))
+    table = convert(args.path)
+    print(f"Wrote {len(table)} rows to {table.directory}")
@@ -0,0 +1,318 @@
+"""Bulk import of bank and card statement CSV files.
+
+Statements are split at record boundaries into byte ranges that a pool of
+worker processes parse with pandas. Each worker cleans its rows in vectorized
+batches (amount, date, category, name), and the results are deduplicated
+against the rows already stored before being committed with a single
+ExpenseStore.insert_frame() call, both under the store's write lock.
+
+    python importer.py statement.csv [more.csv ...] [--cli] [--workers N]
+"""
+import argparse
+import csv
+import io
+import mmap
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import storage
+
+# Lower-cased statement headers recognised for each field
+COLUMN_ALIASES = {
+    "name": ["name", "description", "payee", "merchant", "memo", "details", "transaction description"],
+    "amount": ["amount", "transaction amount", "amount (usd)"],
+    "debit": ["debit", "withdrawal", "withdrawals", "debit amount"],
+    "date": ["date", "transaction date", "trans. date", "posted date", "post date", "posting date"],
+    "category": ["category", "type of expense"],
+}
+
+# Files smaller than this are parsed in this process
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+CHUNK_ROWS = 250_000
+
+
+def match_columns(header, key=None):
+    """Map each field ("name", "amount", ...) to the statement column that holds it"""
+    lowered = {column.strip().lower(): column for column in header}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                columns[field] = lowered[alias]
+                break
+    if key is not None and key.lower() in lowered:
+        columns["key"] = lowered[key.lower()]
+    missing = [f for f in ("name", "date") if f not in columns]
+    if "amount" not in columns and "debit" not in columns:
+        missing.append("amount")
+    if missing:
+        raise ValueError(f"Statement has no column for: {', '.join(missing)}")
+    return columns
+
+
+def parse_amounts(values):
+    """Turn "$1,234.50", "(12.00)" and "-3" style strings into floats (NaN if invalid)"""
+    text = values.astype(str).str.strip()
+    negative = text.str.startswith("(") & text.str.endswith(")")
+    text = text.str.replace(r"[$,()\s]", "", regex=True)
+    amounts = pd.to_numeric(text, errors="coerce")
+    return amounts.where(~negative, -amounts)
+
+
+def parse_dates(values):
+    """Parse dates to YYYY-MM-DD strings (None if invalid), trying one inferred format first"""
+    text = values.astype(str).str.strip()
+    dates = pd.to_datetime(text, errors="coerce")
+    retry = dates.isna() & (text != "")
+    if retry.any():
+        dates[retry] = pd.to_datetime(text[retry], format="mixed", errors="coerce")
+    return dates.dt.strftime("%Y-%m-%d")
+
+
+def normalize(raw, columns, debits="negative", categories=None):
+    """Clean one chunk of statement rows
+
+    Returns a DataFrame with name, amount, date, category (and key when the
+    statement has one) holding only valid expenses, plus counts of the rows
+    dropped as invalid or as credits.
+    """
+    if "amount" in columns:
+        amounts = parse_amounts(raw[columns["amount"]])
+        # Payments and refunds carry the opposite sign to purchases
+        credit = amounts > 0 if debits == "negative" else amounts < 0
+        amounts = amounts.abs()
+    else:
+        # Separate Debit/Credit columns: rows without a debit are payments or refunds
+        debit = raw[columns["debit"]].astype(str).str.strip()
+        amounts = parse_amounts(debit).abs()
+        credit = debit.eq("")
+
+    names = raw[columns["name"]].astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+    frame = pd.DataFrame({
+        "name": names,
+        "amount": amounts.round(2),
+        "date": parse_dates(raw[columns["date"]]),
+    }, index=raw.index)
+
+    if "category" in columns:
+        labels = raw[columns["category"]].astype(str).str.strip()
+    else:
+        labels = pd.Series("", index=raw.index)
+    if categories:
+        # Match the app's categories case-insensitively; anything else is "Other"
+        known = {c.lower(): c for c in categories}
+        frame["category"] = labels.str.lower().map(known).fillna("Other")
+    else:
+        frame["category"] = labels.where(labels != "", "Other")
+    if "key" in columns:
+        frame["key"] = raw[columns["key"]].astype(str).str.strip()
+
+    valid = frame["name"].ne("") & frame["amount"].gt(0) & frame["date"].notna()
+    keep = valid & ~credit
+    return frame[keep], {"invalid": int((~valid & ~credit).sum()), "credits": int(credit.sum())}
+
+
+def _read_header(path):
+    """Return the header row and the byte offset where the data starts"""
+    with open(path, "rb") as file:
+        line = file.readline()
+        start = file.tell()
+    header = next(csv.reader([line.decode("utf-8-sig")]))
+    return header, start
+
+
+def _record_end(data, position):
+    """Return the offset just after the CSV record that starts at position in data"""
+    end = position
+
+    def lines():
+        nonlocal end
+        while end < len(data):
+            newline = data.find(b"\n", end)
+            stop = newline + 1 if newline >= 0 else len(data)
+            line, end = data[end:stop], stop
+            yield line.decode("utf-8", errors="replace")
+
+    # The csv module reads only as many lines as the record (quoted fields included) spans
+    next(csv.reader(lines()), None)
+    return end
+
+
+def _record_start(data, position, target):
+    """Return the first record start at or after target, scanning from the record start at position"""
+    while True:
+        newline = data.find(b"\n", target)
+        cut = newline + 1 if newline >= 0 else len(data)
+        quote = data.find(b'"', position, cut)
+        if quote < 0:
+            # No quotes up to the cut, so every line ends a record
+            return cut
+        line_start = max(data.rfind(b"\n", position, quote) + 1, position)
+        if line_start >= target:
+            return line_start
+        position = _record_end(data, line_start)
+        if position >= target:
+            return position
+
+
+def _split(path, start, parts):
+    """Split a file's data section into byte ranges that begin at record starts"""
+    size = os.path.getsize(path)
+    bounds = [start]
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for i in range(1, parts):
+            target = max(start + (size - start) * i // parts, bounds[-1])
+            bounds.append(_record_start(data, bounds[-1], target))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _parse_range(path, header, byte_range, columns, debits, categories):
+    """Worker: parse and normalize the rows in one byte range of a statement"""
+    start, end = byte_range
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    raw = pd.read_csv(io.BytesIO(data), header=None, names=header, dtype=str,
+                      keep_default_na=False, skipinitialspace=True)
+    return normalize(raw, columns, debits, categories)
+
+
+def _guess_debits(path, columns):
+    """Decide whether purchases are the negative or positive amounts from a sample"""
+    if "amount" not in columns:
+        return "positive"
+    sample = pd.read_csv(path, usecols=[columns["amount"]], dtype=str, nrows=10_000,
+                         keep_default_na=False, encoding="utf-8-sig")
+    amounts = parse_amounts(sample[columns["amount"]])
+    return "negative" if (amounts < 0).sum() > (amounts > 0).sum() else "positive"
+
+
+def read_statement(path, schema, debits="auto", categories=None, workers=None):
+    """Parse one statement file into normalized rows, in parallel for large files"""
+    header, start = _read_header(path)
+    # Statement IDs can't become the app's integer IDs, so only text keys are matched
+    columns = match_columns(header, None if schema.numeric_key else schema.key)
+    if debits == "auto":
+        debits = _guess_debits(path, columns)
+    workers = workers or os.cpu_count() or 1
+
+    if workers > 1 and os.path.getsize(path) >= PARALLEL_MIN_BYTES:
+        ranges = _split(path, start, workers * 4)
+        # Spawned workers only import this module, not the Streamlit app
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(_parse_range, *zip(*[
+                (path, header, r, columns, debits, categories) for r in ranges])))
+    else:
+        chunks = pd.read_csv(path, header=0, names=header, dtype=str, keep_default_na=False,
+                             skipinitialspace=True, encoding="utf-8-sig", chunksize=CHUNK_ROWS)
+        results = [normalize(chunk, columns, debits, categories) for chunk in chunks]
+
+    frames = [frame for frame, _ in results]
+    report = {"invalid": sum(r["invalid"] for _, r in results),
+              "credits": sum(r["credits"] for _, r in results)}
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=["name", "amount", "date", "category"])
+    return frame, report
+
+
+def _fingerprints(names, cents, dates):
+    """Identify a transaction by its YYYY-MM-DD date, name and amount in cents"""
+    return dates.astype(str) + "\x1f" + names.astype(str) + "\x1f" + cents.astype("int64").astype(str)
+
+
+def deduplicate(frame, store):
+    """Drop rows that are already stored
+
+    Rows with a key are matched on the key. Others are matched on date, name
+    and amount, counting repeats: importing a statement with two identical
+    coffees twice still stores exactly two. Only the stored keys, or the
+    stored rows within the statement's dates, are read.
+    """
+    s = store.schema
+    if "key" in frame.columns:
+        known = set(store.typed_frame(columns=[s.key])[s.key].astype(str))
+        return frame[~frame["key"].isin(known) & ~frame["key"].duplicated()]
+
+    # The same rounding to cents as storage.as_typed()
+    incoming = _fingerprints(frame["name"], (frame["amount"] * 100).round(), frame["date"])
+    # The partitioned backend reads only the statement's months, SQLite only its dates
+    existing = store.typed_frame(columns=[s.name, s.amount, s.date],
+                                 start=frame["date"].min(), end=frame["date"].max())
+    if existing.empty:
+        return frame
+    stored = _fingerprints(existing[s.name], existing[s.amount], existing[s.date].dt.strftime("%Y-%m-%d"))
+    already = incoming.map(stored.value_counts()).fillna(0)
+    seen = incoming.groupby(incoming).cumcount()
+    return frame[seen >= already]
+
+
+def to_schema(frame, schema):
+    """Lay normalized rows out in a store's columns, leaving numeric keys for the store"""
+    rows = pd.DataFrame({
+        schema.name: frame["name"].to_numpy(),
+        schema.amount: frame["amount"].to_numpy(),
+        schema.date: frame["date"].to_numpy(),
+        schema.category: frame["category"].to_numpy(),
+    })
+    if "key" in frame.columns:
+        rows[schema.key] = frame["key"].to_numpy()
+    elif not schema.numeric_key:
+        rows[schema.key] = [str(uuid.uuid4()) for _ in range(len(rows))]
+    if schema is storage.CLI_SCHEMA:
+        rows["type"] = "Transaction"
+    return rows.reindex(columns=[f for f in schema.fields if f in rows.columns or f != schema.key],
+                        fill_value="")
+
+
+def import_statements(store, paths, debits="auto", categories=None, workers=None):
+    """Import statement files into a store and return counts of what happened"""
+    frames = []
+    report = {"read": 0, "imported": 0, "duplicates": 0, "invalid": 0, "credits": 0}
+    for path in paths:
+        frame, counts = read_statement(path, store.schema, debits, categories, workers)
+        frames.append(frame)
+        report["invalid"] += counts["invalid"]
+        report["credits"] += counts["credits"]
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    report["read"] = len(frame) + report["invalid"] + report["credits"]
+    if frame.empty:
+        return report
+
+    # Another writer could store the same rows between the check and the insert
+    with store.writing():
+        fresh = deduplicate(frame, store)
+        report["duplicates"] = len(frame) - len(fresh)
+        if not fresh.empty:
+            report["imported"] = store.insert_frame(to_schema(fresh, store.schema))
+    return report
+
+
+def format_report(report):
+    """Describe an import_statements() result in one line"""
+    return (f"Imported {report['imported']} of {report['read']} rows "
+            f"({report['duplicates']} duplicates, {report['credits']} credits and "
+            f"{report['invalid']} invalid rows skipped)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import bank or card statement CSV files")
+    parser.add_argument("statements", nargs="+")
+    parser.add_argument("--path", default="expenses.csv", help="expense file to import into")
+    parser.add_argument("--cli", action="store_true", help="the file uses the command-line app's layout")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--debits", choices=["auto", "negative", "positive"], default="auto",
+                        help="sign of purchases in the Amount column")
+    parser.add_argument("--categories", default=None,
+                        help="comma-separated categories to map onto (others become Other)")
+    args = parser.parse_args()
+
+    store = storage.open_store(args.path, storage.CLI_SCHEMA if args.cli else storage.APP_SCHEMA)
+    categories = args.categories.split(",") if args.categories else None
+    print(format_report(import_statements(store, args.statements, args.debits, categories, args.workers)))
+    store.compact()
@@ -0,0 +1,279 @@
+"""Append-only journal for the expense CSV files.
+
+New, modified and deleted rows are appended to "<file>.journal" instead of
+rewriting the whole CSV on every change. Readers merge the base file with
+the journal, and compact() folds the journal back into the base file when
+it gets large. Readers don't lock anything: consistent_read() reads the
+journals before the base file and starts over if a compaction moved the
+files in the meantime.
+"""
+import argparse
+import csv
+import os
+import threading
+from contextlib import nullcontext
+
+import locking
+
+JOURNAL_SUFFIX = ".journal"
+COMPACTING_SUFFIX = ".compacting"
+
+# Journal size (in bytes) that triggers a background compaction
+COMPACT_THRESHOLD = 4 * 1024 * 1024
+
+# Reads retried this many times while compactions keep moving the files are
+# done under the compaction lock instead
+READ_ATTEMPTS = 20
+
+_compact_lock = threading.Lock()
+
+
+def journal_path(path):
+    """Return the live journal path for a data file"""
+    return path + JOURNAL_SUFFIX
+
+
+def journal_files(path):
+    """Return the existing journal files for a data file, oldest first"""
+    live = journal_path(path)
+    candidates = [live + COMPACTING_SUFFIX, live]
+    return [p for p in candidates if os.path.exists(p)]
+
+
+def snapshot(path):
+    """Return the data file and its journal files with their inodes, which every compaction changes"""
+    live = journal_path(path)
+    files = []
+    for fpath in [path, live + COMPACTING_SUFFIX, live]:
+        try:
+            files.append((fpath, os.stat(fpath).st_ino))
+        except FileNotFoundError:
+            continue
+    return tuple(files)
+
+
+def consistent_read(path, read, discard=None):
+    """Return read(journals) for the journal files, oldest first, as of one moment
+
+    read() must read the journals before the base file. A compaction only
+    moves journaled rows into the base file, so the base file read afterwards
+    never misses them; if a journal vanishes or the files are swapped under
+    read(), it is called again. discard, if given, is called with the result
+    of a read that was thrown away (e.g. to close a file).
+    """
+    for _ in range(READ_ATTEMPTS):
+        before = snapshot(path)
+        try:
+            result = read([fpath for fpath, _ in before if fpath != path])
+        except FileNotFoundError:
+            continue
+        if snapshot(path) == before:
+            return result
+        if discard is not None:
+            discard(result)
+    # Compactions hold this lock from renaming the journal to removing it
+    with _compact_lock, locking.file_lock(path + ".compact"):
+        return read(journal_files(path))
+
+
+def append_record(path, fieldnames, row, op="insert"):
+    """Append one insert or update record to the journal"""
+    append_records(path, fieldnames, [row], op)
+
+
+def append_records(path, fieldnames, rows, op="insert"):
+    """Append several insert, update or delete records to the journal in one write"""
+    with open(journal_path(path), mode="a", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=["op"] + list(fieldnames), extrasaction="ignore")
+        if file.tell() == 0:
+            writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row, op=op))
+
+
+def append_frame(path, fieldnames, frame, op="insert"):
+    """Append a pandas DataFrame of insert or update records to the journal in one write"""
+    records = frame.reindex(columns=list(fieldnames))
+    records.insert(0, "op", op)
+    with open(journal_path(path), mode="a", newline="") as file:
+        records.to_csv(file, header=file.tell() == 0, index=False, lineterminator="\r\n")
+
+
+def _read_records(files):
+    for jpath in files:
+        with open(jpath, mode="r", newline="") as file:
+            for row in csv.DictReader(file):
+                op = row.pop("op")
+                yield op, row
+
+
+def read_journal(path, files=None):
+    """Yield (op, row) pairs from the journal files in write order"""
+    if files is not None:
+        return _read_records(files)
+    return iter(consistent_read(path, lambda journals: list(_read_records(journals))))
+
+
+def _open_merged(path, key, files):
+    """Return the pending journal records by key and the open base file (or None)"""
+    # Journal records are upserts keyed by `key`; the last one wins, and "delete" drops the row
+    pending = {}
+    for op, row in _read_records(files):
+        pending[row[key]] = None if op == "delete" else row
+    base = open(path, mode="r", newline="") if os.path.exists(path) else None
+    return pending, base
+
+
+def _close_merged(opened):
+    if opened[1] is not None:
+        opened[1].close()
+
+
+def iter_merged(path, key, files=None):
+    """Yield the base rows with the journal applied on top of them"""
+    if files is None:
+        pending, base = consistent_read(path, lambda journals: _open_merged(path, key, journals), _close_merged)
+    else:
+        pending, base = _open_merged(path, key, files)
+
+    # The open base file stays readable even if a compaction replaces it now
+    if base is not None:
+        with base:
+            for row in csv.DictReader(base):
+                merged = pending.pop(row[key], row)
+                if merged is not None:
+                    yield merged
+
+    # Whatever is left was inserted after the last compaction
+    yield from (row for row in pending.values() if row is not None)
+
+
+def read_header(path):
+    """Return the column names of the base file or its journal"""
+    for candidate in [path] + journal_files(path):
+        try:
+            with open(candidate, mode="r", newline="") as file:
+                header = next(csv.reader(file), None)
+        except FileNotFoundError:
+            continue
+        if header:
+            return [name for name in header if name != "op"]
+    return []
+
+
+def write_snapshot(path, fieldnames, rows):
+    """Atomically replace the base file with the given rows"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode="w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def sync(path):
+    """Flush the data file and its journals to disk, so finished writes survive a crash"""
+    for fpath in [path] + journal_files(path):
+        # Opened without O_CREAT, so a missing base file isn't created empty
+        try:
+            fd = os.open(fpath, os.O_WRONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    # A newly created journal also needs its directory entry on disk (POSIX only)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def discard(path):
+    """Drop all journal files, e.g. after a full snapshot has been written"""
+    for jpath in journal_files(path):
+        try:
+            os.remove(jpath)
+        except FileNotFoundError:
+            pass
+
+
+def compact(path, key, fieldnames=None, on_compacted=None, lock=None):
+    """Fold the journal into the base file and start a fresh journal
+
+    on_compacted, if given, is called with the path once the new base file
+    is in place (e.g. to refresh files derived from it). lock, if given, is
+    a context manager factory held for the whole compaction (e.g. the
+    store's write lock); it is taken before the compaction lock.
+    """
+    # The file lock keeps compactions in other processes from claiming the same journal
+    with lock() if lock is not None else nullcontext(), _compact_lock, locking.file_lock(path + ".compact"):
+        live = journal_path(path)
+        compacting = live + COMPACTING_SUFFIX
+
+        # Without a lock, writers keep appending to a new journal while we compact the old one
+        if not os.path.exists(compacting):
+            if not os.path.exists(live):
+                return False
+            os.replace(live, compacting)
+
+        if fieldnames is None:
+            fieldnames = read_header(path)
+        write_snapshot(path, fieldnames, iter_merged(path, key, files=[compacting]))
+
+        # Replaying the journal on top of the new base is harmless, so a crash
+        # before this point only costs a redundant compaction next time
+        try:
+            os.remove(compacting)
+        except FileNotFoundError:
+            pass
+        if on_compacted is not None:
+            on_compacted(path)
+        return True
+
+
+def needs_compaction(path, threshold=COMPACT_THRESHOLD):
+    """Return True if the journal has grown past threshold and no compaction is running"""
+    try:
+        size = os.path.getsize(journal_path(path))
+    except OSError:
+        return False
+    return size >= threshold and not _compact_lock.locked()
+
+
+def maybe_compact(path, key, fieldnames=None, threshold=COMPACT_THRESHOLD, on_compacted=None, lock=None):
+    """Start a background compaction once the journal grows past threshold"""
+    if not needs_compaction(path, threshold):
+        return None
+
+    def run():
+        with lock() if lock is not None else nullcontext():
+            # Another thread may have compacted the journal while this one waited for the lock
+            if needs_compaction(path, threshold):
+                compact(path, key, fieldnames, on_compacted)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact an expense file's journal into its base CSV")
+    parser.add_argument("path", nargs="?", default="expenses.csv")
+    parser.add_argument("--key", default=None, help="key column (default: ID or transaction_id)")
+    args = parser.parse_args()
+
+    key = args.key
+    if key is None:
+        key = "transaction_id" if "transaction_id" in read_header(args.path) else "ID"
+    # Same lock file as the stores' write lock (see storage.ExpenseStore.writing)
+    if compact(args.path, key, lock=lambda: locking.file_lock(args.path)):
+        print(f"Compacted journal into {args.path}")
+    else:
+        print("Nothing to compact.")
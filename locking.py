@@ -0,0 +1,87 @@
+"""Cross-process locking and ID sequences for the file-based stores.
+
+Several Streamlit sessions, app servers or command-line runs can write to
+the same expense files. file_lock() serializes them with an advisory lock
+on a "<file>.lock" file, and Sequence hands out integer IDs from a small
+"<file>.seq" counter file instead of scanning every row for the highest ID.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+LOCK_SUFFIX = ".lock"
+SEQUENCE_SUFFIX = ".seq"
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive advisory lock on "<path>.lock" (blocks until it is free)"""
+    with open(path + LOCK_SUFFIX, "a+b") as file:
+        if os.name == "nt":
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class Sequence:
+    """Persistent counter of the next free integer ID
+
+    seed is called to find the highest existing ID the first time (or after
+    reset()); after that allocating is a read and write of one small file.
+    Callers must hold the store's file_lock().
+    """
+
+    def __init__(self, path, seed):
+        self.path = path + SEQUENCE_SUFFIX
+        self.seed = seed
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                return int(file.read().strip())
+        except (FileNotFoundError, ValueError):
+            return self.seed() + 1
+
+    def _write(self, value):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(str(value))
+        os.replace(tmp_path, self.path)
+
+    def allocate(self, count=1):
+        """Reserve count consecutive IDs and return the first one"""
+        first = self._read()
+        self._write(first + count)
+        return first
+
+    def advance(self, highest):
+        """Make sure IDs up to highest (e.g. ones given explicitly) are never handed out"""
+        if self._read() <= highest:
+            self._write(highest + 1)
+
+    def reset(self):
+        """Forget the counter so the next allocation reseeds from the data"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,135 @@
+"""Month partitions and their manifest for the partitioned storage backend.
+
+storage.PartitionedStore keeps one CSV file (with its own journal) per
+month in a "<name>.parts" folder next to the data file: "2024-03.csv" holds
+every transaction dated March 2024, and rows whose date isn't YYYY-MM-DD go
+to "undated.csv". The folder's manifest.json records, for each partition,
+its first and last date, its row count and the total, count, min and max
+(in cents) of each category, together with the version of the partition's
+files it was computed from. A stale entry is recomputed from that one
+partition the next time it is needed.
+"""
+import json
+import os
+import re
+from datetime import date as date_type
+
+from rollups import _jsonable, merge_buckets, to_cents
+
+UNDATED = "undated"
+MANIFEST_FILE = "manifest.json"
+
+# A partition's base file and its journals; lock and temp files don't match
+PARTITION_FILE = re.compile(r"^(\d{4}-\d{2}|" + UNDATED + r")\.csv(\.journal(\.compacting)?)?$")
+
+
+def partition_of(row_date):
+    """Return the partition ("2024-03") a row's date falls in, or "undated" if it isn't YYYY-MM-DD"""
+    text = str(row_date)
+    if len(text) != 10:
+        return UNDATED
+    try:
+        date_type.fromisoformat(text)
+    except ValueError:
+        return UNDATED
+    return text[:7]
+
+
+def overlaps(name, start=None, end=None):
+    """Return True if the partition may hold dates from start to end (inclusive)
+
+    Dates are compared as text, as ExpenseStore._matches() does, so the
+    undated partition always has to be read when there is a date filter.
+    """
+    if name == UNDATED:
+        return True
+    if start is not None and name < str(start)[:7]:
+        return False
+    if end is not None and name > str(end)[:7]:
+        return False
+    return True
+
+
+def covers(entry, start=None, end=None):
+    """Return True if every row of a manifest entry falls between start and end"""
+    if start is None and end is None:
+        return True
+    if entry["min"] is None:
+        return entry["rows"] == 0
+    return ((start is None or entry["min"] >= str(start))
+            and (end is None or entry["max"] <= str(end)))
+
+
+def new_entry():
+    """Return the manifest entry of an empty partition"""
+    return {"version": None, "min": None, "max": None, "rows": 0, "categories": {}}
+
+
+def add_row(entry, amount, row_date, category):
+    """Count one row in a manifest entry"""
+    cents = to_cents(amount)
+    row_date = str(row_date)
+    if partition_of(row_date) != UNDATED:
+        entry["min"] = row_date if entry["min"] is None else min(entry["min"], row_date)
+        entry["max"] = row_date if entry["max"] is None else max(entry["max"], row_date)
+    entry["rows"] += 1
+    merge_buckets(entry["categories"], {str(category): [cents, 1, cents, cents]})
+
+
+def category_totals(entry, category=None):
+    """Return {category: [total, count, min, max]} in cents, limited to one category (any case) if given"""
+    if category is None:
+        return entry["categories"]
+    return {name: bucket for name, bucket in entry["categories"].items() if name.lower() == category.lower()}
+
+
+def summarize(buckets):
+    """Return count, total, mean, min and max (in dollars) of {bucket: [total, count, min, max]} cents"""
+    buckets = [bucket for bucket in buckets.values() if bucket[1]]
+    count = sum(bucket[1] for bucket in buckets)
+    total = sum(bucket[0] for bucket in buckets) / 100
+    return {"count": count, "total": total, "mean": total / count if count else 0.0,
+            "min": min(bucket[2] for bucket in buckets) / 100 if count else None,
+            "max": max(bucket[3] for bucket in buckets) / 100 if count else None}
+
+
+class Manifest:
+    """Per-partition date range, row count and category totals, persisted as JSON"""
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.entries = {}
+
+    @classmethod
+    def load(cls, folder):
+        """Read the manifest, or return an empty one if there is none"""
+        manifest = cls(folder)
+        try:
+            with open(manifest.path) as file:
+                manifest.entries = json.load(file)["partitions"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        return manifest
+
+    def save(self):
+        """Atomically write the manifest"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"partitions": self.entries}, file)
+        os.replace(tmp_path, self.path)
+
+    def current(self, name, version):
+        """Return a partition's entry if it matches the partition's version, else None"""
+        entry = self.entries.get(name)
+        if entry is None or entry["version"] != _jsonable(version):
+            return None
+        return entry
+
+    def set(self, name, version, entry):
+        """Store a partition's entry as of the given version"""
+        entry["version"] = _jsonable(version)
+        self.entries[name] = entry
+
+    def drop(self, name):
+        """Forget a partition's entry so it is recomputed on the next read"""
+        self.entries.pop(name, None)
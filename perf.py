@@ -0,0 +1,154 @@
+"""Opt-in timing of the apps' hot paths.
+
+Set EXPENSE_PERF=1 to record the wall time, rows processed and memory
+(resident set size) change of every page render, storage call and other
+marked stage. Set EXPENSE_PERF_LOG to a file name to also append each
+record to that file as a line of JSON. When EXPENSE_PERF is not set,
+timed() returns functions unchanged and stage() does nothing, so the
+instrumentation costs nothing (inspect and json are not even imported).
+"""
+import functools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("EXPENSE_PERF", "").lower() not in ("", "0", "false", "no")
+LOG_PATH = os.environ.get("EXPENSE_PERF_LOG") or None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def rss():
+    """Return this process's resident memory in bytes, or None if it can't be read"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def begin_run(label):
+    """Start collecting the records of one page render or command on this thread"""
+    _local.run = label
+    _local.records = []
+    _local.depth = 0
+
+
+def records():
+    """Return the records collected on this thread since begin_run(), in the order they started"""
+    return sorted(getattr(_local, "records", []), key=lambda r: r["started"])
+
+
+def _record(record):
+    collected = getattr(_local, "records", None)
+    if collected is not None:
+        collected.append(record)
+    if LOG_PATH:
+        import json
+        line = json.dumps(dict(record, run=getattr(_local, "run", None), at=time.time()))
+        with _log_lock, open(LOG_PATH, "a") as file:
+            file.write(line + "\n")
+
+
+@contextmanager
+def stage(name, rows=None):
+    """Time a block; the yielded dict can be given "rows" once the count is known"""
+    if not ENABLED:
+        yield {}
+        return
+    info = {"rows": rows}
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    memory = rss()
+    started = time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - started
+        after = rss()
+        _local.depth = depth
+        _record({"stage": name, "started": started, "seconds": seconds, "rows": info["rows"], "depth": depth,
+                 "memory_delta": None if memory is None or after is None else after - memory})
+
+
+def _count(result, rows):
+    if rows is not None:
+        return rows(result)
+    if isinstance(result, (str, bytes, dict)):
+        return None
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def timed(fn=None, *, name=None, rows=None):
+    """Decorate a function so each call is recorded as a stage
+
+    rows, if given, computes the row count from the return value (the
+    default is len() when the result has one). Generator functions are
+    timed until they are exhausted and count the items they yield.
+    """
+    if fn is None:
+        return functools.partial(timed, name=name, rows=rows)
+    if not ENABLED:
+        return fn
+    import inspect
+    label = name or fn.__qualname__
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator(*args, **kwargs):
+            with stage(label) as info:
+                count = 0
+                for item in fn(*args, **kwargs):
+                    count += 1
+                    yield item
+                info["rows"] = count
+        return generator
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with stage(label) as info:
+            result = fn(*args, **kwargs)
+            info["rows"] = _count(result, rows)
+        return result
+    return wrapper
+
+
+def format_bytes(value):
+    """Format a byte count (possibly negative) for display"""
+    if value is None:
+        return "n/a"
+    sign = "-" if value < 0 else "+"
+    value = abs(value)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{sign}{value:.0f} {unit}" if unit == "B" else f"{sign}{value:.1f} {unit}"
+        value /= 1024
+
+
+def format_report(collected=None):
+    """Return the records as indented lines of text, one per stage"""
+    lines = []
+    for record in records() if collected is None else collected:
+        rows = "" if record["rows"] is None else f", {record['rows']} rows"
+        lines.append(f"{'  ' * record['depth']}{record['stage']}: {record['seconds'] * 1000:.1f} ms"
+                     f"{rows}, {format_bytes(record['memory_delta'])}")
+    return "\n".join(lines)
+
+
+def print_report(file=sys.stderr):
+    """Print this thread's records (used by the command-line app on exit)"""
+    if ENABLED and records():
+        print("Performance:\n" + format_report(), file=file)
@@ -0,0 +1,300 @@
+"""Filter expressions for the expense apps.
+
+A query is a list of conditions joined with "and", optionally followed by
+"sort <field> [asc|desc]" and "limit <n>":
+
+    category=food and date>=2024-01-01 and amount>50 sort amount desc limit 20
+
+A condition compares a field with a value using =, !=, <, <=, >, >= or ~
+(contains). Text comparisons ignore case, and values with spaces go in
+quotes. Fields are the schema's columns by name (any case, "_" for a
+space) plus the aliases id, name, amount, date and category.
+
+parse() turns the text into a Query. run() plans it against a store:
+
+* an id= condition is one store.get() instead of a read of every row
+* date bounds and a category= condition go to store.typed_frame(), so the
+  partitioned backend reads only the months in range and SQLite filters
+  with its indexes
+* a ~ condition on a searchable text field narrows the rows through the
+  store's trigram index (see textindex.py)
+
+Whatever is left is evaluated as boolean masks over the typed columns (see
+storage.as_typed) in one pass, and sort/limit select the rows to return
+without sorting more than they need.
+"""
+import math
+import operator
+import re
+from datetime import date as date_type
+from datetime import timedelta
+
+COMPARISONS = {"=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+               ">": operator.gt, ">=": operator.ge}
+
+# A quoted value, an operator, or a bare word
+TOKEN = re.compile(r'\s*(?:"([^"]*)"|\'([^\']*)\'|(!=|>=|<=|=|<|>|~)|([^\s=!<>~"\']+))')
+
+# Below this many rows a mask is as quick as asking the trigram index
+INDEX_ROWS = 10_000
+
+
+class QueryError(ValueError):
+    """Raised for a query that can't be parsed"""
+
+
+class Condition:
+    """One comparison of a field with a value (cents for amounts, a date for dates)"""
+
+    def __init__(self, field, op, value, kind):
+        self.field = field
+        self.op = op
+        self.value = value
+        # "amount", "date", "key" or "text"
+        self.kind = kind
+
+
+class Query:
+    """Parsed query: conditions that must all hold, then an optional sort and limit"""
+
+    def __init__(self, conditions=(), sort=None, descending=False, limit=None):
+        self.conditions = list(conditions)
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+
+
+def tokenize(text):
+    """Split a query into (kind, text) tokens: "value" for quoted text, "op" and "word" otherwise"""
+    tokens, position = [], 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise QueryError(f"Can't read the query from '{text[position:].strip()}'")
+        quoted = match.group(1) if match.group(1) is not None else match.group(2)
+        if quoted is not None:
+            tokens.append(("value", quoted))
+        elif match.group(3) is not None:
+            tokens.append(("op", match.group(3)))
+        else:
+            tokens.append(("word", match.group(4)))
+        position = match.end()
+    return tokens
+
+
+def resolve(schema, word):
+    """Return the schema column a field name or alias refers to"""
+    aliases = {"id": schema.key, "name": schema.name, "amount": schema.amount,
+               "date": schema.date, "category": schema.category}
+    wanted = word.lower().replace("_", " ")
+    if wanted in aliases:
+        return aliases[wanted]
+    for field in schema.fields:
+        if field.lower() == wanted:
+            return field
+    names = sorted(set(aliases) | {field.lower().replace(" ", "_") for field in schema.fields})
+    raise QueryError(f"Unknown field '{word}'; use one of: {', '.join(names)}")
+
+
+def kind_of(schema, field):
+    """Return how a field's values are compared: "amount", "date", "key" or "text" """
+    return {schema.amount: "amount", schema.date: "date", schema.key: "key"}.get(field, "text")
+
+
+def convert(schema, field, op, text):
+    """Return a condition's value in the typed column's units, or raise QueryError"""
+    kind = kind_of(schema, field)
+    if kind == "amount":
+        try:
+            cents = float(text.lstrip("$")) * 100
+        except ValueError:
+            cents = math.nan
+        # inf, nan and amounts too big for cents aren't amounts either
+        if not math.isfinite(cents):
+            raise QueryError(f"'{text}' is not an amount")
+        return round(cents)
+    if kind == "date":
+        try:
+            return date_type.fromisoformat(text)
+        except ValueError:
+            raise QueryError(f"'{text}' is not a date (use YYYY-MM-DD)") from None
+    if op not in ("=", "!=", "~"):
+        raise QueryError(f"'{op}' only works with amount and date")
+    if kind == "key" and schema.numeric_key and op != "~":
+        try:
+            return int(text)
+        except ValueError:
+            raise QueryError(f"'{text}' is not an ID") from None
+    return text
+
+
+def parse(text, schema):
+    """Parse a query for a storage.Schema, raising QueryError with a readable message"""
+    tokens = tokenize(text)
+    query = Query()
+    position = 0
+
+    def take(expected=None):
+        nonlocal position
+        if position >= len(tokens):
+            raise QueryError(f"The query ends early; expected {expected or 'more'}")
+        token = tokens[position]
+        position += 1
+        return token
+
+    def keyword():
+        return tokens[position][1].lower() if position < len(tokens) and tokens[position][0] == "word" else None
+
+    while position < len(tokens) and keyword() not in ("sort", "limit"):
+        if query.conditions:
+            if keyword() != "and":
+                raise QueryError(f"Expected 'and', 'sort' or 'limit' before '{tokens[position][1]}'")
+            take()
+        kind, word = take("a field")
+        if kind != "word":
+            raise QueryError(f"Expected a field name, not '{word}'")
+        field = resolve(schema, word)
+        kind, op = take("an operator")
+        if kind != "op":
+            raise QueryError(f"Expected an operator (=, !=, <, <=, >, >=, ~) after '{word}'")
+        kind, value = take("a value")
+        if kind == "op":
+            raise QueryError(f"Expected a value after '{word} {op}'")
+        if op == "~" and kind_of(schema, field) in ("amount", "date"):
+            raise QueryError(f"'~' only works with text fields, not {word}")
+        query.conditions.append(Condition(field, op, convert(schema, field, op, value), kind_of(schema, field)))
+
+    while position < len(tokens):
+        word = keyword()
+        take()
+        if word == "sort" and query.sort is None:
+            kind, name = take("a field to sort by")
+            query.sort = resolve(schema, name)
+            if keyword() in ("asc", "desc"):
+                query.descending = take()[1].lower() == "desc"
+        elif word == "limit" and query.limit is None:
+            kind, count = take("a number of rows")
+            if not count.isdigit():
+                raise QueryError(f"'{count}' is not a number of rows")
+            query.limit = int(count)
+        else:
+            raise QueryError(f"Unexpected '{tokens[position - 1][1]}' after the conditions")
+    return query
+
+
+def _add_days(value, days):
+    """Return a date moved by days, or the same date past date.min or date.max"""
+    try:
+        return value + timedelta(days=days)
+    except OverflowError:
+        return value
+
+
+def scope(query, schema):
+    """Return the (start, end, category) every matching row falls in, for store.typed_frame()"""
+    start = end = category = None
+    for condition in query.conditions:
+        value = condition.value
+        if condition.field == schema.date:
+            # A bound clamped at the end of the calendar reads one day too many; the mask drops it
+            low = {">=": value, ">": _add_days(value, 1), "=": value}.get(condition.op)
+            high = {"<=": value, "<": _add_days(value, -1), "=": value}.get(condition.op)
+            if low is not None:
+                start = low if start is None else max(start, low)
+            if high is not None:
+                end = high if end is None else min(end, high)
+        elif condition.field == schema.category and condition.op == "=" and category is None:
+            category = value
+    return start, end, category
+
+
+def _text_mask(column, op, value):
+    """Compare a text or categorical column with a value, ignoring case"""
+    import pandas as pd
+
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Test each distinct value once, then look the rows up by category
+        names = column.cat.categories.astype(str)
+        return column.isin(column.cat.categories[_text_mask(pd.Series(names), op, value).to_numpy()])
+    column = column.astype(object).where(column.notna(), "").astype(str)
+    if op == "~":
+        return column.str.contains(value, case=False, regex=False)
+    equal = column.str.lower() == value.lower()
+    return equal if op == "=" else ~equal
+
+
+def condition_mask(condition, frame):
+    """Return a boolean array of the typed rows that satisfy one condition"""
+    import pandas as pd
+
+    column = frame[condition.field]
+    if condition.kind == "text" or (condition.kind == "key" and isinstance(condition.value, str)):
+        return _text_mask(column, condition.op, condition.value).to_numpy()
+    value = pd.Timestamp(condition.value) if condition.kind == "date" else condition.value
+    return COMPARISONS[condition.op](column, value).to_numpy()
+
+
+def select(query, frame, store=None, within=None):
+    """Return the positions of the frame's rows that match, sorted and limited
+
+    within, if given, limits the rows to those positions and keeps their
+    order when the query has no sort. With a store, ~ conditions on its
+    searchable fields are narrowed through the trigram index first.
+    """
+    import numpy as np
+
+    positions = np.arange(len(frame)) if within is None else np.asarray(within)
+    if store is not None and len(positions) >= INDEX_ROWS:
+        s = store.schema
+        for condition in query.conditions:
+            if condition.op == "~" and condition.field in s.text:
+                # The index matches any searchable field, so the mask below still checks this one
+                keys = store.search(condition.value)
+                keys = np.array(keys, dtype="int64") if s.numeric_key else keys
+                positions = positions[frame[s.key].isin(keys).to_numpy()[positions]]
+    if query.conditions and len(positions):
+        rows = frame.iloc[positions]
+        mask = np.ones(len(rows), dtype=bool)
+        for condition in query.conditions:
+            mask &= condition_mask(condition, rows)
+        positions = positions[mask]
+    if query.sort is not None and len(positions):
+        import pandas as pd
+
+        values = frame[query.sort].iloc[positions].reset_index(drop=True)
+        if isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object:
+            values = values.astype(str)
+        if query.limit is not None and values.dtype.kind in "iufM":
+            # Top k without sorting every match, as the view page's largest/smallest table does
+            picked = values.nlargest(query.limit) if query.descending else values.nsmallest(query.limit)
+        else:
+            picked = values.sort_values(ascending=not query.descending, kind="stable", na_position="last")
+        positions = positions[picked.index.to_numpy()]
+    if query.limit is not None:
+        positions = positions[:query.limit]
+    return positions
+
+
+def run(query, store):
+    """Return the typed rows of a store that match a parsed query, in result order"""
+    import pandas as pd
+    from storage import as_typed
+
+    s = store.schema
+    lookup = next((c for c in query.conditions if c.field == s.key and c.op == "="), None)
+    if lookup is not None:
+        row = store.get(lookup.value)
+        frame = as_typed(pd.DataFrame([row] if row is not None else [], columns=s.fields), s)
+    else:
+        start, end, category = scope(query, s)
+        frame = store.typed_frame(start=start, end=end, category=category)
+    return frame.iloc[select(query, frame, store)].reset_index(drop=True)
+
+
+def to_records(frame, schema):
+    """Return typed rows as the row dicts iter_rows() yields: dollar amounts, ISO dates and "" for blanks"""
+    rows = frame.assign(**{schema.amount: frame[schema.amount] / 100,
+                           schema.date: frame[schema.date].dt.strftime("%Y-%m-%d")})
+    rows = rows.astype(object).where(rows.notna(), "")
+    return rows.to_dict("records")
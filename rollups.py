@@ -0,0 +1,204 @@
+"""Materialized per-day, per-week, per-month and per-category totals.
+
+Every store keeps a small JSON file with the running total, count, min and
+max (in cents) of each bucket. Stores update it on every insert and modify,
+so statistics read a few thousand buckets instead of every transaction. The
+file remembers the store version it matches; if the data changed behind its
+back it is rebuilt on the next read.
+
+Range totals take two binary searches over the days, sorted as text, and
+running totals of those days, built the first time a range is asked for.
+
+    python rollups.py [expenses.csv] [--cli]    rebuild the rollups
+"""
+import argparse
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date as date_type
+from itertools import accumulate
+
+PERIODS = ("day", "week", "month", "category")
+
+
+def iso_week(value):
+    """Return the ISO week bucket ("2024-W05") of a YYYY-MM-DD date string"""
+    try:
+        year, week, _ = date_type.fromisoformat(str(value)[:10]).isocalendar()
+    except ValueError:
+        return str(value)
+    return f"{year}-W{week:02d}"
+
+
+def bucket_of(period, row_date, category):
+    """Return the bucket a row falls into for the given period"""
+    if period == "day":
+        return row_date
+    if period == "week":
+        return iso_week(row_date)
+    if period == "month":
+        return row_date[:7]
+    if period == "category":
+        return category
+    raise ValueError(f"Unknown period: {period}")
+
+
+def to_cents(amount):
+    """Convert a dollar amount to integer cents"""
+    return int(round(float(amount) * 100))
+
+
+def merge_buckets(buckets, other):
+    """Add {bucket: [total, count, min, max]} entries into buckets in place"""
+    for key, (total, count, low, high) in other.items():
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [total, count, low, high]
+        else:
+            bucket[0] += total
+            bucket[1] += count
+            bucket[2] = min(bucket[2], low)
+            bucket[3] = max(bucket[3], high)
+
+
+def _jsonable(version):
+    """Normalize a store version so it compares equal after a JSON round trip"""
+    return json.loads(json.dumps(version))
+
+
+class Rollups:
+    """Running total, count, min and max per bucket, persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.buckets = {period: {} for period in PERIODS}
+        # False when min/max may be wrong or rows were missed; forces a rebuild
+        self.exact = False
+        # Sorted days and running totals of their cents, for total_between()
+        self._running = None
+
+    @classmethod
+    def load(cls, path):
+        """Read the rollups file, or return empty (inexact) rollups if there is none"""
+        rollups = cls(path)
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return rollups
+        rollups.version = data["version"]
+        rollups.buckets = data["buckets"]
+        rollups.exact = data["exact"]
+        return rollups
+
+    def save(self):
+        """Atomically write the rollups file"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": self.version, "exact": self.exact, "buckets": self.buckets}, file)
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, version):
+        """Return True if the rollups are exact and match the given store version"""
+        return self.exact and self.version == _jsonable(version)
+
+    def stamp(self, version):
+        """Record the store version the rollups now match"""
+        self.version = _jsonable(version)
+
+    def add(self, amount, row_date, category, sign=1):
+        """Add (sign=1) or remove (sign=-1) one transaction from every bucket it falls in"""
+        row = (amount, row_date, category)
+        if sign > 0:
+            self.update(added=[row])
+        else:
+            self.update(removed=[row])
+
+    def update(self, added=(), removed=()):
+        """Take removed and add added (amount, date, category) rows in every bucket they fall in
+
+        Added rows go in first, so an edit that keeps a bucket's min or max
+        (a rename, or an amount moved past the old one) leaves it known.
+        """
+        self._running = None
+        kept = set()
+        for amount, row_date, category in added:
+            cents = to_cents(amount)
+            for period in PERIODS:
+                key = bucket_of(period, str(row_date), str(category))
+                merge_buckets(self.buckets[period], {key: [cents, 1, cents, cents]})
+                kept.add((period, key, cents))
+        for amount, row_date, category in removed:
+            cents = to_cents(amount)
+            for period in PERIODS:
+                buckets = self.buckets[period]
+                key = bucket_of(period, str(row_date), str(category))
+                bucket = buckets.get(key)
+                if bucket is None:
+                    self.exact = False
+                    continue
+                bucket[0] -= cents
+                bucket[1] -= 1
+                if bucket[1] <= 0:
+                    del buckets[key]
+                elif bucket[1] == 1:
+                    # The one row left is the whole total
+                    bucket[2] = bucket[3] = bucket[0]
+                elif cents in (bucket[2], bucket[3]) and bucket[2] != bucket[3] and (period, key, cents) not in kept:
+                    # The old extreme is gone and we don't know the next one
+                    self.exact = False
+
+    def merge(self, period, buckets):
+        """Add {bucket: [total, count, min, max]} cents, e.g. from aggregate.py, to a period"""
+        self._running = None
+        merge_buckets(self.buckets[period], buckets)
+
+    def set_totals(self, period, rows):
+        """Replace a period's buckets with [(bucket, total, count, min, max)] rows"""
+        self._running = None
+        self.buckets[period] = {
+            str(key): [to_cents(total), count, to_cents(low), to_cents(high)]
+            for key, total, count, low, high in rows
+        }
+
+    def totals_by(self, period):
+        """Return [(bucket, total, count, min, max)] in dollars, sorted by bucket"""
+        buckets = self.buckets[period]
+        return [(key, total / 100, count, low / 100, high / 100)
+                for key, (total, count, low, high) in sorted(buckets.items())]
+
+    def total_between(self, start, end):
+        """Return the total amount from start to end (inclusive) in O(log n)
+
+        Days compare as text, as ExpenseStore._matches() and SQLite do, so
+        a hand-edited date counts the same way it does in summary(start, end).
+        """
+        if self._running is None:
+            days = sorted(self.buckets["day"])
+            self._running = days, [0, *accumulate(self.buckets["day"][day][0] for day in days)]
+        days, running = self._running
+        lo, hi = bisect_left(days, str(start)), bisect_right(days, str(end))
+        return max(running[hi] - running[lo], 0) / 100
+
+    def summary(self):
+        """Return count, total, mean, min and max over all transactions"""
+        buckets = self.buckets["category"].values()
+        count = sum(b[1] for b in buckets)
+        total = sum(b[0] for b in buckets) / 100
+        return {"count": count, "total": total, "mean": total / count if count else 0.0,
+                "min": min(b[2] for b in buckets) / 100 if count else None,
+                "max": max(b[3] for b in buckets) / 100 if count else None}
+
+
+if __name__ == "__main__":
+    import storage
+
+    parser = argparse.ArgumentParser(description="Rebuild the statistics rollups from the stored expenses")
+    parser.add_argument("path", nargs="?", default="expenses.csv")
+    parser.add_argument("--cli", action="store_true", help="the file uses the command-line app's layout")
+    args = parser.parse_args()
+
+    store = storage.open_store(args.path, storage.CLI_SCHEMA if args.cli else storage.APP_SCHEMA)
+    rollups = store.rebuild_rollups()
+    print(f"Rebuilt rollups for {rollups.summary()['count']} transactions in {rollups.path}")
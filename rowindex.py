@@ -0,0 +1,196 @@
+"""On-disk index from each row's key to its byte offset in a CSV data file.
+
+The index lives in "expenses.csv.offsets/" next to the CSV file:
+
+    keys.npy      S<n>     row keys as fixed-width bytes, sorted
+    offsets.npy   int64    byte offset of each key's row in the CSV file
+    meta.json              column names and the (mtime, size) of the CSV file
+
+Both arrays are opened with mmap_mode="r", so finding a key is a binary
+search that touches a handful of pages, and fetching the row reads just that
+line of the CSV file. Like the columnar snapshot, the index mirrors the base
+CSV file only: fetch() checks the journal first, and the index is rebuilt
+the first time it is used after the base file changes (after a compaction
+or a full rewrite).
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+import journal
+from columnar import source_stamp
+
+INDEX_SUFFIX = ".offsets"
+
+
+def index_dir(csv_path):
+    """Return the index directory for a CSV file"""
+    return csv_path + INDEX_SUFFIX
+
+
+def record_starts(data):
+    """Return the byte offsets where the CSV records in data (a uint8 array) start, header included"""
+    if not len(data):
+        return np.array([], dtype=np.int64)
+    newlines = np.flatnonzero(data == ord("\n"))
+    quotes = np.flatnonzero(data == ord('"'))
+    if len(quotes):
+        # A newline inside a quoted field has an odd number of quotes before it
+        newlines = newlines[np.searchsorted(quotes, newlines) % 2 == 0]
+    starts = np.concatenate([[0], newlines + 1]).astype(np.int64)
+    ends = np.append(newlines, len(data))
+    # Skip blank lines (and the empty "line" after the final newline), as csv and pandas do
+    lengths = ends - starts
+    blank = (lengths == 0) | ((lengths == 1) & (data[np.minimum(starts, len(data) - 1)] == ord("\r")))
+    return starts[~blank]
+
+
+def build(csv_path, key, out_dir=None):
+    """Index a CSV file's rows by the key column and return the RowIndex"""
+    import pandas as pd
+
+    out_dir = out_dir or index_dir(csv_path)
+    stamp = source_stamp(csv_path)
+    data = np.fromfile(csv_path, dtype=np.uint8)
+    starts = record_starts(data)[1:]
+    del data
+    keys = pd.read_csv(csv_path, usecols=[key], dtype=str, keep_default_na=False)[key]
+    if len(keys) != len(starts):
+        raise ValueError(f"Could not index {csv_path}: found {len(starts)} rows but pandas read {len(keys)}")
+    keys = np.array([k.encode("utf-8") for k in keys], dtype=bytes) if len(keys) else np.array([], dtype="S1")
+    order = np.argsort(keys, kind="stable")
+
+    # A reader and the compaction hook may build the same index at once, even in one process
+    tmp_dir = f"{out_dir}.{os.getpid()}-{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "keys.npy"), keys[order])
+    np.save(os.path.join(tmp_dir, "offsets.npy"), starts[order])
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as file:
+        json.dump({"rows": len(keys), "key": key, "fields": journal.read_header(csv_path), "source": stamp}, file)
+
+    # Swap the new index in; readers holding the old memmaps keep working
+    old_dir = f"{out_dir}.{os.getpid()}-{threading.get_ident()}.old"
+    try:
+        os.replace(out_dir, old_dir)
+    except FileNotFoundError:
+        pass
+    try:
+        os.replace(tmp_dir, out_dir)
+    except OSError:
+        # Another build swapped its index in first; it indexes the same file
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return RowIndex(out_dir)
+
+
+def read_record(csv_path, offset, fieldnames):
+    """Parse the one CSV record starting at a byte offset into a dict"""
+    with open(csv_path, "rb") as file:
+        file.seek(offset)
+        record = file.readline()
+        # A quoted field can run over several lines
+        while record.count(b'"') % 2:
+            line = file.readline()
+            if not line:
+                break
+            record += line
+    return next(csv.DictReader(io.StringIO(record.decode("utf-8"), newline=""), fieldnames=fieldnames))
+
+
+class RowIndex:
+    """Read-only, memory-mapped key -> offset index of one CSV file"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as file:
+            self.meta = json.load(file)
+        self.keys = np.load(os.path.join(directory, "keys.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def is_fresh_for(self, csv_path):
+        """Return True if the index still matches the CSV file"""
+        try:
+            return self.meta["source"] == source_stamp(csv_path)
+        except FileNotFoundError:
+            return False
+
+    def offset(self, key):
+        """Return the byte offset of the key's row, or None if the key isn't in the file"""
+        wanted = str(key).encode("utf-8")
+        if not len(self.keys) or len(wanted) > self.keys.dtype.itemsize:
+            return None
+        position = int(np.searchsorted(self.keys, wanted))
+        if position < len(self.keys) and self.keys[position] == wanted:
+            return int(self.offsets[position])
+        return None
+
+    def get(self, csv_path, key):
+        """Return the key's row from the CSV file, or None"""
+        offset = self.offset(key)
+        return None if offset is None else read_record(csv_path, offset, self.meta["fields"])
+
+
+def open_index(csv_path, key, current=None):
+    """Return a fresh RowIndex for a CSV file, reusing current if it still matches and building one if needed"""
+    if current is not None and current.is_fresh_for(csv_path):
+        return current
+    try:
+        index = RowIndex(index_dir(csv_path))
+        if index.is_fresh_for(csv_path) and index.meta["key"] == key:
+            return index
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return build(csv_path, key)
+
+
+def find_journaled(csv_path, key_column, key, files=None):
+    """Return (found, row) for the last journal record of a key; row is None if it was deleted"""
+    key = str(key)
+    found, current = False, None
+    for jpath in journal.journal_files(csv_path) if files is None else files:
+        # Most lookups miss the journal, so skip parsing files that don't contain the key at all
+        with open(jpath, "rb") as file:
+            if key.encode("utf-8") not in file.read():
+                continue
+        for op, row in journal.read_journal(csv_path, files=[jpath]):
+            if row[key_column] == key:
+                found, current = True, None if op == "delete" else row
+    return found, current
+
+
+def fetch(csv_path, key_column, key, index=None):
+    """Return (row or None, index) for a key in a journaled CSV file, using and refreshing the offset index"""
+    def read(journals):
+        found, row = find_journaled(csv_path, key_column, key, journals)
+        if found:
+            return row, index
+        if not os.path.exists(csv_path):
+            return None, index
+        opened = open_index(csv_path, key_column, index)
+        return opened.get(csv_path, key), opened
+
+    # A compaction between the journal lookup and the base file read would hide the row
+    return journal.consistent_read(csv_path, read)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the ID -> byte offset index of an expense CSV file")
+    parser.add_argument("path", nargs="?", default="expenses.csv")
+    parser.add_argument("--key", default=None, help="key column (default: ID or transaction_id)")
+    args = parser.parse_args()
+
+    key = args.key
+    if key is None:
+        key = "transaction_id" if "transaction_id" in journal.read_header(args.path) else "ID"
+    index = build(args.path, key)
+    print(f"Indexed {len(index)} rows of {args.path} in {index.directory}")
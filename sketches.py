@@ -0,0 +1,357 @@
+"""Mergeable per-month and per-category distribution sketches.
+
+Next to the rollups, every store keeps two small summaries of each month
+and each category in "<name>.<table>.sketches.json":
+
+* a log-bucketed histogram of the amounts (the DDSketch layout). Each bin
+  holds the amounts between gamma**(i - 1) and gamma**i cents, so the
+  value read back for any quantile (median, p90, p99, ...) is within
+  ACCURACY (1%) of the true amount. Bins are plain counts: histograms
+  merge by adding them, and a modified row can be taken out again.
+* a HyperLogLog of the vendors (the store name, or the name when there is
+  none). Its 2**PRECISION registers keep the longest run of leading zero
+  bits seen in the vendors' hashes, which estimates the number of distinct
+  vendors to within about 2.3% (one standard error). Registers merge by
+  keeping the larger value, but can't forget a vendor.
+
+Both are updated on every add and modify, so the Statistics page reads its
+medians, percentiles and vendor counts from a few hundred bins per bucket
+instead of every transaction. Like the rollups, the file remembers the
+store version it matches and is rebuilt on the next read if the data
+changed behind its back, or after a modify moved a vendor out of a bucket
+(the HyperLogLog can't tell whether another row still has it). Stores
+only keep the file up to date once something has read it.
+
+    python sketches.py [expenses.csv] [--cli]    rebuild the sketches
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+from bisect import bisect_left
+from collections import Counter
+from datetime import date as date_type
+from itertools import accumulate
+
+from rollups import _jsonable, bucket_of, to_cents
+
+PERIODS = ("month", "category")
+
+# Relative error of every quantile read from the histograms
+ACCURACY = 0.01
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# 2**11 one-byte registers per bucket: about 2.3% standard error
+PRECISION = 11
+REGISTERS = 1 << PRECISION
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def bin_of(cents):
+    """Return the histogram bin of an amount in cents: 0 for zero, -bin for a negative amount"""
+    if cents == 0:
+        return 0
+    index = max(0, math.ceil(math.log(abs(cents)) / LOG_GAMMA)) + 1
+    return index if cents > 0 else -index
+
+
+def bin_value(key):
+    """Return the amount in cents a bin stands for (within ACCURACY of every amount in it)"""
+    if key == 0:
+        return 0.0
+    value = 2 * GAMMA ** (abs(key) - 1) / (GAMMA + 1)
+    return value if key > 0 else -value
+
+
+def quantiles(bins, fractions=QUANTILES):
+    """Return the amount in cents at each fraction of a {bin: count} histogram, or Nones if it's empty"""
+    keys = sorted(bins, key=int)
+    running = list(accumulate(bins[key] for key in keys))
+    if not running or not running[-1]:
+        return [None] * len(fractions)
+    # Nearest rank: the quantile is the amount ranked ceil(fraction * count) (at least 1), which is
+    # in the first bin whose running count reaches that rank. Rounding first keeps 0.07 * 100 at 7.
+    ranks = [max(math.ceil(round(fraction * running[-1], 9)), 1) for fraction in fractions]
+    return [bin_value(int(keys[bisect_left(running, rank)])) for rank in ranks]
+
+
+def vendor_name(value):
+    """Normalize a vendor for counting: trimmed and lowercased, "" for a blank"""
+    return "" if value is None else str(value).strip().lower()
+
+
+def vendor_of(row, fields):
+    """Return the normalized vendor of a row dict: its first non-blank vendor field"""
+    for field in fields:
+        name = vendor_name(row.get(field))
+        if name:
+            return name
+    return ""
+
+
+def register_of(vendor):
+    """Return the (register, rank) a normalized vendor sets in a HyperLogLog"""
+    digest = int.from_bytes(hashlib.blake2b(vendor.encode("utf-8"), digest_size=8).digest(), "big")
+    rest = digest & ((1 << (64 - PRECISION)) - 1)
+    return digest >> (64 - PRECISION), 64 - PRECISION - rest.bit_length() + 1
+
+
+def estimate(registers):
+    """Return the estimated number of distinct vendors behind HyperLogLog registers"""
+    counts = Counter(registers)
+    harmonic = sum(count * 2.0 ** -rank for rank, count in counts.items())
+    raw = 0.7213 / (1 + 1.079 / REGISTERS) * REGISTERS * REGISTERS / harmonic
+    zeros = counts.get(0, 0)
+    if raw <= 2.5 * REGISTERS and zeros:
+        # Linear counting is more accurate while most registers are still empty
+        return round(REGISTERS * math.log(REGISTERS / zeros))
+    return round(raw)
+
+
+def encode(registers):
+    return base64.b64encode(bytes(registers)).decode("ascii")
+
+
+def decode(text):
+    return bytearray(base64.b64decode(text))
+
+
+def merge_registers(registers, other):
+    """Return the union of two HyperLogLogs' registers"""
+    return bytes(map(max, registers, other))
+
+
+def buckets_of(row_date, category):
+    """Return the (period, bucket) pairs a row falls in; like from_frame(), only YYYY-MM-DD dates get a month"""
+    text = str(row_date)
+    try:
+        dated = len(text) == 10 and date_type.fromisoformat(text) is not None
+    except ValueError:
+        dated = False
+    return [(period, bucket_of(period, text, str(category))) for period in PERIODS if dated or period != "month"]
+
+
+def _month_codes(dates):
+    """Return (codes, labels) of the YYYY-MM bucket of each datetime64 value (none may be missing)"""
+    import numpy as np
+
+    months = dates.to_numpy().astype("datetime64[M]")
+    if not len(months):
+        return np.array([], dtype=np.int64), []
+    first = months.min()
+    codes = (months - first).astype(np.int64)
+    return codes, np.datetime_as_string(first + np.arange(codes.max() + 1)).tolist()
+
+
+def from_frame(frame, amount, date, category, vendors):
+    """Sketch a typed DataFrame (see storage.as_typed) into {period: {bucket: sketch}}
+
+    vendors lists the vendor columns in order of preference. Rows without
+    a date only count towards their category.
+    """
+    import numpy as np
+    import pandas as pd
+
+    result = {period: {} for period in PERIODS}
+    if not len(frame):
+        return result
+    cents = frame[amount].to_numpy(dtype=np.int64)
+    index = np.ceil(np.log(np.maximum(np.abs(cents), 1)) / LOG_GAMMA).astype(np.int64)
+    keys = np.sign(cents) * (np.maximum(index, 0) + 1)
+
+    # Each row's vendor as a number into names: the first non-blank vendor field, -1 for none.
+    # Factorizing the columns means every distinct value is normalized and hashed once.
+    names, vendor_ids = [], np.full(len(frame), -1, dtype=np.int64)
+    for field in reversed(vendors):
+        codes, uniques = pd.factorize(frame[field])
+        cleaned = [vendor_name(value) for value in uniques.tolist()]
+        present = np.array([bool(name) for name in cleaned] + [False])[codes]
+        vendor_ids = np.where(present, codes + len(names), vendor_ids)
+        names += cleaned
+    ranks = [register_of(name) if name else (0, 0) for name in names]
+    spots = np.array([spot for spot, rank in ranks], dtype=np.int64)
+    values = np.array([rank for spot, rank in ranks], dtype=np.uint8)
+
+    dated = frame[date].notna().to_numpy()
+    categories = frame[category]
+    if not isinstance(categories.dtype, pd.CategoricalDtype):
+        categories = categories.astype("category")
+    labels = [str(label) for label in categories.cat.categories]
+    category_codes = categories.cat.codes.to_numpy().astype(np.int64)
+    # Missing categories bucket as "nan", like str() of the row's value
+    category_codes = np.where(category_codes < 0, len(labels), category_codes)
+    periods = {"month": (dated, *_month_codes(frame[date][dated])),
+               "category": (slice(None), category_codes, labels + ["nan"])}
+    for period, (rows, codes, labels) in periods.items():
+        if not len(codes):
+            continue
+        # Bins: one sort of (bucket, bin) pairs, then count the runs
+        pairs = np.sort((codes << 16) | (keys[rows] + (1 << 15)))
+        starts = np.flatnonzero(np.append(True, pairs[1:] != pairs[:-1]))
+        counts = np.diff(np.append(starts, len(pairs)))
+        buckets = {}
+        for pair, count in zip(pairs[starts].tolist(), counts.tolist()):
+            bucket = buckets.setdefault(labels[pair >> 16], {"count": 0, "bins": {}})
+            bucket["bins"][str((pair & 0xFFFF) - (1 << 15))] = count
+            bucket["count"] += count
+
+        # Vendors: the distinct (bucket, vendor) pairs, each keeping the largest rank per register
+        pairs = np.sort((codes << 32) | (vendor_ids[rows] + 1))
+        pairs = pairs[np.append(True, pairs[1:] != pairs[:-1])]
+        pairs = pairs[(pairs & 0xFFFFFFFF) > 0]
+        chosen = (pairs & 0xFFFFFFFF) - 1
+        registers = np.zeros((len(labels), REGISTERS), dtype=np.uint8)
+        np.maximum.at(registers, (pairs >> 32, spots[chosen]), values[chosen])
+        for code, label in enumerate(labels):
+            if label in buckets:
+                buckets[label]["vendors"] = encode(registers[code])
+        result[period] = buckets
+    return result
+
+
+class Sketches:
+    """Amount histogram and vendor HyperLogLog per month and category, persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.buckets = {period: {} for period in PERIODS}
+        # False when a bucket may be wrong or rows were missed; forces a rebuild
+        self.exact = False
+        # Decoded registers of the buckets written to since loading
+        self._registers = {}
+
+    @classmethod
+    def load(cls, path):
+        """Read the sketches file, or return empty (inexact) sketches if there is none"""
+        sketches = cls(path)
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return sketches
+        sketches.version = data["version"]
+        sketches.buckets = data["buckets"]
+        sketches.exact = data["exact"]
+        return sketches
+
+    def save(self):
+        """Atomically write the sketches file"""
+        for (period, key), registers in self._registers.items():
+            if key in self.buckets[period]:
+                self.buckets[period][key]["vendors"] = encode(registers)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            # json.dumps uses the C encoder; json.dump streams through the Python one
+            file.write(json.dumps({"version": self.version, "exact": self.exact, "buckets": self.buckets}))
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, version):
+        """Return True if the sketches are exact and match the given store version"""
+        return self.exact and self.version == _jsonable(version)
+
+    def stamp(self, version):
+        """Record the store version the sketches now match"""
+        self.version = _jsonable(version)
+
+    def _vendors(self, period, key):
+        registers = self._registers.get((period, key))
+        if registers is None:
+            registers = self._registers[(period, key)] = decode(self.buckets[period][key]["vendors"])
+        return registers
+
+    def update(self, added=(), removed=()):
+        """Take removed and add added (amount, date, category, vendor) rows in every bucket they fall in"""
+        kept = {(period, name, vendor)
+                for amount, row_date, category, vendor in added for period, name in buckets_of(row_date, category)}
+        for amount, row_date, category, vendor in removed:
+            key = str(bin_of(to_cents(amount)))
+            for period, name in buckets_of(row_date, category):
+                bucket = self.buckets[period].get(name)
+                if bucket is None or not bucket["bins"].get(key):
+                    self.exact = False
+                    continue
+                bucket["bins"][key] -= 1
+                if not bucket["bins"][key]:
+                    del bucket["bins"][key]
+                bucket["count"] -= 1
+                if bucket["count"] <= 0:
+                    del self.buckets[period][name]
+                    self._registers.pop((period, name), None)
+                elif vendor and (period, name, vendor) not in kept:
+                    # Another row may still have the vendor, and the registers can't tell
+                    self.exact = False
+        for amount, row_date, category, vendor in added:
+            key = str(bin_of(to_cents(amount)))
+            for period, name in buckets_of(row_date, category):
+                bucket = self.buckets[period].setdefault(
+                    name, {"count": 0, "bins": {}, "vendors": encode(bytes(REGISTERS))})
+                bucket["bins"][key] = bucket["bins"].get(key, 0) + 1
+                bucket["count"] += 1
+                if vendor:
+                    spot, rank = register_of(vendor)
+                    registers = self._vendors(period, name)
+                    registers[spot] = max(registers[spot], rank)
+
+    def merge(self, period, buckets):
+        """Merge {bucket: sketch} entries, e.g. from from_frame(), into a period"""
+        for key, other in buckets.items():
+            bucket = self.buckets[period].get(key)
+            if bucket is None:
+                self.buckets[period][key] = other
+                self._registers.pop((period, key), None)
+                continue
+            bucket["count"] += other["count"]
+            for bin_key, count in other["bins"].items():
+                bucket["bins"][bin_key] = bucket["bins"].get(bin_key, 0) + count
+            registers = self._vendors(period, key)
+            registers[:] = merge_registers(registers, decode(other["vendors"]))
+
+    def distribution_by(self, period, fractions=QUANTILES, bounds=None):
+        """Return [(bucket, count, *quantiles, vendors)] in dollars, sorted by bucket
+
+        bounds maps buckets to their exact (min, max) in dollars, e.g. from
+        the rollups; quantiles are clamped to them, so a bucket holding a
+        single amount reads it back exactly.
+        """
+        rows = []
+        for key, bucket in sorted(self.buckets[period].items()):
+            values = _clamp(quantiles(bucket["bins"], fractions), (bounds or {}).get(key))
+            rows.append((key, bucket["count"], *values, estimate(self._vendors(period, key))))
+        return rows
+
+    def distribution(self, fractions=QUANTILES, bounds=None):
+        """Return the count, quantiles (in dollars) and distinct vendors over all transactions"""
+        bins, registers = {}, bytes(REGISTERS)
+        for key, bucket in self.buckets["category"].items():
+            for bin_key, count in bucket["bins"].items():
+                bins[bin_key] = bins.get(bin_key, 0) + count
+            registers = merge_registers(registers, self._vendors("category", key))
+        return {"count": sum(bins.values()), "quantiles": _clamp(quantiles(bins, fractions), bounds),
+                "vendors": estimate(registers)}
+
+
+def _clamp(values, bounds):
+    """Convert quantiles from cents to dollars, clamped to the exact (min, max) if known"""
+    values = [None if value is None else value / 100 for value in values]
+    if bounds is None or None in bounds:
+        return values
+    low, high = bounds
+    return [None if value is None else min(max(value, low), high) for value in values]
+
+
+if __name__ == "__main__":
+    import storage
+
+    parser = argparse.ArgumentParser(description="Rebuild the distribution sketches from the stored expenses")
+    parser.add_argument("path", nargs="?", default="expenses.csv")
+    parser.add_argument("--cli", action="store_true", help="the file uses the command-line app's layout")
+    args = parser.parse_args()
+
+    store = storage.open_store(args.path, storage.CLI_SCHEMA if args.cli else storage.APP_SCHEMA)
+    sketches = store.rebuild_sketches()
+    print(f"Rebuilt sketches for {sketches.distribution()['count']} transactions in {sketches.path}")
@@ -0,0 +1,1532 @@
+"""Storage backends for the expense apps.
+
+Both front ends talk to an ExpenseStore instead of a hard-coded CSV file.
+CsvStore keeps the original CSV layout (plus the append-only journal),
+SqliteStore keeps the same rows in an indexed SQLite table, pushing filters
+and aggregates down into SQL, and PartitionedStore splits the rows into one
+CSV file per month so date-range queries only read the months they cover.
+The backend is picked with the EXPENSE_BACKEND environment variable ("csv",
+"sqlite" or "partitioned").
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import journal
+import locking
+import partitions
+import perf
+from rollups import PERIODS, Rollups, bucket_of, iso_week, merge_buckets
+
+BACKEND = os.environ.get("EXPENSE_BACKEND", "csv").lower()
+
+
+class Schema:
+    """Column layout of one expense table"""
+
+    def __init__(self, table, fields, key, name, amount, date, category, numeric_key=False, text=None,
+                 vendor=None):
+        self.table = table
+        self.fields = list(fields)
+        self.key = key
+        self.name = name
+        self.amount = amount
+        self.date = date
+        self.category = category
+        # Integer keys are allocated by the store when a row has none
+        self.numeric_key = numeric_key
+        # Free-text columns covered by search() (just the name by default)
+        self.text = list(text) if text else [name]
+        # Columns naming the vendor, first non-blank one wins (just the name by default)
+        self.vendor = list(vendor) if vendor else [name]
+
+
+# Layout used by the Streamlit app (app.py)
+APP_SCHEMA = Schema(
+    "expenses", ["ID", "Name", "Amount", "Date", "Category"],
+    key="ID", name="Name", amount="Amount", date="Date", category="Category", numeric_key=True
+)
+
+# Layout used by the command-line app (GROUP PROJECT PT 1 - 8.py)
+CLI_SCHEMA = Schema(
+    "transactions",
+    ["transaction_id", "name", "amount", "date", "category", "type",
+     "Meal Type", "Store Name", "Item Category", "Clothing Type", "occasion"],
+    key="transaction_id", name="name", amount="amount", date="date", category="category",
+    text=["name", "Store Name", "Item Category", "Clothing Type", "occasion", "Meal Type"],
+    vendor=["Store Name", "name"]
+)
+
+
+def csv_engine():
+    """Return the pandas.read_csv engine: pyarrow (parses on several threads) if installed, else the C parser"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "c"
+    return "pyarrow"
+
+
+def as_typed(frame, schema):
+    """Convert a DataFrame's columns to the schema's analysis types
+
+    Amounts become exact int64 cents, dates datetime64, the category a
+    pandas Categorical, the name text and a numeric key int64. Columns that
+    aren't in the frame are skipped, and any others are left as they are.
+    Dates that aren't plain YYYY-MM-DD (rare hand edits such as "3/2/2024")
+    become NaT, the rows aggregate.from_frame() buckets one at a time.
+    """
+    import pandas as pd
+
+    converters = {
+        schema.key: lambda col: col.astype("int64") if schema.numeric_key else col.astype("str"),
+        schema.name: lambda col: col.astype("str"),
+        # The same rounding as aggregate.from_frame(), so totals match the rollups to the cent
+        schema.amount: lambda col: (pd.to_numeric(col) * 100).round().astype("int64"),
+        schema.date: _to_dates,
+        schema.category: lambda col: col if isinstance(col.dtype, pd.CategoricalDtype)
+        else col.astype("str").astype("category"),
+    }
+    return frame.assign(**{column: convert(frame[column]) for column, convert in converters.items()
+                           if column in frame.columns})
+
+
+def _to_dates(col):
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+    if col.dtype == object and pd.api.types.infer_dtype(col, skipna=True) == "date":
+        # pyarrow's reader returns a column of plain YYYY-MM-DD dates as date objects, far
+        # quicker to convert directly than as text
+        return pd.to_datetime(col)
+    text = col.astype("str")
+    return pd.to_datetime(text, format="%Y-%m-%d", errors="coerce").where(text.str.len() == 10)
+
+
+def read_typed_csv(path, schema, columns=None, engine=None):
+    """Read a CSV file in the schema's layout straight into as_typed()'s column types
+
+    columns limits the columns parsed (the key is always read); engine
+    defaults to csv_engine().
+    """
+    import pandas as pd
+
+    columns = _with_key(schema, columns)
+    dtype = {field: "str" for field in schema.text}
+    dtype.update({schema.amount: "float64", schema.category: "category"})
+    if schema.numeric_key:
+        dtype[schema.key] = "int64"
+    frame = pd.read_csv(path, usecols=columns, engine=engine or csv_engine(),
+                        dtype={column: kind for column, kind in dtype.items() if column in columns})
+    return as_typed(frame, schema)
+
+
+def _with_key(schema, columns):
+    if columns is None:
+        return list(schema.fields)
+    return list(columns) if schema.key in columns else [schema.key] + list(columns)
+
+
+def _read_journal_csv(path, schema, usecols=None):
+    """pd.read_csv() one journal file, which a writer may have only just created"""
+    import pandas as pd
+    try:
+        return pd.read_csv(path, usecols=usecols)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=usecols or ["op"] + schema.fields)
+
+
+def _read_journal_typed(path, schema, columns=None):
+    """Read one journal file's records (with their "op" column) in as_typed()'s column types"""
+    return as_typed(_read_journal_csv(path, schema, ["op"] + _with_key(schema, columns)), schema)
+
+
+def _stack(schema, frames, columns=None):
+    """Concatenate typed frames, keeping the category column categorical"""
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return as_typed(pd.DataFrame(columns=_with_key(schema, columns)), schema)
+    if len(frames) == 1:
+        return frames[0]
+    if schema.category in frames[0].columns:
+        # Give every part the same categories, or concat falls back to plain text
+        categories = union_categoricals([frame[schema.category] for frame in frames]).categories
+        frames = [frame.assign(**{schema.category: frame[schema.category].cat.set_categories(categories)})
+                  for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _in_scope(schema, frame, start=None, end=None, category=None):
+    """Return a boolean array of the typed rows iter_rows(start, end, category) would yield"""
+    import numpy as np
+    import pandas as pd
+
+    mask = np.ones(len(frame), dtype=bool)
+    if start is not None:
+        mask &= (frame[schema.date] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (frame[schema.date] <= pd.Timestamp(end)).to_numpy()
+    if category is not None:
+        # Compare the few distinct categories rather than every row
+        values = frame[schema.category].astype("category")
+        names = values.cat.categories
+        mask &= values.isin(names[names.astype(str).str.lower() == category.lower()]).to_numpy()
+    return mask
+
+
+def _apply_journal(schema, frames, columns=None):
+    """Merge a typed base frame with typed journal records after it, keeping the current rows"""
+    df = _stack(schema, frames, columns)
+    if "op" in df.columns:
+        # Journal records come last, so the last copy of a key is the current one
+        df = df.drop_duplicates(subset=schema.key, keep="last")
+        df = df[df["op"] != "delete"].drop(columns="op").reset_index(drop=True)
+    return df[_with_key(schema, columns)]
+
+
+class ExpenseStore:
+    """Base class for expense storage backends
+
+    Backends implement the underscored _insert/_update/... methods; the
+    public methods wrap them to keep the statistics rollups (rollups.py) up
+    to date. Unfiltered statistics come from the rollups, filtered ones from
+    _summary/_totals_by, which scan iter_rows() in Python unless a backend
+    can do better (e.g. SQL).
+
+    Writes are serialized across threads by an RLock and across processes
+    (other app sessions or servers, the command-line app) by an advisory
+    lock on "<path>.lock"; see writing().
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._write_lock = threading.RLock()
+        self._write_depth = 0  # only touched by the thread holding _write_lock
+        # File-based backends with integer keys hand out IDs from a locking.Sequence
+        self._sequence = None
+        self._rollups = None
+
+    @contextmanager
+    def writing(self):
+        """Hold the store's write lock, reentrantly, across threads and processes"""
+        with self._write_lock:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield
+                finally:
+                    self._write_depth -= 1
+                return
+            with locking.file_lock(self.path):
+                self._write_depth = 1
+                try:
+                    yield
+                finally:
+                    self._write_depth = 0
+
+    # -- rows ---------------------------------------------------------------
+
+    def iter_rows(self, start=None, end=None, category=None):
+        """Yield rows as dicts, optionally limited to a date range and category"""
+        raise NotImplementedError
+
+    @perf.timed
+    def get(self, key):
+        """Return the row with the given key, or None (backends override this with a direct lookup)"""
+        key = str(key)
+        for row in self.iter_rows():
+            if str(row[self.schema.key]) == key:
+                return row
+        return None
+
+    @perf.timed(rows=lambda key: 1)
+    def insert(self, row):
+        """Add a row and return its key"""
+        with self.writing():
+            before = self.version()
+            key = self._insert(row)
+            self._record_write(before, added=[row], removed=())
+            self._record_text(before, [key], [row])
+        self._after_write()
+        return key
+
+    @perf.timed
+    def insert_many(self, rows):
+        """Add several rows at once"""
+        rows = list(rows)
+        with self.writing():
+            before = self.version()
+            keys = self._insert_many(rows)
+            self._record_write(before, added=rows, removed=())
+            self._record_text(before, keys, rows)
+        self._after_write()
+
+    @perf.timed(rows=lambda count: count)
+    def insert_frame(self, frame):
+        """Add a pandas DataFrame of rows (in the schema's columns) in one batched write"""
+        with self.writing():
+            before = self.version()
+            keys = self._insert_frame(frame)
+            self._record_frame(before, frame)
+            self._record_text(before, keys, frame=frame)
+        self._after_write()
+        return len(frame)
+
+    @perf.timed
+    def update(self, row, old=None):
+        """Replace the row with the same key; pass the old row to update the rollups in place"""
+        with self.writing():
+            before = self.version()
+            self._update(row, old)
+            self._record_write(before, added=[row], removed=None if old is None else [old])
+            self._record_text(before, [row[self.schema.key]], [row])
+        self._after_write()
+
+    @perf.timed
+    def replace_all(self, rows):
+        """Replace the whole table with the given rows"""
+        rollups = Rollups(self.rollups_path())
+
+        def counted(rows):
+            for row in rows:
+                rollups.add(row[self.schema.amount], row[self.schema.date], row[self.schema.category])
+                yield row
+
+        with self.writing():
+            self._replace_all(counted(rows))
+            rollups.exact = True
+            rollups.stamp(self.version())
+            rollups.save()
+        self._after_write()
+
+    def _insert(self, row):
+        raise NotImplementedError
+
+    def _insert_many(self, rows):
+        """Insert rows and return their keys"""
+        return [self._insert(row) for row in rows]
+
+    def _insert_frame(self, frame):
+        """Insert a DataFrame's rows and return their keys, or None if the backend can't tell"""
+        return self._insert_many(frame.to_dict("records"))
+
+    def _assign_ids(self, keys):
+        """Fill in missing integer keys from the sequence; keys is a list with None for missing"""
+        missing = [i for i, key in enumerate(keys) if key in (None, "")]
+        given = [int(float(key)) for key in keys if key not in (None, "")]
+        if given:
+            self._sequence.advance(max(given))
+        if missing:
+            next_id = self._sequence.allocate(len(missing))
+            for offset, i in enumerate(missing):
+                keys[i] = next_id + offset
+        return keys
+
+    def _assign_frame_ids(self, frame):
+        """Fill in a DataFrame's missing integer keys from the sequence, in place"""
+        key = self.schema.key
+        keys = frame[key].astype(object).where(frame[key].notna(), None).tolist()
+        frame[key] = self._assign_ids(keys)
+        frame[key] = frame[key].astype("int64")
+
+    def _update(self, row, old=None):
+        raise NotImplementedError
+
+    def _replace_all(self, rows):
+        raise NotImplementedError
+
+    def _after_write(self):
+        """Hook for backend housekeeping once a write has finished"""
+
+    def version(self):
+        """Return a value that changes whenever the stored data changes"""
+        raise NotImplementedError
+
+    def compact(self):
+        """Reclaim space and fold pending writes into the main data file"""
+        return False
+
+    def sync(self):
+        """Make every finished write durable, e.g. before the program exits"""
+
+    def to_frame(self):
+        """Return all rows as a pandas DataFrame"""
+        import pandas as pd
+        return pd.DataFrame(list(self.iter_rows()), columns=self.schema.fields)
+
+    @perf.timed
+    def typed_frame(self, columns=None, engine=None, start=None, end=None, category=None):
+        """Return the rows with as_typed()'s column types, limited to columns (plus the key) if given
+
+        start, end and category select rows as iter_rows() does; backends use
+        them to skip whole months or to filter in SQL where they can. engine
+        picks the pandas.read_csv engine for backends that parse CSV files.
+        """
+        s = self.schema
+        if start is None and end is None and category is None:
+            return self._typed_frame(columns, engine)
+        wanted = _with_key(s, columns)
+        # The filter columns are read even when the caller didn't ask for them
+        needed = wanted + [f for f in (s.date, s.category) if f not in wanted]
+        frame = self._typed_frame(needed, engine, start, end, category)
+        return frame[_in_scope(s, frame, start, end, category)][wanted].reset_index(drop=True)
+
+    def _typed_frame(self, columns=None, engine=None, start=None, end=None, category=None):
+        """Load typed rows; start, end and category are hints a backend may use to skip data"""
+        return as_typed(self.to_frame()[_with_key(self.schema, columns)], self.schema)
+
+    # -- aggregates -----------------------------------------------------------
+
+    def _matches(self, row, start, end, category):
+        row_date = str(row[self.schema.date])
+        if start is not None and row_date < str(start):
+            return False
+        if end is not None and row_date > str(end):
+            return False
+        if category is not None and str(row[self.schema.category]).lower() != category.lower():
+            return False
+        return True
+
+    @staticmethod
+    def _summarize(amounts):
+        count, total, low, high = 0, 0.0, None, None
+        for amount in amounts:
+            count += 1
+            total += amount
+            low = amount if low is None else min(low, amount)
+            high = amount if high is None else max(high, amount)
+        return {"count": count, "total": total, "mean": total / count if count else 0.0,
+                "min": low, "max": high}
+
+    def _bucketize(self, period, rows):
+        buckets = {}
+        for row in rows:
+            amount = float(row[self.schema.amount])
+            key = bucket_of(period, str(row[self.schema.date]), row[self.schema.category])
+            entry = buckets.get(key)
+            if entry is None:
+                buckets[key] = [amount, 1, amount, amount]
+            else:
+                entry[0] += amount
+                entry[1] += 1
+                entry[2] = min(entry[2], amount)
+                entry[3] = max(entry[3], amount)
+        return [(key, *buckets[key]) for key in sorted(buckets)]
+
+    @perf.timed(rows=lambda summary: summary["count"])
+    def summary(self, start=None, end=None, category=None):
+        """Return count, total, mean, min and max of the matching amounts"""
+        if start is None and end is None and category is None:
+            return self.current_rollups().summary()
+        return self._summary(start, end, category)
+
+    @perf.timed
+    def totals_by(self, period, start=None, end=None, category=None):
+        """Return [(bucket, total, count, min, max)] per day, week, month or category"""
+        if start is None and end is None and category is None:
+            return self.current_rollups().totals_by(period)
+        return self._totals_by(period, start, end, category)
+
+    @perf.timed
+    def total_between(self, start, end):
+        """Return the total amount from start to end (inclusive) from running totals over the daily rollups"""
+        return self.current_rollups().total_between(start, end)
+
+    def _summary(self, start=None, end=None, category=None):
+        rows = self.iter_rows(start, end, category)
+        return self._summarize(float(row[self.schema.amount]) for row in rows)
+
+    def _totals_by(self, period, start=None, end=None, category=None):
+        return self._bucketize(period, self.iter_rows(start, end, category))
+
+    # -- rollups --------------------------------------------------------------
+
+    def rollups_path(self):
+        """Return the path of this table's rollups file"""
+        return f"{os.path.splitext(self.path)[0]}.{self.schema.table}.rollups.json"
+
+    def current_rollups(self):
+        """Return rollups that match the stored data, rebuilding them if needed"""
+        version = self.version()
+        # Kept between reads while the data doesn't change, with the running totals they've built
+        rollups = self._rollups
+        if rollups is not None and rollups.is_current(version):
+            return rollups
+        rollups = Rollups.load(self.rollups_path())
+        if not rollups.is_current(version):
+            rollups = self.rebuild_rollups(version)
+        self._rollups = rollups
+        return rollups
+
+    @perf.timed
+    def rebuild_rollups(self, version=None):
+        """Recompute the rollups from the stored rows"""
+        with self.writing():
+            version = self.version() if version is None else version
+            rollups = Rollups(self.rollups_path())
+            buckets = self._all_buckets()
+            if buckets is None:
+                for period in PERIODS:
+                    rollups.set_totals(period, self._totals_by(period))
+            else:
+                rollups.buckets = buckets
+            rollups.exact = True
+            rollups.stamp(version)
+            rollups.save()
+        return rollups
+
+    def _all_buckets(self):
+        """Compute every period's buckets in one vectorized pass (None without numpy/pandas)"""
+        try:
+            import aggregate
+            import pandas  # noqa: F401
+        except ImportError:
+            return None
+        s = self.schema
+        return aggregate.from_frame(self.to_frame(), s.amount, s.date, s.category)
+
+    def _record_write(self, before, added=(), removed=None):
+        """Fold a finished write into the rollups and sketches, or leave them stale for a rebuild"""
+        self._record_sketches(before, added, removed)
+        rollups = Rollups.load(self.rollups_path())
+        if not rollups.is_current(before):
+            return
+        s = self.schema
+
+        def values(rows):
+            return [(row[s.amount], row[s.date], row[s.category]) for row in rows]
+
+        if removed is None:
+            # An update without the old row can't be undone from the buckets
+            rollups.exact = False
+        rollups.update(values(added), values(removed or ()))
+        rollups.stamp(self.version())
+        rollups.save()
+
+    def _record_frame(self, before, frame):
+        """Fold a batch of inserted rows into the rollups and sketches in one vectorized pass"""
+        import aggregate
+
+        self._record_sketches(before, frame=frame)
+        rollups = Rollups.load(self.rollups_path())
+        if not rollups.is_current(before):
+            return
+        s = self.schema
+        for period, buckets in aggregate.from_frame(frame, s.amount, s.date, s.category).items():
+            rollups.merge(period, buckets)
+        rollups.stamp(self.version())
+        rollups.save()
+
+    # -- distribution sketches ------------------------------------------------
+
+    def sketches_path(self):
+        """Return the path of this table's distribution sketches file"""
+        return f"{os.path.splitext(self.path)[0]}.{self.schema.table}.sketches.json"
+
+    @perf.timed
+    def distribution_by(self, period):
+        """Return [(bucket, count, median, p90, p99, vendors)] per month or category, in dollars
+
+        The quantiles are within 1% of the exact amounts (and never outside
+        the bucket's exact min and max from the rollups), the distinct
+        vendor counts within a few percent (see sketches.py).
+        """
+        bounds = {bucket: (low, high) for bucket, total, count, low, high in self.totals_by(period)}
+        return self.current_sketches().distribution_by(period, bounds=bounds)
+
+    @perf.timed
+    def distribution(self):
+        """Return the count, [median, p90, p99] and distinct vendors over all transactions"""
+        summary = self.summary()
+        return self.current_sketches().distribution(bounds=(summary["min"], summary["max"]))
+
+    def current_sketches(self):
+        """Return sketches that match the stored data, rebuilding them if needed"""
+        import sketches
+
+        version = self.version()
+        current = sketches.Sketches.load(self.sketches_path())
+        if not current.is_current(version):
+            current = self.rebuild_sketches(version)
+        return current
+
+    @perf.timed
+    def rebuild_sketches(self, version=None):
+        """Recompute the distribution sketches from the stored rows"""
+        import sketches
+
+        s = self.schema
+        with self.writing():
+            version = self.version() if version is None else version
+            frame = self.typed_frame(columns=self._sketch_columns())
+            current = sketches.Sketches(self.sketches_path())
+            current.buckets = sketches.from_frame(frame, s.amount, s.date, s.category, s.vendor)
+            current.exact = True
+            current.stamp(version)
+            current.save()
+        return current
+
+    def _sketch_columns(self):
+        s = self.schema
+        return list(dict.fromkeys([s.amount, s.date, s.category, *s.vendor]))
+
+    def _record_sketches(self, before, added=(), removed=None, frame=None):
+        """Fold a finished write into the sketches, or leave them stale for a rebuild"""
+        # Stores whose distributions were never read have no sketches to keep up
+        if not os.path.exists(self.sketches_path()):
+            return
+        import sketches
+
+        current = sketches.Sketches.load(self.sketches_path())
+        if not current.is_current(before):
+            return
+        s = self.schema
+        if frame is not None:
+            try:
+                typed = as_typed(frame.reindex(columns=self._sketch_columns()), s)
+            except (ValueError, TypeError):
+                # Values as_typed() can't read (e.g. an amount that isn't a number) are left to a rebuild
+                return
+            for period, buckets in sketches.from_frame(typed, s.amount, s.date, s.category, s.vendor).items():
+                current.merge(period, buckets)
+        else:
+            def values(rows):
+                return [(row[s.amount], row[s.date], row[s.category], sketches.vendor_of(row, s.vendor))
+                        for row in rows]
+
+            if removed is None:
+                # An update without the old row can't be taken out of the buckets
+                current.exact = False
+            current.update(values(added), values(removed or ()))
+        current.stamp(self.version())
+        current.save()
+
+    def _carry_sketches(self, before):
+        """Re-stamp the sketches after a compaction, which changes the files but not the rows"""
+        if not os.path.exists(self.sketches_path()):
+            return
+        import sketches
+
+        current = sketches.Sketches.load(self.sketches_path())
+        if current.is_current(before):
+            current.stamp(self.version())
+            current.save()
+
+    # -- text search ----------------------------------------------------------
+
+    def text_index_path(self):
+        """Return the directory of this table's trigram index"""
+        return f"{os.path.splitext(self.path)[0]}.{self.schema.table}.trigrams"
+
+    @perf.timed
+    def search(self, text, fuzzy=False, limit=20):
+        """Return the keys of the rows whose text fields contain text (in any case)
+
+        With fuzzy=True, return the keys of the (up to limit) rows whose text
+        shares the most trigrams with text instead, best match first.
+        """
+        index = self.text_index()
+        return index.similar(text, limit) if fuzzy else index.search(text)
+
+    def text_index(self):
+        """Return a trigram index that matches the stored data, building it if needed"""
+        import textindex
+
+        index = textindex.TextIndex.load(self.text_index_path())
+        if index is None or not index.is_current(self.version()) or index.needs_rebuild():
+            index = self.rebuild_text_index()
+        return index
+
+    @perf.timed
+    def rebuild_text_index(self):
+        """Index the text fields of every stored row"""
+        import textindex
+
+        with self.writing():
+            version = self.version()
+            frame = self.typed_frame(columns=self.schema.text)
+            return textindex.build(self.text_index_path(), frame[self.schema.key].tolist(),
+                                   textindex.documents(frame, self.schema.text), version)
+
+    def _record_text(self, before, keys, rows=None, frame=None):
+        """Add written rows to the trigram index's delta, or leave the index stale for a rebuild"""
+        # Stores that were never searched have no index to keep up (and don't need numpy)
+        if not os.path.isdir(self.text_index_path()):
+            return
+        import textindex
+
+        index = textindex.TextIndex.load(self.text_index_path())
+        if index is None or not index.is_current(before) or keys is None:
+            return
+        fields = self.schema.text
+        docs = textindex.documents(frame, fields) if frame is not None else [
+            textindex.document(row, fields) for row in rows]
+        index.add(keys, docs, self.version())
+
+    def _carry_text_index(self, before):
+        """Re-stamp the trigram index after a compaction, which changes the files but not the rows"""
+        if not os.path.isdir(self.text_index_path()):
+            return
+        import textindex
+
+        index = textindex.TextIndex.load(self.text_index_path())
+        if index is not None and index.is_current(before):
+            index.stamp(self.version())
+
+
+def merge_summaries(a, b):
+    """Combine two summary() results over disjoint rows"""
+    count = a["count"] + b["count"]
+    total = a["total"] + b["total"]
+    lows = [v for v in (a["min"], b["min"]) if v is not None]
+    highs = [v for v in (a["max"], b["max"]) if v is not None]
+    return {"count": count, "total": total, "mean": total / count if count else 0.0,
+            "min": min(lows) if lows else None, "max": max(highs) if highs else None}
+
+
+def merge_totals(a, b):
+    """Combine two totals_by() results over disjoint rows"""
+    buckets = {key: [total, count, low, high] for key, total, count, low, high in a}
+    for key, total, count, low, high in b:
+        entry = buckets.get(key)
+        if entry is None:
+            buckets[key] = [total, count, low, high]
+        else:
+            entry[0] += total
+            entry[1] += count
+            entry[2] = min(entry[2], low)
+            entry[3] = max(entry[3], high)
+    return [(key, *buckets[key]) for key in sorted(buckets)]
+
+
+class CsvStore(ExpenseStore):
+    """Expenses in a CSV file with an append-only journal (see journal.py)
+
+    If a columnar snapshot of the CSV file exists (see columnar.py), reads
+    and aggregates use it for the base rows and only parse the journal.
+    """
+
+    def __init__(self, path, schema):
+        super().__init__(path, schema)
+        self._table = None
+        self._offsets = None
+        # Hands out integer IDs without reading the file (see locking.py)
+        self._sequence = locking.Sequence(path, self._highest_id) if schema.numeric_key else None
+
+    def _columnar(self):
+        """Return the columnar snapshot of the base file if it exists and is current"""
+        if self.schema.fields != APP_SCHEMA.fields or not os.path.isdir(self.path + ".columns"):
+            return None
+        import columnar
+        if self._table is None or not self._table.is_fresh_for(self.path):
+            try:
+                self._table = columnar.ColumnarTable(columnar.snapshot_dir(self.path))
+            except FileNotFoundError:
+                return None
+        return self._table if self._table.is_fresh_for(self.path) else None
+
+    def _refresh_columnar(self, path):
+        """Rebuild the columnar snapshot after compaction, if the app uses one"""
+        if self.schema.fields == APP_SCHEMA.fields and os.path.isdir(path + ".columns"):
+            import columnar
+            self._table = columnar.convert(path)
+
+    def _compaction_hook(self):
+        """Return the callback journal.compact() runs once the new base file is in place"""
+        before = self.version()
+
+        def after(path):
+            import rowindex
+
+            with self.writing():
+                self._refresh_columnar(path)
+                # Re-index the new base file now rather than on the next lookup
+                if os.path.isdir(rowindex.index_dir(path)):
+                    self._offsets = rowindex.build(path, self.schema.key)
+                # Compaction changes the files but not the data, so carry the rollups over
+                rollups = Rollups.load(self.rollups_path())
+                if rollups.is_current(before):
+                    rollups.stamp(self.version())
+                    rollups.save()
+                self._carry_text_index(before)
+                self._carry_sketches(before)
+
+        return after
+
+    def _all_buckets(self):
+        # The snapshot's frame has lost the text of odd dates, which its totals_by() still buckets by
+        if self._columnar() is not None:
+            return None
+        return super()._all_buckets()
+
+    def _pending(self, journals):
+        """Return the rows journaled in the given files keyed by their key"""
+        return {row[self.schema.key]: row for op, row in journal.read_journal(self.path, journals)}
+
+    def _read_columnar(self, journals):
+        """Return the journaled rows and the columnar snapshot (or None), for journal.consistent_read()"""
+        return self._pending(journals), self._columnar()
+
+    @perf.timed
+    def iter_rows(self, start=None, end=None, category=None):
+        for row in journal.iter_merged(self.path, self.schema.key):
+            if self._matches(row, start, end, category):
+                yield row
+
+    @perf.timed
+    def get(self, key):
+        import rowindex
+
+        # The journal is checked first, then the base file through its offset index (see rowindex.py)
+        row, self._offsets = rowindex.fetch(self.path, self.schema.key, key, self._offsets)
+        return row
+
+    def _highest_id(self):
+        """Scan for the highest ID; only needed to seed the ID sequence"""
+        highest = 0
+        for row in journal.iter_merged(self.path, self.schema.key):
+            highest = max(highest, int(float(row[self.schema.key])))
+        return highest
+
+    def _insert(self, row):
+        row = dict(row)
+        if self.schema.numeric_key:
+            row[self.schema.key] = self._assign_ids([row.get(self.schema.key)])[0]
+        journal.append_record(self.path, self.schema.fields, row)
+        return row[self.schema.key]
+
+    def _insert_many(self, rows):
+        key = self.schema.key
+        rows = [dict(row) for row in rows]
+        if self.schema.numeric_key:
+            for row, value in zip(rows, self._assign_ids([row.get(key) for row in rows])):
+                row[key] = value
+        journal.append_records(self.path, self.schema.fields, rows)
+        return [row[key] for row in rows]
+
+    def _insert_frame(self, frame):
+        frame = frame.reindex(columns=self.schema.fields)
+        if self.schema.numeric_key:
+            self._assign_frame_ids(frame)
+        journal.append_frame(self.path, self.schema.fields, frame)
+        return frame[self.schema.key].tolist()
+
+    def _update(self, row, old=None):
+        journal.append_record(self.path, self.schema.fields, row, op="update")
+
+    def _after_write(self):
+        if journal.needs_compaction(self.path):
+            journal.maybe_compact(self.path, self.schema.key, self.schema.fields,
+                                  on_compacted=self._compaction_hook(), lock=self.writing)
+
+    def _replace_all(self, rows):
+        journal.write_snapshot(self.path, self.schema.fields, rows)
+        # The snapshot already contains every journaled change
+        journal.discard(self.path)
+        if self._sequence is not None:
+            self._sequence.reset()
+
+    def version(self):
+        version = []
+        for path in [self.path] + journal.journal_files(self.path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            version.append((path, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(version)
+
+    @perf.timed
+    def compact(self):
+        return journal.compact(self.path, self.schema.key, self.schema.fields,
+                               on_compacted=self._compaction_hook(), lock=self.writing)
+
+    @perf.timed
+    def sync(self):
+        journal.sync(self.path)
+
+    def _summary(self, start=None, end=None, category=None):
+        pending, table = journal.consistent_read(self.path, self._read_columnar)
+        if table is None:
+            return super()._summary(start, end, category)
+        # Journaled keys replace their snapshot rows, so leave those out of the snapshot
+        extra = [float(row[self.schema.amount]) for row in pending.values()
+                 if self._matches(row, start, end, category)]
+        exclude = [int(float(key)) for key in pending]
+        return merge_summaries(table.summary(start, end, category, exclude), self._summarize(extra))
+
+    def _totals_by(self, period, start=None, end=None, category=None):
+        pending, table = journal.consistent_read(self.path, self._read_columnar)
+        if table is None:
+            return super()._totals_by(period, start, end, category)
+        extra = [row for row in pending.values() if self._matches(row, start, end, category)]
+        exclude = [int(float(key)) for key in pending]
+        return merge_totals(table.totals_by(period, start, end, category, exclude),
+                            self._bucketize(period, extra))
+
+    def _typed_frame(self, columns=None, engine=None, start=None, end=None, category=None):
+        def read(journals):
+            # Journals first (see journal.consistent_read), though the base frame goes first
+            frames = [_read_journal_typed(path, self.schema, columns) for path in journals]
+            table = self._columnar()
+            if table is not None:
+                frames.insert(0, table.to_frame(cents=True)[_with_key(self.schema, columns)])
+            elif os.path.exists(self.path):
+                frames.insert(0, read_typed_csv(self.path, self.schema, columns, engine))
+            return frames
+
+        return _apply_journal(self.schema, journal.consistent_read(self.path, read), columns)
+
+    @perf.timed
+    def to_frame(self):
+        import pandas as pd
+
+        def read(journals):
+            frames = [_read_journal_csv(path, self.schema).drop(columns="op") for path in journals]
+            table = self._columnar()
+            if table is not None:
+                for frame in frames:
+                    # Match the snapshot's column types
+                    frame[self.schema.date] = _to_dates(frame[self.schema.date])
+                frames.insert(0, table.to_frame())
+            elif os.path.exists(self.path):
+                frames.insert(0, pd.read_csv(self.path))
+            return frames
+
+        frames = [frame for frame in journal.consistent_read(self.path, read) if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=self.schema.fields)
+
+        # Journal rows come last, so keeping the last copy of a key applies updates
+        df = pd.concat(frames, ignore_index=True)
+        return df.drop_duplicates(subset=self.schema.key, keep="last").reset_index(drop=True)
+
+
+class SqliteStore(ExpenseStore):
+    """Expenses in a SQLite table in WAL mode, indexed on date and category"""
+
+    def __init__(self, path, schema):
+        super().__init__(path, schema)
+        # One connection per thread; Streamlit serves each session on its own thread
+        self._local = threading.local()
+        self._create_tables()
+
+    @staticmethod
+    def _quote(column):
+        return '"' + column.replace('"', '""') + '"'
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.create_function("iso_week", 1, iso_week, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self):
+        s, q = self.schema, self._quote
+        columns = []
+        for field in s.fields:
+            if field == s.key:
+                columns.append(f"{q(field)} {'INTEGER' if s.numeric_key else 'TEXT'} PRIMARY KEY")
+            elif field == s.amount:
+                columns.append(f"{q(field)} REAL NOT NULL")
+            else:
+                columns.append(f"{q(field)} TEXT")
+        conn = self._connect()
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {q(s.table)} ({', '.join(columns)})")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {q(s.table + '_date')} ON {q(s.table)} ({q(s.date)})")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {q(s.table + '_category')} "
+                         f"ON {q(s.table)} ({q(s.category)} COLLATE NOCASE, {q(s.date)})")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+
+    def _where(self, start, end, category):
+        s, q = self.schema, self._quote
+        clauses, params = [], []
+        if start is not None:
+            clauses.append(f"{q(s.date)} >= ?")
+            params.append(str(start))
+        if end is not None:
+            clauses.append(f"{q(s.date)} <= ?")
+            params.append(str(end))
+        if category is not None:
+            clauses.append(f"{q(s.category)} = ? COLLATE NOCASE")
+            params.append(category)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _row(self, row):
+        return {key: ("" if row[key] is None else row[key]) for key in row.keys()}
+
+    def _bump_version(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+
+    @perf.timed
+    def iter_rows(self, start=None, end=None, category=None):
+        s, q = self.schema, self._quote
+        where, params = self._where(start, end, category)
+        cursor = self._connect().execute(f"SELECT * FROM {q(s.table)}{where} ORDER BY rowid", params)
+        for row in cursor:
+            yield self._row(row)
+
+    @perf.timed
+    def get(self, key):
+        s, q = self.schema, self._quote
+        row = self._connect().execute(f"SELECT * FROM {q(s.table)} WHERE {q(s.key)} = ?", [key]).fetchone()
+        return None if row is None else self._row(row)
+
+    def _insert_sql(self, row):
+        fields = [f for f in self.schema.fields if row.get(f) not in (None, "") or f != self.schema.key]
+        placeholders = ", ".join("?" for _ in fields)
+        columns = ", ".join(self._quote(f) for f in fields)
+        return f"INSERT INTO {self._quote(self.schema.table)} ({columns}) VALUES ({placeholders})", fields
+
+    def _insert(self, row):
+        sql, fields = self._insert_sql(row)
+        conn = self._connect()
+        with conn:
+            # Letting SQLite pick integer IDs keeps concurrent sessions from colliding
+            cursor = conn.execute(sql, [row.get(f) for f in fields])
+            self._bump_version(conn)
+        return row.get(self.schema.key) or cursor.lastrowid
+
+    def _insert_many(self, rows):
+        keys = []
+        conn = self._connect()
+        with conn:
+            for row in rows:
+                sql, fields = self._insert_sql(row)
+                cursor = conn.execute(sql, [row.get(f) for f in fields])
+                keys.append(row.get(self.schema.key) or cursor.lastrowid)
+            self._bump_version(conn)
+        return keys
+
+    def _insert_frame(self, frame):
+        s, q = self.schema, self._quote
+        # Leave the key out when SQLite should number the rows
+        fields = [f for f in s.fields if f in frame.columns and not (f == s.key and frame[f].isna().all())]
+        columns = ", ".join(q(f) for f in fields)
+        placeholders = ", ".join("?" for _ in fields)
+        conn = self._connect()
+        with conn:
+            conn.executemany(f"INSERT INTO {q(s.table)} ({columns}) VALUES ({placeholders})",
+                             frame[fields].itertuples(index=False, name=None))
+            self._bump_version(conn)
+        # executemany() doesn't report the IDs SQLite picked
+        return frame[s.key].tolist() if s.key in fields else None
+
+    def _update(self, row, old=None):
+        s, q = self.schema, self._quote
+        fields = [f for f in s.fields if f != s.key]
+        assignments = ", ".join(f"{q(f)} = ?" for f in fields)
+        conn = self._connect()
+        with conn:
+            conn.execute(f"UPDATE {q(s.table)} SET {assignments} WHERE {q(s.key)} = ?",
+                         [row.get(f) for f in fields] + [row[s.key]])
+            self._bump_version(conn)
+
+    def _replace_all(self, rows):
+        conn = self._connect()
+        with conn:
+            conn.execute(f"DELETE FROM {self._quote(self.schema.table)}")
+            for row in rows:
+                sql, fields = self._insert_sql(row)
+                conn.execute(sql, [row.get(f) for f in fields])
+            self._bump_version(conn)
+
+    def version(self):
+        return self._connect().execute("SELECT value FROM meta WHERE name = 'version'").fetchone()[0]
+
+    @perf.timed
+    def compact(self):
+        self._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+    @perf.timed
+    def sync(self):
+        # With synchronous=NORMAL the last commits may live only in the unsynced WAL
+        self._connect().execute("PRAGMA wal_checkpoint(FULL)")
+
+    @perf.timed
+    def to_frame(self):
+        import pandas as pd
+        return pd.read_sql_query(f"SELECT * FROM {self._quote(self.schema.table)} ORDER BY rowid", self._connect())
+
+    def _typed_frame(self, columns=None, engine=None, start=None, end=None, category=None):
+        import pandas as pd
+
+        # The date and category filters use the table's indexes
+        where, params = self._where(start, end, category)
+        selected = ", ".join(self._quote(f) for f in _with_key(self.schema, columns))
+        frame = pd.read_sql_query(f"SELECT {selected} FROM {self._quote(self.schema.table)}{where} ORDER BY rowid",
+                                  self._connect(), params=params)
+        return as_typed(frame, self.schema)
+
+    def _summary(self, start=None, end=None, category=None):
+        amount = self._quote(self.schema.amount)
+        where, params = self._where(start, end, category)
+        count, total, low, high = self._connect().execute(
+            f"SELECT COUNT(*), TOTAL({amount}), MIN({amount}), MAX({amount}) "
+            f"FROM {self._quote(self.schema.table)}{where}", params
+        ).fetchone()
+        return {"count": count, "total": total, "mean": total / count if count else 0.0,
+                "min": low, "max": high}
+
+    def _totals_by(self, period, start=None, end=None, category=None):
+        s, q = self.schema, self._quote
+        bucket = {
+            "day": q(s.date),
+            "week": f"iso_week({q(s.date)})",
+            "month": f"substr({q(s.date)}, 1, 7)",
+            "category": q(s.category),
+        }.get(period)
+        if bucket is None:
+            raise ValueError(f"Unknown period: {period}")
+        where, params = self._where(start, end, category)
+        amount = q(s.amount)
+        cursor = self._connect().execute(
+            f"SELECT {bucket} AS bucket, TOTAL({amount}), COUNT(*), MIN({amount}), MAX({amount}) "
+            f"FROM {q(s.table)}{where} GROUP BY bucket ORDER BY bucket", params
+        )
+        return [tuple(row) for row in cursor]
+
+
+class PartitionedStore(ExpenseStore):
+    """Expenses split into one CSV file per month in a folder (see partitions.py)
+
+    Every partition is a CSV file with its own journal, so a write appends
+    only to the journal of its row's month. Date-range queries read only the
+    partitions overlapping the range, and partitions that lie wholly inside
+    it are answered from the manifest's per-category totals without being
+    read at all.
+    """
+
+    def __init__(self, path, schema):
+        super().__init__(path, schema)
+        os.makedirs(path, exist_ok=True)
+        self._offsets = {}
+        if schema.numeric_key:
+            self._sequence = locking.Sequence(os.path.join(path, "ids"), self._highest_id)
+
+    def adopt(self, source):
+        """Split a single-file CSV store into partitions, the first time the folder is used"""
+        with self.writing():
+            manifest = partitions.Manifest(self.path)
+            if os.path.exists(manifest.path):
+                return False
+            if not self._files() and (os.path.exists(source) or journal.journal_files(source)):
+                self.replace_all(CsvStore(source, self.schema).iter_rows())
+                return True
+            # The manifest marks the folder as in use, even while it's empty
+            manifest.save()
+            return False
+
+    # -- partitions -----------------------------------------------------------
+
+    def _file(self, name):
+        return os.path.join(self.path, name + ".csv")
+
+    def _create(self, name):
+        """Start a partition with an empty base file
+
+        Compacting a journal renames it, and a directory scan at that moment
+        may see neither name; the base file keeps the partition visible.
+        """
+        journal.write_snapshot(self._file(name), self.schema.fields, [])
+
+    def _files(self):
+        """Return {partition: version} for every partition with files on disk"""
+        files = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                match = partitions.PARTITION_FILE.match(entry.name)
+                if match is None:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.setdefault(match.group(1), []).append(
+                    (entry.name, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return {name: tuple(sorted(stats)) for name, stats in files.items()}
+
+    def _partition_version(self, name):
+        """Return a value that changes whenever one partition's files change"""
+        base = self._file(name)
+        stats = []
+        for path in [base] + journal.journal_files(base):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(sorted(stats))
+
+    def partitions(self, start=None, end=None):
+        """Return the partitions that may hold rows from start to end, oldest month first"""
+        names = [name for name in self._files() if partitions.overlaps(name, start, end)]
+        return sorted(names, key=lambda name: (name == partitions.UNDATED, name))
+
+    def _scan(self, name, start=None, end=None, category=None):
+        for row in journal.iter_merged(self._file(name), self.schema.key):
+            if self._matches(row, start, end, category):
+                yield row
+
+    def _entries(self, names):
+        """Return the manifest entries of the named partitions, recomputing stale ones"""
+        manifest = partitions.Manifest.load(self.path)
+        if any(manifest.current(name, self._partition_version(name)) is None for name in names):
+            s = self.schema
+            with self.writing():
+                manifest = partitions.Manifest.load(self.path)
+                for name in names:
+                    version = self._partition_version(name)
+                    if manifest.current(name, version) is None:
+                        entry = partitions.new_entry()
+                        for row in self._scan(name):
+                            partitions.add_row(entry, row[s.amount], row[s.date], row[s.category])
+                        manifest.set(name, version, entry)
+                manifest.save()
+        return {name: manifest.entries[name] for name in names}
+
+    def _append(self, manifest, name, rows, op="insert"):
+        """Append journal records to one partition and keep its manifest entry current"""
+        s = self.schema
+        before = self._partition_version(name)
+        if not before:
+            self._create(name)
+        journal.append_records(self._file(name), s.fields, rows, op)
+        entry = manifest.current(name, before)
+        if entry is None and not before:
+            entry = partitions.new_entry()
+        if op != "insert" or entry is None:
+            # Updates and deletes can't be taken out of the min/max; recount on the next read
+            manifest.drop(name)
+            return
+        for row in rows:
+            partitions.add_row(entry, row[s.amount], row[s.date], row[s.category])
+        manifest.set(name, self._partition_version(name), entry)
+
+    # -- rows -----------------------------------------------------------------
+
+    @perf.timed
+    def iter_rows(self, start=None, end=None, category=None):
+        for name in self.partitions(start, end):
+            yield from self._scan(name, start, end, category)
+
+    def _highest_id(self):
+        """Scan for the highest ID; only needed to seed the ID sequence"""
+        highest = 0
+        for name in self.partitions():
+            for row in self._scan(name):
+                highest = max(highest, int(float(row[self.schema.key])))
+        return highest
+
+    def _insert(self, row):
+        row = dict(row)
+        if self.schema.numeric_key:
+            row[self.schema.key] = self._assign_ids([row.get(self.schema.key)])[0]
+        self._append_rows([row])
+        return row[self.schema.key]
+
+    def _insert_many(self, rows):
+        s = self.schema
+        rows = [dict(row) for row in rows]
+        if s.numeric_key:
+            for row, value in zip(rows, self._assign_ids([row.get(s.key) for row in rows])):
+                row[s.key] = value
+        self._append_rows(rows)
+        return [row[s.key] for row in rows]
+
+    def _append_rows(self, rows):
+        """Append inserted rows to the journals of their months"""
+        s = self.schema
+        groups = {}
+        for row in rows:
+            groups.setdefault(partitions.partition_of(row[s.date]), []).append(row)
+        manifest = partitions.Manifest.load(self.path)
+        for name, group in groups.items():
+            self._append(manifest, name, group)
+        manifest.save()
+
+    def _insert_frame(self, frame):
+        import aggregate
+        import pandas as pd
+
+        s = self.schema
+        frame = frame.reindex(columns=s.fields)
+        if s.numeric_key:
+            self._assign_frame_ids(frame)
+        dates = frame[s.date].astype(str)
+        dated = (dates.str.len() == 10) & pd.to_datetime(dates, format="%Y-%m-%d", errors="coerce").notna()
+        names = dates.str[:7].where(dated, partitions.UNDATED)
+        manifest = partitions.Manifest.load(self.path)
+        for name, group in frame.groupby(names, sort=False):
+            path = self._file(name)
+            before = self._partition_version(name)
+            if not before:
+                self._create(name)
+            journal.append_frame(path, s.fields, group)
+            entry = manifest.current(name, before)
+            if entry is None and not before:
+                entry = partitions.new_entry()
+            if entry is None:
+                manifest.drop(name)
+                continue
+            if name != partitions.UNDATED:
+                group_dates = dates[group.index]
+                entry["min"] = min(filter(None, [entry["min"], group_dates.min()]))
+                entry["max"] = max(filter(None, [entry["max"], group_dates.max()]))
+            entry["rows"] += len(group)
+            buckets = aggregate.from_frame(group, s.amount, s.date, s.category, periods=("category",))
+            merge_buckets(entry["categories"], buckets["category"])
+            manifest.set(name, self._partition_version(name), entry)
+        manifest.save()
+        return frame[s.key].tolist()
+
+    def _fetch(self, name, key):
+        """Return a key's row from one partition (journal first, then the offset index), or None"""
+        import rowindex
+
+        row, self._offsets[name] = rowindex.fetch(self._file(name), self.schema.key, key, self._offsets.get(name))
+        return row
+
+    def _locate(self, key, first):
+        """Return the partition holding a key, trying the partition named first before the rest"""
+        names = self.partitions()
+        for name in sorted(names, key=lambda name: name != first):
+            if self._fetch(name, key) is not None:
+                return name
+        return None
+
+    @perf.timed
+    def get(self, key):
+        for name in self.partitions():
+            row = self._fetch(name, key)
+            if row is not None:
+                return row
+        return None
+
+    def _update(self, row, old=None):
+        s = self.schema
+        name = partitions.partition_of(row[s.date])
+        source = partitions.partition_of(old[s.date]) if old is not None else self._locate(row[s.key], name)
+        manifest = partitions.Manifest.load(self.path)
+        if source is not None and source != name:
+            # The date moved the row to another month
+            self._append(manifest, source, [row], op="delete")
+        self._append(manifest, name, [row], op="update")
+        manifest.save()
+
+    def _replace_all(self, rows):
+        s = self.schema
+        manifest = partitions.Manifest(self.path)
+        files, entries = {}, {}
+        try:
+            for row in rows:
+                name = partitions.partition_of(row[s.date])
+                writer = files.get(name)
+                if writer is None:
+                    file = open(f"{self._file(name)}.{os.getpid()}.tmp", mode="w", newline="")
+                    writer = files[name] = (file, csv.DictWriter(file, fieldnames=s.fields, extrasaction="ignore"))
+                    writer[1].writeheader()
+                    entries[name] = partitions.new_entry()
+                writer[1].writerow(row)
+                partitions.add_row(entries[name], row[s.amount], row[s.date], row[s.category])
+            for file, _ in files.values():
+                file.flush()
+                os.fsync(file.fileno())
+        finally:
+            for file, _ in files.values():
+                file.close()
+        # The new files already contain every journaled change
+        for name in self.partitions():
+            journal.discard(self._file(name))
+            if name not in files and os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        for name, (file, _) in files.items():
+            os.replace(file.name, self._file(name))
+            manifest.set(name, self._partition_version(name), entries[name])
+        manifest.save()
+        if self._sequence is not None:
+            self._sequence.reset()
+
+    def version(self):
+        return tuple(sorted(self._files().items()))
+
+    def rollups_path(self):
+        return os.path.join(self.path, f"{self.schema.table}.rollups.json")
+
+    def text_index_path(self):
+        return os.path.join(self.path, f"{self.schema.table}.trigrams")
+
+    def sketches_path(self):
+        return os.path.join(self.path, f"{self.schema.table}.sketches.json")
+
+    def _compaction_hook(self, name):
+        """Return the callback that carries the rollups and the manifest over a partition's compaction"""
+        before, partition_before = self.version(), self._partition_version(name)
+
+        def after(path):
+            import rowindex
+
+            with self.writing():
+                if os.path.isdir(rowindex.index_dir(path)):
+                    self._offsets[name] = rowindex.build(path, self.schema.key)
+                # Compaction changes the files but not the data
+                manifest = partitions.Manifest.load(self.path)
+                entry = manifest.current(name, partition_before)
+                if entry is not None:
+                    manifest.set(name, self._partition_version(name), entry)
+                    manifest.save()
+                rollups = Rollups.load(self.rollups_path())
+                if rollups.is_current(before):
+                    rollups.stamp(self.version())
+                    rollups.save()
+                self._carry_text_index(before)
+                self._carry_sketches(before)
+
+        return after
+
+    def _after_write(self):
+        for name in self.partitions():
+            path = self._file(name)
+            if journal.needs_compaction(path):
+                journal.maybe_compact(path, self.schema.key, self.schema.fields,
+                                      on_compacted=self._compaction_hook(name), lock=self.writing)
+
+    @perf.timed
+    def compact(self):
+        compacted = False
+        for name in self.partitions():
+            path = self._file(name)
+            if journal.journal_files(path):
+                compacted = journal.compact(path, self.schema.key, self.schema.fields,
+                                            on_compacted=self._compaction_hook(name),
+                                            lock=self.writing) or compacted
+        return compacted
+
+    @perf.timed
+    def sync(self):
+        for name in self.partitions():
+            journal.sync(self._file(name))
+
+    @perf.timed
+    def to_frame(self):
+        import pandas as pd
+        frames = []
+        for name in self.partitions():
+            path = self._file(name)
+
+            def read(journals):
+                parts = [_read_journal_csv(jpath, self.schema) for jpath in journals]
+                if os.path.exists(path):
+                    parts.insert(0, pd.read_csv(path).assign(op="insert"))
+                return parts, bool(journals)
+
+            parts, journaled = journal.consistent_read(path, read)
+            parts = [part for part in parts if not part.empty]
+            if not parts:
+                continue
+            frame = pd.concat(parts, ignore_index=True)
+            if journaled:
+                # Journal records come last, so the last copy of a key is the current one
+                frame = frame.drop_duplicates(subset=self.schema.key, keep="last")
+                frame = frame[frame["op"] != "delete"]
+            frames.append(frame.drop(columns="op"))
+        if not frames:
+            return pd.DataFrame(columns=self.schema.fields)
+        return pd.concat(frames, ignore_index=True)[self.schema.fields]
+
+    def _typed_frame(self, columns=None, engine=None, start=None, end=None, category=None):
+        s = self.schema
+        frames = []
+        # Months outside the date range are never read
+        for name in self.partitions(start, end):
+            path = self._file(name)
+
+            def read(journals):
+                parts = [_read_journal_typed(jpath, s, columns) for jpath in journals]
+                if os.path.exists(path):
+                    parts.insert(0, read_typed_csv(path, s, columns, engine))
+                return parts
+
+            frames.append(_apply_journal(s, journal.consistent_read(path, read), columns))
+        return _stack(s, frames, columns)
+
+    # -- aggregates -------------------------------------------------------------
+
+    def _summary(self, start=None, end=None, category=None):
+        names = self.partitions(start, end)
+        entries = self._entries(names)
+        whole, amounts = {}, []
+        for name in names:
+            if partitions.covers(entries[name], start, end):
+                for bucket in partitions.category_totals(entries[name], category).values():
+                    merge_buckets(whole, {name: list(bucket)})
+            else:
+                amounts += [float(row[self.schema.amount]) for row in self._scan(name, start, end, category)]
+        return merge_summaries(partitions.summarize(whole), self._summarize(amounts))
+
+    def _totals_by(self, period, start=None, end=None, category=None):
+        names = self.partitions(start, end)
+        # Only month and category buckets can be read off a partition's manifest entry
+        entries = self._entries(names) if period in ("month", "category") else {}
+        whole, rows = {}, []
+        for name in names:
+            entry = entries.get(name)
+            if (entry is not None and partitions.covers(entry, start, end)
+                    and (period == "category" or name != partitions.UNDATED)):
+                for label, bucket in partitions.category_totals(entry, category).items():
+                    merge_buckets(whole, {label if period == "category" else name: list(bucket)})
+            else:
+                rows.extend(self._scan(name, start, end, category))
+        totals = [(key, total / 100, count, low / 100, high / 100)
+                  for key, (total, count, low, high) in sorted(whole.items())]
+        return merge_totals(totals, self._bucketize(period, rows))
+
+
+def open_store(path, schema, backend=None):
+    """Open the configured backend for a data file such as "expenses.csv"
+
+    The SQLite backend keeps its data next to the CSV file, in a .db file
+    with the same base name, and the partitioned backend in a .parts folder.
+    The first time the partitioned backend is used, the rows of an existing
+    CSV file are split into it (the CSV file is left as it was).
+    """
+    backend = (backend or BACKEND).lower()
+    if backend == "csv":
+        return CsvStore(path, schema)
+    if backend == "sqlite":
+        return SqliteStore(os.path.splitext(path)[0] + ".db", schema)
+    if backend == "partitioned":
+        store = PartitionedStore(os.path.splitext(path)[0] + ".parts", schema)
+        store.adopt(path)
+        return store
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy expenses from a CSV file into another backend")
+    parser.add_argument("path", nargs="?", default="expenses.csv")
+    parser.add_argument("--cli", action="store_true", help="the file uses the command-line app's layout")
+    parser.add_argument("--backend", choices=["sqlite", "partitioned"], default="sqlite")
+    args = parser.parse_args()
+
+    schema = CLI_SCHEMA if args.cli else APP_SCHEMA
+    source = CsvStore(args.path, schema)
+    target = open_store(args.path, schema, backend=args.backend)
+    target.replace_all(source.iter_rows())
+    print(f"Copied {target.summary()['count']} rows into {target.path}")
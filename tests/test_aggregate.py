@@ -0,0 +1,84 @@
+"""Vectorized aggregation matching the row-at-a-time rollups buckets (see aggregate.py)"""
+import random
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import aggregate
+import storage
+from rollups import PERIODS, Rollups, iso_week
+
+# Hand-edited dates the rollups bucket by their text
+ODD_DATES = ["2024-1-5", "someday", "2024-01-05 10:00", "2024/01/05"]
+
+
+def random_rows(count, seed=7):
+    rng = random.Random(seed)
+    # Spans ISO weeks that start and end in another year (2020-W53, 2025-W01)
+    first = date(2020, 12, 20)
+    rows = []
+    for i in range(count):
+        if rng.random() < 0.05:
+            row_date = rng.choice(ODD_DATES)
+        else:
+            row_date = (first + timedelta(days=rng.randrange(4 * 366 + 30))).isoformat()
+        rows.append({"ID": i + 1, "Name": f"row {i}", "Amount": round(rng.uniform(-20, 500), 2),
+                     "Date": row_date, "Category": rng.choice(["Food", "Rent", "Fun", "Other"])})
+    return rows
+
+
+def one_at_a_time(rows, tmp_path):
+    rollups = Rollups(str(tmp_path / "rollups.json"))
+    for row in rows:
+        rollups.add(row["Amount"], row["Date"], row["Category"])
+    return rollups.buckets
+
+
+def test_from_frame_matches_adding_rows_one_at_a_time(tmp_path):
+    rows = random_rows(2000)
+    result = aggregate.from_frame(pd.DataFrame(rows), "Amount", "Date", "Category")
+    assert result == one_at_a_time(rows, tmp_path)
+
+
+def test_parsed_dates_give_the_same_buckets(tmp_path):
+    rows = [row for row in random_rows(500) if row["Date"] not in ODD_DATES]
+    frame = pd.DataFrame(rows)
+    frame["Date"] = pd.to_datetime(frame["Date"])
+    assert aggregate.from_frame(frame, "Amount", "Date", "Category") == one_at_a_time(rows, tmp_path)
+
+
+def test_only_the_requested_periods_are_built(tmp_path):
+    rows = random_rows(200)
+    result = aggregate.from_frame(pd.DataFrame(rows), "Amount", "Date", "Category", periods=("week",))
+    assert result == {"week": one_at_a_time(rows, tmp_path)["week"]}
+
+
+def test_no_rows_gives_empty_buckets():
+    result = aggregate.aggregate(np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+    assert result == {period: {} for period in PERIODS}
+
+
+def test_week_labels_match_iso_weeks():
+    days = np.arange(date(2019, 12, 1).toordinal(), date(2027, 1, 31).toordinal()) - date(1970, 1, 1).toordinal()
+    mondays = days - (days + 3) % 7
+    expected = [iso_week((date(1970, 1, 1) + timedelta(days=int(day))).isoformat()) for day in days]
+    assert aggregate.week_labels(mondays) == expected
+
+
+def test_to_rows_matches_rollups_totals_by(tmp_path):
+    rows = random_rows(300)
+    rollups = Rollups(str(tmp_path / "rollups.json"))
+    rollups.buckets = aggregate.from_frame(pd.DataFrame(rows), "Amount", "Date", "Category")
+    for period in PERIODS:
+        assert aggregate.to_rows(rollups.buckets[period]) == rollups.totals_by(period)
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite", "partitioned"])
+def test_store_rebuilds_match_the_rows(backend, tmp_path):
+    store = storage.open_store(str(tmp_path / "expenses.csv"), storage.APP_SCHEMA, backend=backend)
+    rows = random_rows(600)
+    store.insert_frame(pd.DataFrame(rows[:400]))
+    store.insert_many(rows[400:])
+    assert store.rebuild_rollups().buckets == one_at_a_time(store.iter_rows(), tmp_path)
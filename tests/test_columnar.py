@@ -0,0 +1,45 @@
+"""The columnar snapshot against the CSV file it mirrors (see columnar.py)"""
+import shutil
+
+import pytest
+
+import columnar
+import storage
+
+ROWS = """ID,Name,Amount,Date,Category
+1,rent,900.00,2024-01-01,Rent
+2,lunch,12.50,2024-01-05,Food
+3,coffee,4.25,3/2/2024,Food
+4,books,30.00,2024-1-5,Fun
+"""
+
+
+@pytest.fixture
+def stores(tmp_path):
+    path, plain = str(tmp_path / "expenses.csv"), str(tmp_path / "plain.csv")
+    with open(path, "w") as file:
+        file.write(ROWS)
+    shutil.copy(path, plain)
+    columnar.convert(path)
+    snapshot, csv_only = storage.CsvStore(path, storage.APP_SCHEMA), storage.CsvStore(plain, storage.APP_SCHEMA)
+    assert snapshot._columnar() is not None and csv_only._columnar() is None
+    return snapshot, csv_only
+
+
+def test_odd_dates_keep_their_text(stores):
+    snapshot, csv_only = stores
+    table = snapshot._columnar()
+    assert table.odd_dates() == {2: "3/2/2024", 3: "2024-1-5"}
+    assert table.to_frame()["Date"].isna().tolist() == [False, False, True, True]
+    assert snapshot.typed_frame()["Date"].isna().sum() == 2
+
+
+@pytest.mark.parametrize("scope", [(), ("2024-01-01", "2024-12-31"), (None, "2024-01-03"), (None, None, "food")])
+def test_snapshot_matches_the_csv_file(stores, scope):
+    snapshot, csv_only = stores
+    for store in stores:
+        # A journaled row on top of the snapshot
+        store.insert({"ID": 5, "Name": "taxi", "Amount": 8.0, "Date": "9/9/2024", "Category": "Fun"})
+    assert snapshot.summary(*scope) == csv_only.summary(*scope)
+    for period in storage.PERIODS:
+        assert snapshot.totals_by(period, *scope) == csv_only.totals_by(period, *scope)
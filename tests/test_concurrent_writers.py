@@ -0,0 +1,11 @@
+"""Parallel writers against each backend (a smaller run of benchmarks/stress_writers.py)"""
+import pytest
+
+from benchmarks import stress_writers
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite", "partitioned"])
+def test_parallel_writers_lose_and_duplicate_nothing(tmp_path, backend):
+    problems = stress_writers.run(str(tmp_path / "expenses.csv"), backend,
+                                  processes=3, threads=3, inserts=60, compact_every=20)
+    assert problems == []
@@ -0,0 +1,50 @@
+"""Statement imports matched against the rows already stored (see importer.deduplicate)"""
+import pytest
+
+import importer
+import storage
+
+STATEMENT = """Date,Description,Amount
+2024-01-05,COFFEE,-3.50
+2024-01-05,COFFEE,-3.50
+2024-01-09,TAXI,-12.25
+2024-02-14,FLOWERS,-40.00
+"""
+
+
+@pytest.fixture(params=["csv", "sqlite", "partitioned"])
+def store(request, tmp_path):
+    return storage.open_store(str(tmp_path / "expenses.csv"), storage.APP_SCHEMA, backend=request.param)
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_importing_twice_stores_each_row_once(store, tmp_path):
+    path = write(tmp_path, "statement.csv", STATEMENT)
+    assert importer.import_statements(store, [path], workers=1)["imported"] == 4
+    report = importer.import_statements(store, [path], workers=1)
+    assert (report["imported"], report["duplicates"]) == (0, 4)
+    assert store.summary()["count"] == 4
+
+
+def test_repeats_beyond_the_stored_ones_are_new(store, tmp_path):
+    store.insert({"Name": "COFFEE", "Amount": 3.5, "Date": "2024-01-05", "Category": "Other"})
+    # Same name and amount on another day, outside the statement's dates
+    store.insert({"Name": "TAXI", "Amount": 12.25, "Date": "2023-12-31", "Category": "Other"})
+    report = importer.import_statements(store, [write(tmp_path, "statement.csv", STATEMENT)], workers=1)
+    assert (report["imported"], report["duplicates"]) == (3, 1)
+
+
+def test_keyed_rows_match_on_the_key(tmp_path):
+    store = storage.open_store(str(tmp_path / "expenses.csv"), storage.CLI_SCHEMA, backend="csv")
+    statement = write(tmp_path, "statement.csv", "Date,Description,Amount,transaction_id\n"
+                                                 "2024-01-05,COFFEE,-3.50,A1\n2024-01-05,COFFEE,-3.50,A2\n")
+    assert importer.import_statements(store, [statement], workers=1)["imported"] == 2
+    again = write(tmp_path, "again.csv", "Date,Description,Amount,transaction_id\n"
+                                         "2023-06-01,RENAMED,-9.00,A1\n2024-01-06,TEA,-2.00,B1\n")
+    report = importer.import_statements(store, [again], workers=1)
+    assert (report["imported"], report["duplicates"]) == (1, 1)
@@ -0,0 +1,91 @@
+"""Journal reads racing compactions (see journal.consistent_read)"""
+import threading
+
+import pytest
+
+import journal
+import storage
+
+FIELDS = ["id", "name"]
+
+
+def _rows(start, stop):
+    return [{"id": str(i), "name": f"row {i}"} for i in range(start, stop)]
+
+
+def test_merged_rows_survive_a_compaction_between_listing_and_reading(tmp_path):
+    path = str(tmp_path / "data.csv")
+    journal.write_snapshot(path, FIELDS, _rows(0, 5))
+    journal.append_records(path, FIELDS, _rows(5, 10))
+    calls = []
+
+    def read(journals):
+        calls.append(list(journals))
+        if len(calls) == 1:
+            # The journal listed above is folded into the base file and removed
+            journal.compact(path, "id", FIELDS)
+        return [row for _, row in journal.read_journal(path, journals)]
+
+    assert journal.consistent_read(path, read) == []
+    assert calls[0] and calls[1] == []
+    assert [row["id"] for row in journal.iter_merged(path, "id")] == [str(i) for i in range(10)]
+
+
+def test_read_starts_over_when_the_files_are_swapped(tmp_path):
+    path = str(tmp_path / "data.csv")
+    journal.append_records(path, FIELDS, _rows(0, 3))
+    calls = []
+
+    def read(journals):
+        calls.append(list(journals))
+        if len(calls) == 1:
+            # Compact, then write to a new live journal with the old one's name
+            journal.compact(path, "id", FIELDS)
+            journal.append_records(path, FIELDS, _rows(3, 4))
+        return [row["id"] for _, row in journal.read_journal(path, journals)]
+
+    assert journal.consistent_read(path, read) == ["3"]
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("backend", ["csv", "partitioned"])
+def test_readers_never_see_rows_disappear_while_compacting(tmp_path, backend):
+    store = storage.open_store(str(tmp_path / "expenses.csv"), storage.APP_SCHEMA, backend=backend)
+    done = threading.Event()
+    problems = []
+
+    def write():
+        try:
+            for i in range(300):
+                store.insert({"Name": f"n{i}", "Amount": 1.5, "Date": "2024-01-05", "Category": "Food"})
+                if i % 20 == 19:
+                    store.compact()
+        finally:
+            done.set()
+
+    def read(count):
+        seen = 0
+        while not done.is_set():
+            try:
+                rows = count()
+            except FileNotFoundError as error:
+                problems.append(repr(error))
+                continue
+            if rows < seen:
+                problems.append(f"{count.__name__}: {seen} rows, then {rows}")
+            seen = rows
+
+    def iter_rows():
+        return sum(1 for _ in store.iter_rows())
+
+    def typed_frame():
+        return len(store.typed_frame())
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read, args=(count,))
+                                                  for count in (iter_rows, typed_frame)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert problems == []
+    assert len(store.to_frame()) == 300
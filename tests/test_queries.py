@@ -0,0 +1,84 @@
+"""Parsing filter expressions (see queries.parse)"""
+from datetime import date
+
+import pytest
+
+import queries
+import storage
+
+
+def parse(text):
+    return queries.parse(text, storage.CLI_SCHEMA)
+
+
+def test_conditions_sort_and_limit():
+    query = parse("category=food and date>=2024-01-01 and amount>50 sort amount desc limit 20")
+    assert [(c.field, c.op, c.value, c.kind) for c in query.conditions] == [
+        ("category", "=", "food", "text"),
+        ("date", ">=", date(2024, 1, 1), "date"),
+        ("amount", ">", 5000, "amount"),
+    ]
+    assert (query.sort, query.descending, query.limit) == ("amount", True, 20)
+
+
+def test_quoted_values_aliases_and_field_names():
+    query = parse('name~"coffee shop" and store_name=\'Blue Bottle\' sort date')
+    assert [(c.field, c.op, c.value) for c in query.conditions] == [
+        ("name", "~", "coffee shop"), ("Store Name", "=", "Blue Bottle")]
+    assert (query.sort, query.descending, query.limit) == ("date", False, None)
+
+
+def test_amounts_are_cents_and_numeric_ids_are_ints():
+    assert [c.value for c in parse("amount<=$12.34 and amount>5").conditions] == [1234, 500]
+    query = queries.parse("id=42", storage.APP_SCHEMA)
+    assert (query.conditions[0].field, query.conditions[0].value, query.conditions[0].kind) == ("ID", 42, "key")
+
+
+def test_empty_query_matches_everything():
+    query = parse("")
+    assert (query.conditions, query.sort, query.limit) == ([], None, None)
+
+
+@pytest.mark.parametrize("text, message", [
+    ("colour=red", "Unknown field 'colour'"),
+    ("amount>lots", "'lots' is not an amount"),
+    ("amount>inf", "'inf' is not an amount"),
+    ("amount<-inf", "'-inf' is not an amount"),
+    ("amount=nan", "'nan' is not an amount"),
+    ("amount>1e307", "'1e307' is not an amount"),
+    ("date=3/2/2024", "is not a date"),
+    ("name>coffee", "'>' only works with amount and date"),
+    ("amount~5", "'~' only works with text fields"),
+    ("category=food amount>5", "Expected 'and'"),
+    ("category=", "ends early"),
+    ("category==food", "Expected a value"),
+    ("limit ten", "'ten' is not a number of rows"),
+    ("sort amount limit 5 limit 6", "Unexpected 'limit'"),
+    ("name=\"unclosed", "Can't read the query"),
+])
+def test_errors_are_query_errors_with_a_reason(text, message):
+    with pytest.raises(queries.QueryError, match=message):
+        parse(text)
+
+
+def test_scope_narrows_dates_and_category():
+    query = parse("date>2024-01-31 and date<2024-03-01 and date>=2024-01-15 and category=Food")
+    assert queries.scope(query, storage.CLI_SCHEMA) == (date(2024, 2, 1), date(2024, 2, 29), "Food")
+
+
+def test_scope_stops_at_the_ends_of_the_calendar():
+    assert queries.scope(parse("date>9999-12-31"), storage.CLI_SCHEMA) == (date.max, None, None)
+    assert queries.scope(parse("date<0001-01-01"), storage.CLI_SCHEMA) == (None, date.min, None)
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite", "partitioned"])
+def test_run_at_the_ends_of_the_calendar(tmp_path, backend):
+    store = storage.open_store(str(tmp_path / "expenses.csv"), storage.CLI_SCHEMA, backend=backend)
+    store.insert_many([{"transaction_id": str(i), "name": "rent", "amount": "1", "date": day, "category": "home"}
+                       for i, day in enumerate(["0001-01-01", "2024-01-01", "9999-12-31"])])
+
+    def count(text):
+        return len(queries.run(parse(text), store))
+
+    assert [count("date>9999-12-31"), count("date>=9999-12-31"), count("date<0001-01-01"),
+            count("date<=0001-01-01"), count("date>2023-12-31 and date<2024-01-02")] == [0, 1, 0, 1, 1]
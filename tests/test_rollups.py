@@ -0,0 +1,92 @@
+"""Rollups kept up to date by inserts and modifies (see rollups.py)"""
+import random
+
+import pytest
+
+import storage
+from rollups import Rollups
+
+BACKENDS = ["csv", "sqlite", "partitioned"]
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path):
+    store = storage.open_store(str(tmp_path / "expenses.csv"), storage.APP_SCHEMA, backend=request.param)
+    store.insert_many([{"ID": i, "Name": f"row {i}", "Amount": amount, "Date": "2024-01-05", "Category": "Food"}
+                       for i, amount in enumerate([5.0, 12.5, 7.25, 12.5, 30.0], start=1)])
+    store.current_rollups()
+    return store
+
+
+def edit(store, key, **changes):
+    old = store.get(key)
+    store.update({**old, **changes}, old=old)
+
+
+def rollups_of(store):
+    return Rollups.load(store.rollups_path())
+
+
+def test_rename_keeps_the_rollups_exact(store):
+    before = rollups_of(store).buckets
+    edit(store, 1, Name="renamed")
+    edit(store, 5, Name="renamed")
+    rollups = rollups_of(store)
+    assert rollups.is_current(store.version())
+    assert rollups.buckets == before
+
+
+def test_moving_an_extreme_outwards_keeps_the_rollups_exact(store):
+    edit(store, 5, Amount=45.0)
+    edit(store, 1, Amount=1.0)
+    rollups = rollups_of(store)
+    assert rollups.is_current(store.version())
+    assert rollups.buckets["day"]["2024-01-05"] == [100 + 1250 + 725 + 1250 + 4500, 5, 100, 4500]
+
+
+def test_an_extreme_shared_by_another_row_stays_known(store):
+    edit(store, 2, Amount=20.0, Category="Fun")
+    edit(store, 4, Amount=12.5, Date="2024-01-06")
+    rollups = rollups_of(store)
+    assert rollups.is_current(store.version())
+    assert rollups.buckets["category"]["Food"] == [500 + 725 + 1250 + 3000, 4, 500, 3000]
+    assert rollups.buckets["day"]["2024-01-06"] == [1250, 1, 1250, 1250]
+
+
+def test_a_lost_extreme_forces_a_rebuild(store):
+    edit(store, 5, Amount=10.0)
+    assert not rollups_of(store).exact
+    assert store.totals_by("day") == [("2024-01-05", 47.25, 5, 5.0, 12.5)]
+
+
+def test_one_row_left_is_the_bucket(store):
+    rollups = rollups_of(store)
+    # The minimum goes last, when only the maximum is left
+    for amount in [12.5, 7.25, 12.5, 5.0]:
+        rollups.add(amount, "2024-01-05", "Food", sign=-1)
+    assert rollups.exact
+    assert rollups.buckets["week"]["2024-W01"] == [3000, 1, 3000, 3000]
+
+
+def test_incremental_rollups_match_a_rebuild(store):
+    generator = random.Random(5)
+    for _ in range(40):
+        key = generator.randint(1, 5)
+        changes = generator.choice([{"Name": "x"}, {"Amount": generator.choice([5.0, 7.25, 12.5, 30.0, 99.0])},
+                                    {"Date": generator.choice(["2024-01-05", "2024-02-29", "3/2/2024"])},
+                                    {"Category": generator.choice(["Food", "Fun"])}])
+        edit(store, key, **changes)
+        rollups = rollups_of(store)
+        if rollups.exact:
+            assert rollups.buckets == store.rebuild_rollups().buckets
+        else:
+            store.current_rollups()
+
+
+def test_total_between_matches_a_filtered_summary(store):
+    store.insert_many([{"ID": 6, "Name": "late", "Amount": 40.0, "Date": "2024-03-01", "Category": "Fun"},
+                       {"ID": 7, "Name": "odd", "Amount": 2.0, "Date": "2024-1-9", "Category": "Fun"}])
+    edit(store, 2, Amount=15.0)
+    for start, end in [("2024-01-01", "2024-01-31"), ("2024-01-06", "2024-12-31"), ("2024-03-01", "2024-01-01"),
+                       ("2024-01-05", "2024-01-05"), ("0001-01-01", "9999-12-31")]:
+        assert store.total_between(start, end) == pytest.approx(store.summary(start, end)["total"])
@@ -0,0 +1,39 @@
+"""Amount histograms and the month/category buckets (see sketches)"""
+import random
+
+import pytest
+
+import sketches
+
+
+def histogram(cents):
+    bins = {}
+    for value in cents:
+        key = str(sketches.bin_of(value))
+        bins[key] = bins.get(key, 0) + 1
+    return bins
+
+
+def test_quantiles_use_nearest_rank():
+    # Ranks ceil(0.5 * 4) = 2 and ceil(0.9 * 4) = 4: the median of four is the second amount
+    values = sketches.quantiles(histogram([100, 1000, 10000, 100000]), (0, 0.5, 0.9, 1))
+    assert values == pytest.approx([100, 1000, 100000, 100000], rel=sketches.ACCURACY)
+    assert sketches.quantiles(histogram([500]), (0.5, 0.99)) == pytest.approx([500, 500], rel=sketches.ACCURACY)
+    assert sketches.quantiles({}) == [None, None, None]
+
+
+def test_quantiles_within_accuracy():
+    generator = random.Random(7)
+    cents = sorted(generator.randint(1, 10 ** 7) for _ in range(10000))
+    for fraction, value in zip(sketches.QUANTILES, sketches.quantiles(histogram(cents))):
+        assert value == pytest.approx(cents[max(round(fraction * len(cents)), 1) - 1], rel=sketches.ACCURACY)
+
+
+def test_update_keeps_odd_dates_out_of_months(tmp_path):
+    sketch = sketches.Sketches(tmp_path / "sketches.json")
+    sketch.update(added=[(12.5, "2024-03-02", "food", "cafe"), (3.0, "3/2/2024", "food", "")])
+    assert sketch.buckets["month"].keys() == {"2024-03"}
+    assert sketch.buckets["category"]["food"]["count"] == 2
+    sketch.update(removed=[(3.0, "3/2/2024", "food", "")])
+    assert sketch.buckets["category"]["food"]["count"] == 1
+    assert sketch.buckets["month"]["2024-03"]["count"] == 1
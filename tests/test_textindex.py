@@ -0,0 +1,90 @@
+"""Trigram search kept current by writes and compaction (see textindex.py)"""
+import pytest
+
+import storage
+import textindex
+
+BACKENDS = ["csv", "sqlite", "partitioned"]
+
+NAMES = ["Coffee beans", "coffee shop", "Taxi home", "Groceries", "Café au lait", "Bus ticket", "Cinema"]
+QUERIES = ["coffee", "COF", "ee", "taxi", "café", "ticket", "x", "", "nothing like it"]
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path):
+    store = storage.open_store(str(tmp_path / "expenses.csv"), storage.APP_SCHEMA, backend=request.param)
+    store.insert_many([{"ID": i, "Name": name, "Amount": 1.0 + i, "Date": f"2024-01-{i:02d}", "Category": "Other"}
+                       for i, name in enumerate(NAMES, start=1)])
+    # Build the index, so the writes below land in its delta
+    store.search("coffee")
+    return store
+
+
+def expected(store, query):
+    return sorted(str(row["ID"]) for row in store.iter_rows() if query.lower() in str(row["Name"]).lower())
+
+
+def check(store):
+    for query in QUERIES:
+        assert sorted(store.search(query)) == expected(store, query), query
+
+
+def index_of(store):
+    return textindex.TextIndex.load(store.text_index_path())
+
+
+def test_search_matches_a_scan_of_the_rows(store):
+    check(store)
+
+
+def test_writes_go_to_the_delta(store):
+    store.insert({"Name": "Iced coffee", "Amount": 4.0, "Date": "2024-02-01", "Category": "Food"})
+    old = store.get(1)
+    store.update({**old, "Name": "Tea leaves"}, old=old)
+    old = store.get(3)
+    store.update({**old, "Name": "Taxi to the airport"}, old=old)
+    index = index_of(store)
+    assert index.is_current(store.version())
+    assert set(index.delta) == {"1", "3", str(len(NAMES) + 1)}
+    check(store)
+    # The built copy of a rewritten row no longer matches its old text
+    assert "1" not in store.search("beans")
+
+
+def test_a_row_rewritten_twice_keeps_its_last_text(store):
+    for name in ["Coffee again", "Plain water"]:
+        old = store.get(2)
+        store.update({**old, "Name": name}, old=old)
+    assert store.search("coffee") == ["1"]
+    assert store.search("water") == ["2"]
+
+
+def test_compaction_carries_the_index_over(store):
+    store.insert({"Name": "Coffee to go", "Amount": 3.0, "Date": "2024-02-02", "Category": "Food"})
+    old = store.get(5)
+    store.update({**old, "Name": "Hot chocolate"}, old=old)
+    store.compact()
+    index = index_of(store)
+    assert index.is_current(store.version())
+    # Carried over rather than rebuilt: the delta is still there
+    assert set(index.delta) == {"5", str(len(NAMES) + 1)}
+    check(store)
+
+
+def test_a_large_delta_is_folded_into_a_rebuild(store, monkeypatch):
+    monkeypatch.setattr(textindex, "DELTA_LIMIT", 2)
+    for i in range(3):
+        store.insert({"Name": f"Coffee refill {i}", "Amount": 2.0, "Date": "2024-03-01", "Category": "Food"})
+    assert index_of(store).needs_rebuild()
+    check(store)
+    index = index_of(store)
+    assert index.delta == {}
+    assert len(index) == len(NAMES) + 3
+
+
+def test_fuzzy_search_ranks_the_closest_rows_first(store):
+    store.insert({"Name": "Cofee beens", "Amount": 2.0, "Date": "2024-03-01", "Category": "Food"})
+    matches = store.search("coffee beans", fuzzy=True, limit=3)
+    assert matches[0] == "1"
+    # "coffee shop" shares as many trigrams, and ties stay in row order
+    assert matches[1:] == ["2", str(len(NAMES) + 1)]
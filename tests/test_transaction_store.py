@@ -0,0 +1,154 @@
+"""Date index and inverted field indexes kept up by appends and refreshes (see transaction_store.py)"""
+import random
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+from transaction_store import INDEXED_FIELDS, TransactionStore, normalize, parse_day
+
+
+class Expense:
+    __slots__ = ("transaction_id", "name", "amount", "date", "category")
+
+    def __init__(self, name, amount, date, category, transaction_id=None):
+        self.transaction_id = transaction_id or str(uuid.uuid4())
+        self.name = name
+        self.amount = amount
+        self.date = date
+        self.category = category
+
+
+class Grocery(Expense):
+    __slots__ = ("storeName", "itemCategory")
+
+    def __init__(self, *args, storeName=None, itemCategory=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.storeName = storeName
+        self.itemCategory = itemCategory
+
+
+class Meal(Expense):
+    __slots__ = ("mealType",)
+
+    def __init__(self, *args, mealType=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mealType = mealType
+
+
+CATEGORIES = ["Food", "Rent", "Fun", "Travel"]
+STORES = ["Aldi", "Corner Shop", "Market", " "]
+MEALS = ["Lunch", "Dinner", "Breakfast"]
+
+
+def random_transaction(rng, transaction_id=None):
+    day = date(2024, 1, 1) + timedelta(days=rng.randrange(120))
+    # A few hand-edited dates that aren't in the date index
+    row_date = "someday" if rng.random() < 0.03 else day.isoformat()
+    args = (f"item {rng.randrange(1000)}", rng.randrange(1, 10 ** 6) / 100, row_date, rng.choice(CATEGORIES))
+    kind = rng.randrange(3)
+    if kind == 0:
+        return Expense(*args, transaction_id=transaction_id)
+    if kind == 1:
+        return Grocery(*args, transaction_id=transaction_id, storeName=rng.choice(STORES), itemCategory="Produce")
+    return Meal(*args, transaction_id=transaction_id, mealType=rng.choice(MEALS))
+
+
+def ids(transactions):
+    return [t.transaction_id for t in transactions]
+
+
+def check(store, rows):
+    assert len(store) == len(rows)
+    assert ids(store) == ids(rows)
+    for field in INDEXED_FIELDS:
+        values = {str(getattr(t, field, None)).strip() for t in rows
+                  if getattr(t, field, None) is not None and str(getattr(t, field)).strip()}
+        assert store.values(field) == sorted(values)
+        for value in values:
+            expected = [t for t in rows if normalize(getattr(t, field, None)) == normalize(value)]
+            assert ids(store.where(field, value.upper())) == ids(expected)
+    for day in {t.date for t in rows if parse_day(t.date) is not None}:
+        assert ids(store.on_date(day)) == ids(t for t in rows if t.date == day)
+    days, positions = store._date_index()
+    assert list(days) == sorted(days)
+    assert sorted(positions) == [i for i, t in enumerate(rows) if parse_day(t.date) is not None]
+    # Dates that don't parse are in no day
+    assert store.on_date("someday") == []
+
+
+def in_range(t, start, end):
+    day = parse_day(t.date)
+    return day is not None and parse_day(start) <= day <= parse_day(end)
+
+
+def check_queries(store, rows, rng):
+    start = (date(2024, 1, 1) + timedelta(days=rng.randrange(60))).isoformat()
+    end = (date.fromisoformat(start) + timedelta(days=rng.randrange(60))).isoformat()
+    category = rng.choice(CATEGORIES)
+    by_amount = sorted(rows, key=lambda t: t.amount, reverse=True)
+    assert ids(store.top_k(5)) == ids(by_amount[:5])
+    assert ids(store.top_k(5, start=start, end=end)) == ids([t for t in by_amount if in_range(t, start, end)][:5])
+    assert ids(store.top_k(5, largest=False, category=category, start=start, end=end)) == ids(
+        [t for t in reversed(by_amount) if t.category == category and in_range(t, start, end)][:5])
+    assert ids(store.above(5000, start=start, end=end)) == ids(
+        [t for t in by_amount if t.amount > 5000 and in_range(t, start, end)])
+    assert ids(store.below(100, category=category)) == ids(
+        [t for t in reversed(by_amount) if t.amount < 100 and t.category == category])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_indexes_match_a_scan_after_appends_and_refreshes(seed):
+    rng = random.Random(seed)
+    rows = [random_transaction(rng) for _ in range(300)]
+    store = TransactionStore(rows)
+    check(store, rows)
+    for step in range(400):
+        if rng.random() < 0.3:
+            t = random_transaction(rng)
+            rows.append(t)
+            store.append(t)
+        else:
+            # Rewrite a row with new values, sometimes as another kind of transaction
+            position = rng.randrange(len(rows))
+            t = random_transaction(rng, transaction_id=rows[position].transaction_id)
+            rows[position] = t
+            store.refresh(position, t)
+        if step % 50 == 0:
+            check(store, rows)
+            check_queries(store, rows, rng)
+    check(store, rows)
+    check_queries(store, rows, rng)
+    assert all(store.position_of(t.transaction_id) == i for i, t in enumerate(rows))
+
+
+def test_a_refresh_takes_the_old_values_out_of_the_indexes():
+    rows = [Grocery("milk", 2.5, "2024-01-05", "Food", storeName="Aldi"),
+            Meal("soup", 6.0, "2024-01-07", "Food", mealType="Lunch")]
+    store = TransactionStore(rows)
+    t = store[0]
+    t.storeName = "Market"
+    t.category = "Groceries"
+    t.date = "2024-01-09"
+    store.refresh(0, t)
+    assert store.values("storeName") == ["Market"]
+    assert store.where("storeName", "aldi") == []
+    assert store.values("category") == ["Food", "Groceries"]
+    assert store.on_date("2024-01-05") == []
+    assert ids(store.on_date("2024-01-09")) == [rows[0].transaction_id]
+    # Clearing a value drops the row from that index altogether
+    t = store[1]
+    t.mealType = None
+    store.refresh(1, t)
+    assert store.values("mealType") == []
+
+
+def test_out_of_order_appends_keep_the_date_index_sorted():
+    store = TransactionStore()
+    for day in ["2024-03-01", "2024-03-05", "2024-01-01", "someday", "2024-03-05"]:
+        store.append(Expense("x", 1.0, day, "Food"))
+    days, positions = store._date_index()
+    assert [date.fromordinal(day).isoformat() for day in days] == [
+        "2024-01-01", "2024-03-01", "2024-03-05", "2024-03-05"]
+    assert list(positions) == [2, 0, 1, 4]
+    assert [t.date for t in store.on_date("2024-03-05")] == ["2024-03-05", "2024-03-05"]
@@ -0,0 +1,285 @@
+"""Trigram index for substring and fuzzy search over the expense text fields.
+
+Each row's text fields (the name, plus the store name and the other free
+text columns of the command-line layout) are lowercased and joined into
+one document. The index lives in "<name>.<table>.trigrams/" next to the
+data and holds the posting list of every three-byte sequence (trigram) of
+the UTF-8 documents:
+
+    grams.npy     int32    the distinct trigrams, sorted
+    starts.npy    int64    where each trigram's posting list starts in postings
+    postings.npy  int32    row numbers containing each trigram, ascending
+    keys.npy      S<n>     the key of each row number
+    text.bin      bytes    the documents, each ending with RECORD_END
+    ends.npy      int64    where each document ends in text.bin
+    delta.jsonl            [key, document] of rows written since the build
+    meta.json              the store version the index matches
+
+A query's trigrams narrow the search to the rows containing all of them,
+and only those documents are checked for the whole query. Writes append
+their rows to delta.jsonl (a newer copy of a key overrides the built one),
+so the index stays current without a rebuild; the next search after the
+delta passes DELTA_LIMIT rows rebuilds it, as does any change the store
+couldn't describe (a full rewrite, or another program editing the files).
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from rollups import _jsonable
+
+# Control characters between fields and after each document, so no trigram spans two of them
+FIELD_SEP = "\x1f"
+RECORD_END = "\x1e"
+
+# Delta rows after which the next search rebuilds the index
+DELTA_LIMIT = 50_000
+
+# Fuzzy matches must share at least this fraction of the query's trigrams
+SIMILARITY = 0.5
+
+
+def clean(text):
+    """Lowercase text and blank out RECORD_END, as documents and queries are stored
+
+    A stray FIELD_SEP can stay: no query contains one, so it only splits a
+    field in two where nothing could match across it anyway.
+    """
+    return str(text).lower().replace(RECORD_END, " ")
+
+
+def document(row, fields):
+    """Return the searchable document of a row dict"""
+    return clean(FIELD_SEP.join("" if row.get(field) is None else str(row[field]) for field in fields))
+
+
+def documents(frame, fields):
+    """Return the searchable documents of a DataFrame's rows as a list"""
+    frame = frame.reindex(columns=fields)
+    columns = [frame[field].fillna("").astype(str).tolist() for field in fields]
+    # Joining in Python is several times faster than Series.str.cat here
+    return [clean(FIELD_SEP.join(values)) for values in zip(*columns)]
+
+
+def grams_of(data):
+    """Return the trigram codes of a uint8 array, and a mask of those not crossing a separator"""
+    data = data.astype(np.int32)
+    codes = (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+    separator = (data == ord(FIELD_SEP)) | (data == ord(RECORD_END))
+    return codes, ~(separator[:-2] | separator[1:-1] | separator[2:])
+
+
+def query_grams(query):
+    """Return the distinct trigram codes of a cleaned query"""
+    data = np.frombuffer(query.encode("utf-8"), dtype=np.uint8)
+    if len(data) < 3:
+        return np.array([], dtype=np.int32)
+    codes, valid = grams_of(data)
+    return np.unique(codes[valid])
+
+
+def build(directory, keys, docs, version):
+    """Index the documents of the given keys (in row order) and return the TextIndex"""
+    text = "".join(doc + RECORD_END for doc in docs).encode("utf-8")
+    data = np.frombuffer(text, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord(RECORD_END)).astype(np.int64)
+    if len(data) >= 3:
+        codes, valid = grams_of(data)
+        # Row number of every trigram, from the document its first byte falls in
+        rows = np.repeat(np.arange(len(ends), dtype=np.int64), np.diff(ends, prepend=-1))[:len(codes)]
+        # np.sort and a diff are much faster than np.unique on arrays this size
+        pairs = np.sort((codes[valid].astype(np.int64) << 32) | rows[valid])
+        pairs = pairs[np.append(True, pairs[1:] != pairs[:-1])] if len(pairs) else pairs
+    else:
+        pairs = np.array([], dtype=np.int64)
+    codes = pairs >> 32
+    first = np.flatnonzero(np.append(True, codes[1:] != codes[:-1])) if len(codes) else np.array([], np.int64)
+    grams = codes[first]
+
+    tmp_dir = f"{directory}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "grams.npy"), grams.astype(np.int32))
+    np.save(os.path.join(tmp_dir, "starts.npy"), np.append(first, len(pairs)).astype(np.int64))
+    np.save(os.path.join(tmp_dir, "postings.npy"), (pairs & 0xFFFFFFFF).astype(np.int32))
+    encoded = [str(key).encode("utf-8") for key in keys]
+    np.save(os.path.join(tmp_dir, "keys.npy"), np.array(encoded, dtype=bytes) if encoded else np.array([], dtype="S1"))
+    np.save(os.path.join(tmp_dir, "ends.npy"), ends)
+    with open(os.path.join(tmp_dir, "text.bin"), "wb") as file:
+        file.write(text)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as file:
+        json.dump({"rows": len(encoded), "version": _jsonable(version)}, file)
+
+    # Swap the new index in; readers holding the old memmaps keep working
+    old_dir = f"{directory}.{os.getpid()}.old"
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return TextIndex(directory)
+
+
+class TextIndex:
+    """Memory-mapped trigram index plus the delta of rows written since it was built"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as file:
+            self.meta = json.load(file)
+        self.grams = np.load(os.path.join(directory, "grams.npy"), mmap_mode="r")
+        self.starts = np.load(os.path.join(directory, "starts.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(directory, "postings.npy"), mmap_mode="r")
+        self.keys = np.load(os.path.join(directory, "keys.npy"), mmap_mode="r")
+        self.ends = np.load(os.path.join(directory, "ends.npy"), mmap_mode="r")
+        size = os.path.getsize(os.path.join(directory, "text.bin"))
+        self.text = (np.memmap(os.path.join(directory, "text.bin"), dtype=np.uint8, mode="r")
+                     if size else np.array([], dtype=np.uint8))
+        self._delta = None
+
+    @classmethod
+    def load(cls, directory):
+        """Open the index in directory, or return None if there is no readable one"""
+        try:
+            return cls(directory)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def delta(self):
+        """{key: document} of the rows written since the build, the last copy of each key winning"""
+        if self._delta is None:
+            self._delta = self._read_delta()
+        return self._delta
+
+    def _read_delta(self):
+        delta = {}
+        try:
+            with open(os.path.join(self.directory, "delta.jsonl"), encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        key, doc = json.loads(line)
+                        delta[key] = doc
+        except FileNotFoundError:
+            pass
+        return delta
+
+    def is_current(self, version):
+        """Return True if the index (with its delta) matches the given store version"""
+        return self.meta["version"] == _jsonable(version)
+
+    def needs_rebuild(self):
+        """Return True once the delta is large enough to fold into a rebuild"""
+        return len(self.delta) > DELTA_LIMIT
+
+    def add(self, keys, docs, version):
+        """Record written rows in the delta and stamp the store version they bring the index to"""
+        # Writers only append, so the delta isn't read here
+        lines = [json.dumps([str(key), doc]) + "\n" for key, doc in zip(keys, docs)]
+        if self._delta is not None:
+            self._delta.update((str(key), doc) for key, doc in zip(keys, docs))
+        with open(os.path.join(self.directory, "delta.jsonl"), "a", encoding="utf-8") as file:
+            file.writelines(lines)
+        self.stamp(version)
+
+    def stamp(self, version):
+        """Atomically record the store version the index now matches"""
+        self.meta["version"] = _jsonable(version)
+        path = os.path.join(self.directory, "meta.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.meta, file)
+        os.replace(tmp_path, path)
+
+    def _posting(self, gram):
+        """Return the ascending row numbers containing a trigram code"""
+        position = int(np.searchsorted(self.grams, gram))
+        if position == len(self.grams) or self.grams[position] != gram:
+            return np.array([], dtype=np.int32)
+        return self.postings[self.starts[position]:self.starts[position + 1]]
+
+    def _scan(self, wanted, rows=None):
+        """Return the row numbers (among rows, if given) whose documents contain the query bytes"""
+        wanted = np.frombuffer(wanted, dtype=np.uint8)
+        text, ends = self.text, self.ends
+        if rows is not None:
+            if not len(rows):
+                return np.array([], dtype=np.int64)
+            # Gather just the candidate documents (with their RECORD_END) into one array
+            rows = np.asarray(rows, dtype=np.int64)
+            stops = np.asarray(self.ends)[rows] + 1
+            starts = np.where(rows > 0, np.asarray(self.ends)[rows - 1] + 1, 0)
+            lengths = stops - starts
+            ends = np.cumsum(lengths) - 1
+            text = text[np.repeat(starts - (ends + 1 - lengths), lengths) + np.arange(ends[-1] + 1)]
+        count = len(text) - len(wanted) + 1
+        if count <= 0:
+            return np.array([], dtype=np.int64)
+        hits = text[:count] == wanted[0]
+        for i in range(1, len(wanted)):
+            hits &= text[i:i + count] == wanted[i]
+        found = np.searchsorted(ends, np.flatnonzero(hits))
+        # The matches come out ascending, so dropping repeats needs no np.unique
+        found = found[np.append(True, found[1:] != found[:-1])] if len(found) else found
+        return found if rows is None else rows[found]
+
+    def _live(self, rows):
+        """Drop row numbers whose keys were rewritten in the delta"""
+        if not self.delta or not len(rows):
+            return rows
+        rewritten = np.array([key.encode("utf-8") for key in self.delta], dtype=bytes)
+        return rows[~np.isin(self.keys[rows], rewritten)]
+
+    def _decode(self, rows):
+        keys = self.keys[rows]
+        try:
+            # One cast instead of a decode() per key; numpy only casts ASCII this way
+            return keys.astype(str).tolist()
+        except UnicodeDecodeError:
+            return [key.decode("utf-8") for key in keys.tolist()]
+
+    def search(self, query):
+        """Return the keys of the rows whose text contains query (any case), built rows first"""
+        query = clean(query)
+        if not query:
+            return self._decode(self._live(np.arange(len(self)))) + list(self.delta)
+        wanted = query.encode("utf-8")
+        grams = query_grams(query)
+        if len(grams):
+            postings = sorted((self._posting(gram) for gram in grams), key=len)
+            rows = np.asarray(postings[0])
+            # Narrow the shortest posting list down with a binary search in each of the others
+            for posting in postings[1:]:
+                if not len(rows):
+                    break
+                found = np.minimum(np.searchsorted(posting, rows), len(posting) - 1)
+                rows = rows[posting[found] == rows] if len(posting) else rows[:0]
+            # Having every trigram doesn't mean having them in order, so check the documents
+            rows = self._scan(wanted, rows)
+        else:
+            rows = self._scan(wanted)
+        matches = self._decode(self._live(rows))
+        return matches + [key for key, doc in self.delta.items() if query in doc]
+
+    def similar(self, query, limit=20):
+        """Return the keys of up to limit rows sharing the most trigrams with query, best first"""
+        grams = query_grams(clean(query))
+        if not len(grams):
+            return []
+        needed = max(1, int(np.ceil(len(grams) * SIMILARITY)))
+        scores = np.bincount(np.concatenate([self._posting(gram) for gram in grams]).astype(np.int64),
+                             minlength=len(self))
+        rows = self._live(np.flatnonzero(scores >= needed))
+        ranked = [(int(scores[row]), key) for row, key in zip(rows.tolist(), self._decode(rows))]
+        gram_set = set(grams.tolist())
+        for key, doc in self.delta.items():
+            score = len(gram_set & set(query_grams(doc).tolist()))
+            if score >= needed:
+                ranked.append((score, key))
+        # Python's sort is stable, so equal scores stay in row order
+        ranked.sort(key=lambda pair: -pair[0])
+        return [key for score, key in ranked[:limit]]
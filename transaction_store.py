@@ -0,0 +1,403 @@
+"""In-memory transaction collection for the command-line app.
+
+TransactionStore behaves like the list of transactions main() used to keep
+(len, iteration, indexing, append) but stores the rows column by column
+instead of as one object per transaction:
+
+* IDs as 16-byte binary UUIDs in one bytearray
+* amounts as int64 cents, dates as int32 day ordinals (array module)
+* names as UTF-8 in one bytearray with start/length arrays
+* categories and transaction types as small integer codes into interned lists
+* subclass fields (meal type, store name, ...) as codes into per-field value lists
+
+A million rows take tens of MB this way. Indexing the store (store[i] or
+iteration) returns a short-lived Transaction object built from the columns,
+so modify(), display() and to_dict() work as before; call refresh(i, t)
+after modifying one to write it back.
+
+The store also maintains lookup indexes:
+
+* a date index: day ordinals sorted ascending and the row positions in that
+  order, so date lookups and ranges are binary searches.
+* inverted indexes on category and the subclass fields (store name, meal
+  type, clothing type): normalized value -> row positions, so listing and
+  filtering never scan the rows.
+
+Top-k / bottom-k and threshold queries narrow the candidates with those
+indexes first and then use heapq, so they cost O(n log k) at most.
+"""
+import heapq
+import sys
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date as date_type
+
+# Transaction attributes with an inverted index
+INDEXED_FIELDS = ("category", "storeName", "mealType", "clothingType")
+
+# Attributes every transaction has; anything else in __slots__ is a subclass field
+BASE_FIELDS = ("transaction_id", "name", "amount", "date", "category")
+
+NO_DAY = -1
+NO_UUID = bytes(16)
+
+
+def parse_day(value):
+    """Return the day ordinal of a YYYY-MM-DD string or date, or None if it isn't one"""
+    if isinstance(value, date_type):
+        return value.toordinal()
+    try:
+        return date_type.fromisoformat(str(value).strip()).toordinal()
+    except ValueError:
+        return None
+
+
+def to_cents(amount):
+    """Convert a dollar amount to integer cents"""
+    return int(round(float(amount) * 100))
+
+
+def normalize(value):
+    """Return the index key for a field value (case and surrounding space ignored)"""
+    return str(value).strip().lower()
+
+
+_extra_fields = {}
+
+
+def extra_fields(cls):
+    """Return the subclass fields a Transaction class declares in __slots__"""
+    fields = _extra_fields.get(cls)
+    if fields is None:
+        fields = []
+        for klass in reversed(cls.__mro__):
+            for name in getattr(klass, "__slots__", ()):
+                if not name.startswith("_") and name not in BASE_FIELDS and name not in fields:
+                    fields.append(name)
+        _extra_fields[cls] = fields
+    return fields
+
+
+class FieldIndex:
+    """Inverted index from a normalized field value to row positions"""
+
+    def __init__(self):
+        self._entries = {}  # key -> [label, sorted positions (array)]
+
+    def add(self, key, label, position):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [label, array("I", [position])]
+            return
+        positions = entry[1]
+        if not positions or position > positions[-1]:
+            positions.append(position)
+        else:
+            positions.insert(bisect_left(positions, position), position)
+
+    def remove(self, key, position):
+        entry = self._entries[key]
+        positions = entry[1]
+        positions.pop(bisect_left(positions, position))
+        if not positions:
+            del self._entries[key]
+
+    def labels(self):
+        """Return the distinct values (as first written), sorted"""
+        return sorted(entry[0] for entry in self._entries.values())
+
+    def positions(self, value):
+        """Return the row positions holding the value"""
+        entry = self._entries.get(normalize(value))
+        return entry[1] if entry else array("I")
+
+
+class TransactionStore:
+    """Columnar list of transactions with a sorted date index and inverted field indexes"""
+
+    def __init__(self, transactions=()):
+        # Columns, one entry per row
+        self._ids = bytearray()           # 16 bytes per row
+        self._odd_ids = {}                # position -> ID that isn't a UUID
+        self._cents = array("q")
+        self._days = array("i")           # day ordinal, NO_DAY if the date doesn't parse
+        self._odd_dates = {}              # position -> date text that isn't canonical YYYY-MM-DD
+        self._names = bytearray()
+        self._name_start = array("q")
+        self._name_len = array("I")
+        self._dead_names = 0              # bytes of _names no row points at any more
+        self._category_codes = array("i")
+        self._categories = []             # code -> interned category text
+        self._category_code = {}          # category text -> code
+        self._type_codes = array("B")
+        self._classes = []                # code -> Transaction class
+        self._extras = {}                 # field -> array of codes into _extra_values (0 = not set)
+        self._extra_values = {}           # field -> [None, value, ...]
+        self._extra_code = {}             # field -> {value: code}
+
+        self._fields = {field: FieldIndex() for field in INDEXED_FIELDS}
+        # Date index, sorted by day: ordinals and row positions
+        self._index_days = array("i")
+        self._index_rows = array("I")
+        self._index_dirty = False
+        for t in transactions:
+            self.append(t)
+
+    def __len__(self):
+        return len(self._cents)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._materialize(position)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("transaction index out of range")
+        return self._materialize(position)
+
+    # -- columns --------------------------------------------------------------
+
+    def _write(self, position, t):
+        """Store a transaction's fields in the columns at position (appending if it's the end)"""
+        appending = position == len(self)
+        try:
+            id_bytes = uuid.UUID(str(t.transaction_id)).bytes
+            self._odd_ids.pop(position, None)
+        except ValueError:
+            id_bytes = NO_UUID
+            self._odd_ids[position] = str(t.transaction_id)
+
+        day = parse_day(t.date)
+        if day is None or date_type.fromordinal(day).isoformat() != str(t.date):
+            self._odd_dates[position] = str(t.date)
+        else:
+            self._odd_dates.pop(position, None)
+
+        name = str(t.name).encode("utf-8")
+        category = str(t.category)
+        category_code = self._category_code.get(category)
+        if category_code is None:
+            category_code = self._category_code[category] = len(self._categories)
+            self._categories.append(sys.intern(category))
+        cls = type(t)
+        if cls not in self._classes:
+            self._classes.append(cls)
+        type_code = self._classes.index(cls)
+
+        if appending:
+            name_start = len(self._names)
+            self._names += name
+        else:
+            name_start = self._rewrite_name(position, name)
+        values = (to_cents(t.amount), NO_DAY if day is None else day, name_start, len(name),
+                  category_code, type_code)
+        columns = (self._cents, self._days, self._name_start, self._name_len,
+                   self._category_codes, self._type_codes)
+        if appending:
+            self._ids += id_bytes
+            for column, value in zip(columns, values):
+                column.append(value)
+        else:
+            self._ids[position * 16:(position + 1) * 16] = id_bytes
+            for column, value in zip(columns, values):
+                column[position] = value
+            if self._dead_names > len(self._names) // 2:
+                self._pack_names()
+
+        fields = extra_fields(cls)
+        for field in fields:
+            if field not in self._extras:
+                self._extras[field] = array("i", bytes(self._extras_size(appending)))
+                self._extra_values[field] = [None]
+                self._extra_code[field] = {}
+        for field, column in self._extras.items():
+            value = getattr(t, field, None) if field in fields else None
+            code = 0
+            if value is not None:
+                code = self._extra_code[field].get(value)
+                if code is None:
+                    code = self._extra_code[field][value] = len(self._extra_values[field])
+                    self._extra_values[field].append(sys.intern(value) if isinstance(value, str) else value)
+            if appending:
+                column.append(code)
+            else:
+                column[position] = code
+
+    def _rewrite_name(self, position, name):
+        """Store an edited row's name, reusing its old bytes when it fits, and return its start"""
+        start, length = self._name_start[position], self._name_len[position]
+        if start + length == len(self._names):
+            # The last name in the buffer (e.g. the row just added) is simply cut off
+            del self._names[start:]
+        elif len(name) <= length:
+            self._names[start:start + len(name)] = name
+            self._dead_names += length - len(name)
+            return start
+        else:
+            self._dead_names += length
+            start = len(self._names)
+        self._names += name
+        return start
+
+    def _pack_names(self):
+        """Rebuild the name buffer without the bytes that edits left behind"""
+        names = bytearray()
+        for position in range(len(self)):
+            start = self._name_start[position]
+            self._name_start[position] = len(names)
+            names += self._names[start:start + self._name_len[position]]
+        self._names = names
+        self._dead_names = 0
+
+    def _extras_size(self, appending):
+        """Return the byte size of a new, all-empty extra column for the rows already written"""
+        rows = len(self) - 1 if appending else len(self)
+        return rows * array("i").itemsize
+
+    def _value(self, position, field):
+        """Return one field of a row straight from the columns"""
+        if field == "category":
+            return self._categories[self._category_codes[position]]
+        column = self._extras.get(field)
+        return None if column is None else self._extra_values[field][column[position]]
+
+    def _date_text(self, position):
+        if position in self._odd_dates:
+            return self._odd_dates[position]
+        return date_type.fromordinal(self._days[position]).isoformat()
+
+    def _materialize(self, position):
+        """Build the Transaction object for a row"""
+        cls = self._classes[self._type_codes[position]]
+        t = cls.__new__(cls)
+        if position in self._odd_ids:
+            t.transaction_id = self._odd_ids[position]
+        else:
+            t.transaction_id = str(uuid.UUID(bytes=bytes(self._ids[position * 16:(position + 1) * 16])))
+        start = self._name_start[position]
+        t.name = self._names[start:start + self._name_len[position]].decode("utf-8")
+        t.amount = self._cents[position] / 100
+        t.date = self._date_text(position)
+        t.category = self._categories[self._category_codes[position]]
+        for field in extra_fields(cls):
+            setattr(t, field, self._value(position, field))
+        return t
+
+    # -- indexes --------------------------------------------------------------
+
+    def _index_fields(self, position, remove=False):
+        for field in INDEXED_FIELDS:
+            value = self._value(position, field)
+            if value is None or str(value).strip() == "":
+                continue
+            if remove:
+                self._fields[field].remove(normalize(value), position)
+            else:
+                self._fields[field].add(normalize(value), str(value).strip(), position)
+
+    def append(self, t):
+        """Add a transaction and index it"""
+        position = len(self)
+        self._write(position, t)
+        self._index_fields(position)
+        day = self._days[position]
+        if day == NO_DAY or self._index_dirty:
+            return
+        if not self._index_days or day >= self._index_days[-1]:
+            # New expenses are usually the latest ones, so this is the common case
+            self._index_days.append(day)
+            self._index_rows.append(position)
+        else:
+            self._index_dirty = True
+
+    def position_of(self, transaction_id):
+        """Return the row position of a transaction ID, or None if it isn't in the store"""
+        for position, odd in self._odd_ids.items():
+            if odd == str(transaction_id):
+                return position
+        try:
+            wanted = uuid.UUID(str(transaction_id)).bytes
+        except ValueError:
+            return None
+        # bytearray.find scans in C; a match must also start on a 16-byte boundary
+        found = self._ids.find(wanted)
+        while found != -1:
+            if found % 16 == 0:
+                return found // 16
+            found = self._ids.find(wanted, found + 1)
+        return None
+
+    def refresh(self, position, t):
+        """Write back a transaction modified in place and re-index it"""
+        self._index_fields(position, remove=True)
+        self._write(position, t)
+        self._index_fields(position)
+        self._index_dirty = True
+
+    def _date_index(self):
+        """Return the date index, rebuilding it if it went out of order"""
+        if self._index_dirty:
+            days = self._days
+            order = sorted((i for i in range(len(self)) if days[i] != NO_DAY), key=days.__getitem__)
+            self._index_days = array("i", (days[i] for i in order))
+            self._index_rows = array("I", order)
+            self._index_dirty = False
+        return self._index_days, self._index_rows
+
+    def values(self, field="category"):
+        """Return the distinct values of an indexed field, sorted"""
+        return self._fields[field].labels()
+
+    def where(self, field, value):
+        """Return the transactions whose field matches value (ignoring case)"""
+        return [self._materialize(i) for i in self._fields[field].positions(value)]
+
+    def on_date(self, value):
+        """Return the transactions on the given day"""
+        day = parse_day(value)
+        if day is None:
+            return []
+        days, rows = self._date_index()
+        lo, hi = bisect_left(days, day), bisect_right(days, day)
+        return [self._materialize(i) for i in sorted(rows[lo:hi])]
+
+    def _scope(self, category=None, start=None, end=None):
+        """Return the candidate row positions for optional category and date filters"""
+        if category:
+            positions = self._fields["category"].positions(category)
+            if start is None and end is None:
+                return positions
+            lo = parse_day(start) if start is not None else None
+            hi = parse_day(end) if end is not None else None
+            days = self._days
+            return [i for i in positions if days[i] != NO_DAY
+                    and (lo is None or days[i] >= lo) and (hi is None or days[i] <= hi)]
+        if start is not None or end is not None:
+            days, rows = self._date_index()
+            lo = bisect_left(days, parse_day(start)) if start is not None else 0
+            hi = bisect_right(days, parse_day(end)) if end is not None else len(days)
+            return rows[lo:hi]
+        return range(len(self))
+
+    def top_k(self, k=10, largest=True, category=None, start=None, end=None):
+        """Return the k largest (or smallest) transactions, optionally within a category and date range"""
+        positions = self._scope(category, start, end)
+        pick = heapq.nlargest if largest else heapq.nsmallest
+        return [self._materialize(i) for i in pick(k, positions, key=self._cents.__getitem__)]
+
+    def above(self, threshold, category=None, start=None, end=None):
+        """Return the transactions with an amount above threshold, largest first"""
+        limit, cents = to_cents(threshold), self._cents
+        positions = [i for i in self._scope(category, start, end) if cents[i] > limit]
+        positions.sort(key=cents.__getitem__, reverse=True)
+        return [self._materialize(i) for i in positions]
+
+    def below(self, threshold, category=None, start=None, end=None):
+        """Return the transactions with an amount below threshold, smallest first"""
+        limit, cents = to_cents(threshold), self._cents
+        positions = [i for i in self._scope(category, start, end) if cents[i] < limit]
+        positions.sort(key=cents.__getitem__)
+        return [self._materialize(i) for i in positions]
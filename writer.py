@@ -0,0 +1,118 @@
+"""Background persistence for the command-line app.
+
+BackgroundWriter takes inserts and updates from the prompt loop and writes
+them to a store on a worker thread, so the next prompt never waits on disk.
+After the first change arrives the worker waits a short window for more,
+then writes them together: inserts go out as one insert_many() call, and
+several changes to the same row collapse into the last one. wait() blocks
+until everything queued so far has been written; flush() also makes it
+durable with the store's sync().
+"""
+import queue
+import threading
+import time
+
+# Batch window in seconds: changes queued this close together share one write
+WINDOW = 0.05
+
+_FLUSH = object()
+
+
+class BackgroundWriter:
+    """Queue of pending inserts and updates, written to a store by one worker thread"""
+
+    def __init__(self, store, window=WINDOW):
+        self.store = store
+        self.window = window
+        self._queue = queue.Queue()
+        self._errors = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="expense-writer", daemon=True)
+        self._thread.start()
+
+    def insert(self, row):
+        """Queue a new row and return at once"""
+        self._put(("insert", dict(row), None))
+
+    def update(self, row, old=None):
+        """Queue a modified row (and its old version, for the rollups) and return at once"""
+        self._put(("update", dict(row), None if old is None else dict(old)))
+
+    def _put(self, item):
+        if self._closed:
+            raise RuntimeError("The writer has been closed")
+        self._queue.put(item)
+
+    def wait(self, durable=False):
+        """Block until everything queued so far is written; raise the first error since the last wait"""
+        done = threading.Event()
+        self._queue.put((_FLUSH, durable, done))
+        done.wait()
+        if self._errors:
+            errors, self._errors = self._errors, []
+            raise errors[0]
+
+    def flush(self):
+        """Block until everything queued so far is written and synced to disk"""
+        self.wait(durable=True)
+
+    def close(self):
+        """Flush and stop the worker; safe to call more than once"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.wait(durable=True)
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Give the prompt a moment to queue more changes, unless someone is waiting
+            deadline = time.monotonic() + self.window
+            while batch[-1] is not None and batch[-1][0] is not _FLUSH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            changes = [item for item in batch if item is not None and item[0] is not _FLUSH]
+            flushes = [item for item in batch if item is not None and item[0] is _FLUSH]
+            if changes:
+                self._guard(self._write, changes)
+            if any(durable for _, durable, _ in flushes):
+                self._guard(self.store.sync)
+            for _, _, done in flushes:
+                done.set()
+            if batch[-1] is None:
+                return
+
+    def _guard(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as error:
+            self._errors.append(error)
+
+    def _write(self, changes):
+        """Write one batch, keeping only the last change to each row"""
+        key = self.store.schema.key
+        pending = {}
+        for op, row, old in changes:
+            # Rows without a key yet (the store assigns one) can't be merged with anything
+            row_key = row.get(key) or object()
+            entry = pending.get(row_key)
+            if entry is None:
+                pending[row_key] = [op, row, old]
+            else:
+                # The first change's op and old row still describe what is on disk
+                entry[1] = row
+        inserts = [row for op, row, old in pending.values() if op == "insert"]
+        if inserts:
+            self.store.insert_many(inserts)
+        for op, row, old in pending.values():
+            if op == "update":
+                self.store.update(row, old=old)